@@ -0,0 +1,119 @@
+"""
+Concurrent dashboard requests: blocking Session inside `async def` against the AsyncSession path.
+
+Both paths run the `/hbh/get_hbh` week query for `--clients` concurrent coroutines on one event loop,
+while a heartbeat coroutine measures how long the loop is frozen (the lag every other client sees).
+
+Usage:
+    python -m benchmarks.bench_async_dal --clients 20 --days 365
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.data.dao.hbh_dao import HbhDAO
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema
+from core.db.database import Base
+from core.db.util import generate_16_uuid
+
+LINES = ['J01', 'J02', 'J03', 'J05', 'J06', 'J07', 'J08', 'J09']
+
+
+def seed(path: str, days: int) -> tuple[str, str]:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine, tables=[HourByHourSchema.__table__])
+    start = datetime(2024, 1, 1)
+    rows = [
+        {"id": generate_16_uuid(), "factory": "A6", "line": line,
+         "date": (start + timedelta(days=d)).strftime("%Y-%m-%d"), "hour": h,
+         "smt_in": 10, "smt_out": 10, "packing": 10}
+        for d in range(days) for line in LINES for h in range(24)
+    ]
+    with engine.begin() as conn:
+        conn.execute(HourByHourSchema.__table__.insert(), rows)
+    engine.dispose()
+    end = start + timedelta(days=days - 1)
+    return (end - timedelta(days=6)).strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+async def heartbeat(stop: asyncio.Event, lags: list, tick: float = 0.005):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append((time.perf_counter() - started - tick) * 1000)
+
+
+async def measure(clients: int, request) -> dict:
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0.02)
+
+    latencies = []
+
+    async def client():
+        started = time.perf_counter()
+        await request()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    wall = (time.perf_counter() - started) * 1000
+    stop.set()
+    await beat
+    return {
+        "wall_ms": wall,
+        "mean_latency_ms": sum(latencies) / len(latencies),
+        "max_loop_lag_ms": max(lags, default=0.0),
+    }
+
+
+async def main(clients: int, days: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        start_date, end_date = seed(path, days)
+
+        # Previous path: blocking Session.query awaited from an async def
+        sync_factory = sessionmaker(bind=create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}))
+
+        async def sync_request():
+            session = sync_factory()
+            try:
+                session.query(HourByHourSchema).filter(HourByHourSchema.date.between(start_date, end_date)).all()
+            finally:
+                session.close()
+
+        # New path: HbhDAO on an AsyncSession
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=AsyncAdaptedQueuePool,
+                                           pool_size=clients, max_overflow=0)
+        async_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+        async def async_request():
+            async with async_factory() as session:
+                await HbhDAO(None, async_session=session).fetch_get_all_record_by_date_range(start_date, end_date)
+
+        for name, request in (("sync session in async def", sync_request), ("AsyncSession (aiosqlite)", async_request)):
+            await request()  # warm up pool and page cache
+            result = await measure(clients, request)
+            print(f"{name}")
+            print(f"  clients={clients} wall={result['wall_ms']:.1f}ms "
+                  f"mean_latency={result['mean_latency_ms']:.1f}ms max_loop_lag={result['max_loop_lag_ms']:.1f}ms")
+
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sync vs async data access concurrency benchmark')
+    parser.add_argument('--clients', type=int, default=20, help='Concurrent requests')
+    parser.add_argument('--days', type=int, default=365, help='Days of hour_by_hour history to seed')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.clients, args.days))
@@ -0,0 +1,93 @@
+"""
+Login lookups during a backfill: auth tables in the main database against a separate auth database.
+
+A writer thread upserts `--days` of hour_by_hour rows in day-sized transactions (the shape of
+`update_hours_form_range_of_dates`) while the main thread repeats the `get_user` query of `/token`.
+
+Usage:
+    python -m benchmarks.bench_auth_split --days 120 --server none
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from core.data.dao.hbh_dao import HbhDAO
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema
+from core.data.schemas.user_schema import UserSchema
+from core.db.database import Base, is_auth_table
+from core.db.profile import DBProfile
+from core.security.auth import get_user
+from benchmarks.bench_hbh_upsert import make_rows
+
+
+def make_engine(path: str, profile: DBProfile):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        profile.apply(dbapi_connection)
+
+    return engine
+
+
+def run(name: str, main_engine, auth_engine, days: int):
+    main_tables = [t for t in Base.metadata.sorted_tables if t is HourByHourSchema.__table__]
+    auth_tables = [t for t in Base.metadata.sorted_tables if is_auth_table(t)]
+    Base.metadata.create_all(main_engine, tables=main_tables)
+    Base.metadata.create_all(auth_engine, tables=auth_tables)
+
+    auth_factory = sessionmaker(bind=auth_engine)
+    with auth_factory() as session:
+        session.add(UserSchema(username="iradi", hashed_password="x"))
+        session.commit()
+
+    rows = make_rows(days)
+    per_day = len(rows) // days
+    done = threading.Event()
+
+    def backfill():
+        factory = sessionmaker(bind=main_engine)
+        for offset in range(0, len(rows), per_day):
+            with factory() as session:
+                HbhDAO(session).query_upsert_hours(rows[offset:offset + per_day])
+                session.commit()
+        done.set()
+
+    latencies = []
+    writer = threading.Thread(target=backfill)
+    writer.start()
+    while not done.is_set():
+        started = time.perf_counter()
+        with auth_factory() as session:
+            get_user(session, "iradi")
+        latencies.append((time.perf_counter() - started) * 1000)
+    writer.join()
+
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{name}: lookups={len(latencies)} p50={statistics.median(latencies):.2f}ms "
+          f"p95={p95:.2f}ms max={max(latencies):.1f}ms")
+
+
+def main(days: int, server: str):
+    profile = DBProfile.from_config(server=server)
+    print(profile)
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = make_engine(os.path.join(tmp, "shared.db"), profile)
+        run("shared file", shared, shared, days)
+        run("separate auth file", make_engine(os.path.join(tmp, "main.db"), profile),
+            make_engine(os.path.join(tmp, "auth.db"), profile), days)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Auth lookup latency during a backfill')
+    parser.add_argument('--days', type=int, default=120, help='Days of hour_by_hour rows to backfill')
+    parser.add_argument('--server', type=str, default='production', help='DB profile section (db_<server>)')
+    args = parser.parse_args()
+
+    main(args.days, args.server)
@@ -0,0 +1,127 @@
+"""
+Concurrent small writes: one session + commit per write against the DBWriter group commit.
+
+`--writers` threads each perform `--writes` single line-hour upserts (the shape of API writes and
+of `update_currently_hour`), while `--readers` threads run the week query on read-only connections.
+Reports write throughput, commits issued, "database is locked" failures and reader latency.
+
+Usage:
+    python -m benchmarks.bench_group_commit --writers 16 --writes 100 --readers 4 --server production
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from core.data.dao.hbh_dao import HbhDAO
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema
+from core.db.database import Base
+from core.db.profile import DBProfile
+from core.db.writer import DBWriter
+
+LINES = ['J01', 'J02', 'J03', 'J05', 'J06', 'J07', 'J08', 'J09']
+
+
+def make_engine(url: str, profile: DBProfile, read_only: bool = False):
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        profile.apply(dbapi_connection, read_only=read_only)
+
+    return engine
+
+
+def row(writer: int, index: int) -> dict:
+    return {"factory": "A6", "line": LINES[writer % len(LINES)], "date": f"2024-{1 + writer // 8:02d}-01",
+            "hour": index % 24, "smt_in": index, "smt_out": index, "packing": index}
+
+
+def run(name: str, url: str, profile: DBProfile, write, writers: int, writes: int, readers: int):
+    read_factory = sessionmaker(bind=make_engine(url, profile, read_only=True))
+    stop = threading.Event()
+    read_latencies = []
+    failures = []
+
+    def reader():
+        while not stop.is_set():
+            session = read_factory()
+            started = time.perf_counter()
+            session.query(HourByHourSchema).filter(HourByHourSchema.date.between('2024-01-01', '2024-12-31')).all()
+            read_latencies.append((time.perf_counter() - started) * 1000)
+            session.close()
+
+    def writer(number: int):
+        for index in range(writes):
+            try:
+                write(row(number, index))
+            except OperationalError as e:
+                failures.append(e)
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in reader_threads:
+        thread.start()
+    started = time.perf_counter()
+    writer_threads = [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+
+    total = writers * writes
+    p95 = statistics.quantiles(read_latencies, n=20)[-1] if len(read_latencies) > 1 else 0.0
+    print(name)
+    print(f"  {total} writes in {elapsed:.2f}s ({total / elapsed:,.0f} writes/s), locked failures={len(failures)}")
+    print(f"  reads={len(read_latencies)} p95={p95:.1f}ms max={max(read_latencies, default=0):.1f}ms")
+
+
+def main(writers: int, writes: int, readers: int, server: str):
+    profile = DBProfile.from_config(server=server)
+    print(profile)
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = make_engine(url, profile)
+        Base.metadata.create_all(engine, tables=[HourByHourSchema.__table__])
+        factory = sessionmaker(bind=engine)
+
+        def direct_write(values: dict):
+            session = factory()
+            try:
+                HbhDAO(session).query_upsert_hours([values])
+                session.commit()
+            finally:
+                session.close()
+
+        run("session + commit per write", url, profile, direct_write, writers, writes, readers)
+
+        # Standalone writer on the benchmark database (the DBWriter() singleton targets sky_db.db)
+        db_writer = object.__new__(DBWriter)
+        db_writer._initialize(url=url, profile=profile)
+
+        def queued_write(values: dict):
+            db_writer.execute(lambda session: HbhDAO(session).query_upsert_hours([values]))
+
+        run("DBWriter group commit", url, profile, queued_write, writers, writes, readers)
+        print(f"  writer: {db_writer.stats()}")
+        db_writer.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Group commit benchmark')
+    parser.add_argument('--writers', type=int, default=16, help='Concurrent writer threads')
+    parser.add_argument('--writes', type=int, default=100, help='Writes per writer thread')
+    parser.add_argument('--readers', type=int, default=4, help='Concurrent reader threads')
+    parser.add_argument('--server', type=str, default='production', help='DB profile section (db_<server>)')
+    args = parser.parse_args()
+
+    main(args.writers, args.writes, args.readers, args.server)
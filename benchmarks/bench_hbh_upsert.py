@@ -0,0 +1,84 @@
+"""
+Year-long hour_by_hour backfill: per-record SELECT + add/mutate against the bulk ON CONFLICT upsert.
+
+The legacy path is the previous `HbhDAO.query_update_hours` loop (without its per-record prints).
+Each path runs twice on a fresh database: the first pass inserts every line-hour, the second pass
+changes a third of the counters so it exercises the update and unchanged branches.
+
+Usage:
+    python -m benchmarks.bench_hbh_upsert --days 365
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from core.data.dao.hbh_dao import HbhDAO
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema
+from core.db.database import Base
+
+LINES = ['J01', 'J02', 'J03', 'J05', 'J06', 'J07', 'J08', 'J09']
+
+
+def make_rows(days: int, shift: int = 0) -> list[dict]:
+    start = datetime(2024, 1, 1)
+    return [
+        {"factory": "A6", "line": line, "date": (start + timedelta(days=d)).strftime("%Y-%m-%d"), "hour": h,
+         "smt_in": 10 + (shift if h % 3 == 0 else 0), "smt_out": 10, "packing": 10}
+        for d in range(days) for line in LINES for h in range(24)
+    ]
+
+
+def legacy_update_hours(session, rows: list[dict]):
+    for row in rows:
+        last_hour = session.query(HourByHourSchema).filter(HourByHourSchema.date == row["date"]).filter(
+            HourByHourSchema.hour == row["hour"]).filter(HourByHourSchema.line == row["line"]).first()
+        if last_hour is not None:
+            last_hour.smt_in = row["smt_in"]
+            last_hour.smt_out = row["smt_out"]
+            last_hour.packing = row["packing"]
+        else:
+            session.add(HourByHourSchema(**row))
+    session.commit()
+
+
+def bulk_update_hours(session, rows: list[dict]):
+    result = HbhDAO(session).query_upsert_hours(rows)
+    session.commit()
+    return result
+
+
+def run(name: str, update, days: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine, tables=[HourByHourSchema.__table__])
+        factory = sessionmaker(bind=engine)
+
+        print(name)
+        for label, rows in (("insert pass", make_rows(days)), ("update pass", make_rows(days, shift=1))):
+            session = factory()
+            started = time.perf_counter()
+            result = update(session, rows)
+            elapsed = time.perf_counter() - started
+            session.close()
+            counts = f" {result}" if result is not None else ""
+            print(f"  {label}: {len(rows)} rows in {elapsed:.2f}s ({len(rows) / elapsed:,.0f} rows/s){counts}")
+
+        with engine.connect() as conn:
+            print(f"  rows stored: {conn.execute(select(func.count()).select_from(HourByHourSchema)).scalar()}")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='hour_by_hour bulk upsert benchmark')
+    parser.add_argument('--days', type=int, default=365, help='Days of line-hours to backfill')
+    parser.add_argument('--skip-legacy', action='store_true', help='Only run the bulk upsert')
+    args = parser.parse_args()
+
+    if not args.skip_legacy:
+        run("legacy: SELECT per record + ORM add/mutate", legacy_update_hours, args.days)
+    run("bulk: INSERT ... ON CONFLICT DO UPDATE (executemany)", bulk_update_hours, args.days)
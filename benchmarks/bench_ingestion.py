@@ -0,0 +1,156 @@
+"""
+End-to-end ingestion throughput against benchmarks/fake_upstream.py, on a throwaway database.
+
+Scenarios:
+- mes backfill: HbhService.backfill_range_of_dates over `--days` days (three MES requests per day)
+- mes polls: `--polls` calls of HbhService.update_currently_hour (change-only writes)
+- pocketbase: hbh_handlers.import_pb_days(`--days`), paginated and streamed into chunked upserts
+
+Each reports rows/sec, the p50/p95 latency of the upstream fetches (timed around fetch_data and
+get_outputs_from_pocket_base_by_date) and the DBWriter transactions it caused (count and mean time
+holding the write lock).
+
+Usage:
+    python -m benchmarks.bench_ingestion --days 60 --polls 20 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from benchmarks.fake_upstream import FakeUpstream
+from core.data.dao.hbh_dao import HbhDAO
+from core.db.database import DBConnection, Base, DATABASE_URL
+from core.db.migrations import apply_migrations
+from core.db.writer import DBWriter
+from core.features.hour_by_hour import hbh_handlers, hbh_mackenzie_api
+from core.features.hour_by_hour.hbh_mackenzie_api import MackenzieClient, MES_URL_ENV
+from core.features.hour_by_hour.hbh_handlers import POCKETBASE_URL_ENV
+from core.features.hour_by_hour.hbh_service import HbhService
+
+fetch_latencies: list[float] = []
+
+
+def time_async_fetches(module, name: str):
+    fetch = getattr(module, name)
+
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fetch(*args, **kwargs)
+        finally:
+            fetch_latencies.append(time.perf_counter() - started)
+
+    setattr(module, name, timed)
+
+
+def time_fetches(module, name: str):
+    fetch = getattr(module, name)
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fetch(*args, **kwargs)
+        finally:
+            fetch_latencies.append(time.perf_counter() - started)
+
+    setattr(module, name, timed)
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def writer_totals() -> tuple[int, float]:
+    stats = DBWriter().stats()
+    return stats["commits"], stats["commits"] * stats["transaction_ms_avg"]
+
+
+def report(name: str, rows: int, elapsed: float, writer_before: tuple[int, float], extra: str = ""):
+    commits, transaction_ms = (after - before for after, before in zip(writer_totals(), writer_before))
+    print(f"{name:<14} {rows:>8,} rows {elapsed:7.2f}s {rows / elapsed:>10,.0f} rows/s  "
+          f"fetch p50 {percentile(fetch_latencies, 0.5) * 1000:6.1f} ms p95 {percentile(fetch_latencies, 0.95) * 1000:6.1f} ms "
+          f"({len(fetch_latencies)} requests)  "
+          f"commits {commits} avg {transaction_ms / commits if commits else 0:.1f} ms {extra}")
+    fetch_latencies.clear()
+
+
+async def mes_scenarios(days: int, polls: int):
+    service = HbhService(dao=HbhDAO(DBConnection().get_session()))
+
+    writer_before = writer_totals()
+    started = time.perf_counter()
+    start = datetime(2024, 1, 1)
+    backfill = await service.backfill_range_of_dates(
+        start.strftime("%Y-%m-%d"), (start + timedelta(days=days - 1)).strftime("%Y-%m-%d"), resume=False)
+    report("mes backfill", backfill.rows.total, time.perf_counter() - started, writer_before,
+           f"failed days {len(backfill.failed_days)}")
+
+    writer_before = writer_totals()
+    started = time.perf_counter()
+    for _ in range(polls):
+        await service.update_currently_hour()
+    stats = service.stats()
+    report("mes polls", stats["rows_written"] + stats["rows_skipped"], time.perf_counter() - started, writer_before,
+           f"written {stats['rows_written']} skipped {stats['rows_skipped']}")
+
+    await MackenzieClient().close()
+
+
+def pocketbase_scenario(days: int):
+    writer_before = writer_totals()
+    started = time.perf_counter()
+    imported = hbh_handlers.import_pb_days(days)
+    report("pocketbase", sum(imported["rows"].values()), time.perf_counter() - started, writer_before,
+           f"failed days {len(imported['failed_days'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=9)
+    parser.add_argument("--items", type=int, default=1, help="MES items per line-hour and TransType")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean upstream delay per request (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8899)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(lines=args.lines, items=args.items, latency=args.latency,
+                            error_rate=args.error_rate, port=args.port).start()
+    os.environ[MES_URL_ENV] = upstream.url
+    os.environ[POCKETBASE_URL_ENV] = upstream.url
+    time_async_fetches(hbh_mackenzie_api, "fetch_data")
+    time_fetches(hbh_handlers, "get_outputs_from_pocket_base_by_date")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        # DBConnection and DBWriter open ./sky_db.db
+        os.chdir(tmp)
+        try:
+            engine = create_engine(DATABASE_URL)
+            Base.metadata.create_all(engine)
+            apply_migrations(engine)
+            engine.dispose()
+
+            print(f"{args.lines} lines, {args.items} items per line-hour, latency ~{args.latency}s, "
+                  f"error rate {args.error_rate}\n")
+            asyncio.run(mes_scenarios(args.days, args.polls))
+            pocketbase_scenario(args.days)
+            print(f"\nlongest write transaction {DBWriter().stats()['transaction_ms_max']:.1f} ms, "
+                  f"upstream: {upstream.requests} requests, {upstream.errors} errors")
+        finally:
+            DBWriter().stop()
+            os.chdir(cwd)
+            upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
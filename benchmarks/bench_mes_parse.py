@@ -0,0 +1,97 @@
+"""
+Parsing a full-day MES response into hour_by_hour rows: the previous api_respond_to_model path
+(uncompiled regex per item, a pydantic HourByHourModel per line-hour, "line-hour" string keys, an
+OrderedDict sort, then to_row) against hour_rows (HourAccumulator).
+
+The synthetic payload has `--lines` lines x 24 hours x `--items` items per line-hour for each of the
+three TransTypes (the MES repeats a line-hour per model/station). Both paths must return the same rows.
+
+Usage:
+    python -m benchmarks.bench_mes_parse --lines 40 --items 10 --runs 5
+"""
+import argparse
+import asyncio
+import random
+import re
+import statistics
+import time
+from collections import OrderedDict
+
+from core.data.models.hour_by_hour_model import HourByHourModel
+from core.features.hour_by_hour.hbh_mackenzie_api import hour_rows, HOUR_FIELDS
+
+
+def make_day(lines: int, items: int) -> dict:
+    random.seed(7)
+    return {
+        field: [
+            {"LINE": f"SMT J{line:02d}", "HOURS": f"{hour:02d}:00", "QTY": random.randint(0, 400), "MODEL": f"M{i}"}
+            for line in range(1, lines + 1) for hour in range(24) for i in range(items)
+        ]
+        for field in HOUR_FIELDS
+    }
+
+
+async def legacy_respond_to_model(data, date: str):
+    if not data:
+        return None
+    unique_records = {}
+    for field in ['smt_in', 'smt_out', 'packing']:
+        for item in data.get(field, []):
+            match = re.search(r"J\d{2}", item.get('LINE', ''))
+            if not match:
+                continue
+            line = match.group()
+            hour = item.get('HOURS', '')[:2]
+            qty = item.get('QTY', 0)
+            key = f"{line}-{hour}"
+            if key in unique_records:
+                setattr(unique_records[key], field, qty)
+            else:
+                unique_records[key] = HourByHourModel(
+                    factory="A6", date=date, line=line, hour=hour, smt_in=0, smt_out=0, packing=0)
+                setattr(unique_records[key], field, qty)
+    return OrderedDict(sorted(unique_records.items()))
+
+
+def legacy_rows(data, date: str) -> list[dict]:
+    responds = asyncio.run(legacy_respond_to_model(data, date))
+    return [record.to_row("A6") for record in responds.values()]
+
+
+def new_rows(data, date: str) -> list[dict]:
+    return hour_rows(data, date, "A6")
+
+
+def timed(fn, data, runs: int) -> tuple[float, list[dict]]:
+    times = []
+    rows = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows = fn(data, "2024-12-16")
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=40, help="Lines in the payload")
+    parser.add_argument("--items", type=int, default=10, help="Items per line-hour and TransType")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_day(args.lines, args.items)
+    items = sum(len(value) for value in data.values())
+    print(f"{items:,} items, {args.lines * 24:,} line-hours")
+
+    legacy_time, legacy = timed(legacy_rows, data, args.runs)
+    new_time, new = timed(new_rows, data, args.runs)
+    assert legacy == new, "hour_rows differs from api_respond_to_model"
+
+    for name, elapsed in (("api_respond_to_model", legacy_time), ("hour_rows", new_time)):
+        print(f"{name:<22} {elapsed * 1000:9.1f} ms {items / elapsed:>14,.0f} items/s")
+    print(f"\nx{legacy_time / new_time:.1f} faster, same {len(new):,} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Current-hour polling over a simulated day: the fixed 30 second interval against AdaptivePoller.
+
+The day has `--lines` lines planned for `--planned-hours` (17 = first and second shift) and the MES
+counts of a producing line change on average every `--change-every` seconds, more often in the last
+minutes of the hour. The clock is simulated, so a day runs in a moment; no MES or database is used.
+
+Reports the polls (three MES requests each) and the freshness: the delay
+between a count changing and the poll that picks it up (mean and p95).
+
+Usage:
+    python -m benchmarks.bench_polling --lines 9 --planned-hours 17 --change-every 90
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from core.data.handlers.handler_hour_by_hour import planned_hours_of_day
+from core.features.hour_by_hour import hbh_poller
+from core.features.hour_by_hour.hbh_poller import AdaptivePoller
+
+DAY = datetime(2024, 12, 16)
+
+
+class SimulatedPlans:
+    def __init__(self, lines: int, planned_hours: float):
+        self.plans = [(DAY.strftime("%Y-%m-%d"), f"J{line:02d}", planned_hours) for line in range(1, lines + 1)]
+
+    def query_active_plans(self, factory: str, dates: list[str]):
+        return [plan for plan in self.plans if plan[0] in dates]
+
+
+class SimulatedService:
+    """Stands in for HbhService: a poll writes when a count changed since the previous one."""
+    def __init__(self, changes: list[float]):
+        self.changes = changes
+        self.now = 0.0
+        self.picked = 0
+        self.polls = 0
+        self.rows_written = 0
+        self.delays: list[float] = []
+
+    async def update_currently_hour(self):
+        self.polls += 1
+        while self.picked < len(self.changes) and self.changes[self.picked] <= self.now:
+            self.delays.append(self.now - self.changes[self.picked])
+            self.picked += 1
+            self.rows_written += 1
+
+
+def simulate_changes(planned_hours: float, change_every: float) -> list[float]:
+    """Seconds of the day at which a count changes (any line)."""
+    random.seed(3)
+    hours = planned_hours_of_day(planned_hours)
+    changes = []
+    second = 0.0
+    while second < 86_400:
+        hour, minute = int(second // 3600), int(second % 3600 // 60)
+        rate = change_every / (3 if minute >= 55 else 1)
+        second += random.expovariate(1 / rate)
+        if hour in hours:
+            changes.append(second)
+    return [change for change in changes if change < 86_400]
+
+
+async def run_fixed(service: SimulatedService, interval: float):
+    while service.now < 86_400:
+        await service.update_currently_hour()
+        service.now += interval
+
+
+async def run_adaptive(service: SimulatedService, plans: SimulatedPlans):
+    poller = AdaptivePoller(service, plans)
+    while service.now < 86_400:
+        await poller.poll()
+        now = DAY + timedelta(seconds=service.now)
+        # PLAN_REFRESH uses the monotonic clock; the plans do not change during the day
+        service.now += poller.next_interval(now)
+
+
+def report(name: str, service: SimulatedService):
+    delays = sorted(service.delays)
+    p95 = delays[int(0.95 * len(delays))] if delays else 0
+    mean = sum(delays) / len(delays) if delays else 0
+    print(f"{name:<10} {service.polls:>6,} polls {3 * service.polls:>7,} MES requests  "
+          f"freshness mean {mean:5.1f}s p95 {p95:5.1f}s  ({len(delays):,} changes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=9)
+    parser.add_argument("--planned-hours", type=float, default=17)
+    parser.add_argument("--change-every", type=float, default=90, help="Mean seconds between count changes")
+    args = parser.parse_args()
+
+    changes = simulate_changes(args.planned_hours, args.change_every)
+    fixed = SimulatedService(changes)
+    asyncio.run(run_fixed(fixed, 30))
+    adaptive = SimulatedService(changes)
+    asyncio.run(run_adaptive(adaptive, SimulatedPlans(args.lines, args.planned_hours)))
+
+    report("fixed 30s", fixed)
+    report("adaptive", adaptive)
+    print(f"\n{1 - adaptive.polls / fixed.polls:.0%} fewer polls "
+          f"(POLL_BASE {hbh_poller.POLL_BASE}s, POLL_SLOW {hbh_poller.POLL_SLOW}s, POLL_IDLE {hbh_poller.POLL_IDLE}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Random (generate_16_uuid) against time-ordered (generate_sortable_id) primary keys on SQLite.
+
+Inserts hour_by_hour-like parent rows and cycle_times-like child rows (indexed foreign key to the
+parent) in committed batches, like the poller and the cycle time endpoints do, then reports the
+insert throughput and the size of every table and index from the `dbstat` virtual table.
+Random keys land on arbitrary leaf pages of the primary key B-tree, which splits pages half full;
+time-ordered keys always append to the right-most page.
+
+Usage:
+    python -m benchmarks.bench_primary_keys --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from core.db.util import generate_16_uuid, generate_sortable_id
+
+SCHEMA = [
+    """
+    CREATE TABLE parent (
+        id VARCHAR(16) NOT NULL PRIMARY KEY,
+        line VARCHAR(3) NOT NULL,
+        date VARCHAR(10) NOT NULL,
+        hour INTEGER NOT NULL,
+        smt_in INTEGER NOT NULL,
+        smt_out INTEGER NOT NULL,
+        packing INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE child (
+        id VARCHAR(16) NOT NULL PRIMARY KEY,
+        cycles JSON NOT NULL,
+        parent_id VARCHAR(16) NOT NULL REFERENCES parent (id)
+    )
+    """,
+    "CREATE INDEX ix_child_parent_id ON child (parent_id)",
+]
+
+
+def run(name: str, generate_id, rows: int, batch_size: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        with engine.begin() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+            for ddl in SCHEMA:
+                connection.exec_driver_sql(ddl)
+
+        started = time.perf_counter()
+        with engine.connect() as connection:
+            for offset in range(0, rows, batch_size):
+                count = min(batch_size, rows - offset)
+                parents = [(generate_id(), "J01", "2024-01-01", i % 24, 10, 10, 10) for i in range(count)]
+                children = [(generate_id(), "[]", parent[0]) for parent in parents]
+                connection.exec_driver_sql("INSERT INTO parent VALUES (?, ?, ?, ?, ?, ?, ?)", parents)
+                connection.exec_driver_sql("INSERT INTO child VALUES (?, ?, ?)", children)
+                connection.commit()
+        elapsed = time.perf_counter() - started
+
+        with engine.connect() as connection:
+            sizes = dict(connection.exec_driver_sql(
+                "SELECT name, sum(pgsize) FROM dbstat GROUP BY name ORDER BY name").fetchall())
+            fill = connection.exec_driver_sql(
+                "SELECT round(100.0 * sum(pgsize - unused) / sum(pgsize), 1) FROM dbstat "
+                "WHERE name = 'sqlite_autoindex_parent_1'").scalar()
+        engine.dispose()
+
+    result = {"name": name, "elapsed": elapsed, "rows_per_sec": 2 * rows / elapsed, "fill": fill, "sizes": sizes}
+    print(f"{name:<10} {elapsed:8.2f}s {result['rows_per_sec']:>12,.0f} rows/s  pk index fill {fill}%")
+    for table, size in sizes.items():
+        print(f"    {table:<28} {size / 1024:>10,.0f} KiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="Parent rows (one child row each)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per committed transaction")
+    args = parser.parse_args()
+
+    random_keys = run("random", generate_16_uuid, args.rows, args.batch_size)
+    sortable_keys = run("sortable", generate_sortable_id, args.rows, args.batch_size)
+
+    random_total = sum(random_keys["sizes"].values())
+    sortable_total = sum(sortable_keys["sizes"].values())
+    print(f"\nthroughput x{sortable_keys['rows_per_sec'] / random_keys['rows_per_sec']:.2f}, "
+          f"database size {sortable_total / random_total:.0%} of random keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Read latency while writes run: SQLite defaults against the configured DB profile.
+
+A writer thread mimics `update_currently_hour` (one transaction per poll, one statement per line-hour)
+while reader threads run the `/hbh/get_hbh` week query against a year of hour_by_hour rows.
+
+Usage:
+    python -m benchmarks.bench_sqlite_profile --server production --seconds 10 --readers 4
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from core.db.database import Base
+from core.db.profile import DBProfile
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema
+from core.db.util import generate_16_uuid
+
+LINES = ['J01', 'J02', 'J03', 'J05', 'J06', 'J07', 'J08', 'J09']
+
+
+def make_engine(path: str, profile: DBProfile):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        profile.apply(dbapi_connection)
+
+    return engine
+
+
+def seed(engine, days: int):
+    Base.metadata.create_all(engine, tables=[HourByHourSchema.__table__])
+    start = datetime(2024, 1, 1)
+    rows = [
+        {"id": generate_16_uuid(), "factory": "A6", "line": line,
+         "date": (start + timedelta(days=d)).strftime("%Y-%m-%d"), "hour": h,
+         "smt_in": 10, "smt_out": 10, "packing": 10}
+        for d in range(days) for line in LINES for h in range(24)
+    ]
+    with engine.begin() as conn:
+        conn.execute(HourByHourSchema.__table__.insert(), rows)
+    return start
+
+
+def writer(engine, stop: threading.Event, date: str, interval: float, stats: dict):
+    update = text("UPDATE hour_by_hour SET smt_in = smt_in + 1, smt_out = smt_out + 1, packing = packing + 1 "
+                  "WHERE factory = 'A6' AND line = :line AND date = :date AND hour = :hour")
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                for line in LINES:
+                    for hour in range(24):
+                        conn.execute(update, {"date": date, "hour": hour, "line": line})
+            stats["commits"] += 1
+            stats["write_ms"].append((time.perf_counter() - started) * 1000)
+        except OperationalError:
+            stats["write_errors"] += 1
+        stop.wait(interval)
+
+
+def reader(engine, stop: threading.Event, start_date: str, end_date: str, latencies: list, errors: list):
+    query = text("SELECT * FROM hour_by_hour WHERE date BETWEEN :start AND :end")
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(query, {"start": start_date, "end": end_date}).fetchall()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except OperationalError:
+            errors.append(1)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(profile: DBProfile, days: int, seconds: float, readers: int, interval: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, "bench.db"), profile)
+        start = seed(engine, days)
+        write_date = (start + timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        week = ((start + timedelta(days=days - 7)).strftime("%Y-%m-%d"), write_date)
+
+        stop = threading.Event()
+        stats = {"commits": 0, "write_errors": 0, "write_ms": []}
+        latencies, errors = [], []
+        threads = [threading.Thread(target=writer, args=(engine, stop, write_date, interval, stats))]
+        threads += [threading.Thread(target=reader, args=(engine, stop, week[0], week[1], latencies, errors))
+                    for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    return {
+        "profile": str(profile),
+        "reads": len(latencies),
+        "read_errors": len(errors),
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies, default=0.0),
+        "commits": stats["commits"],
+        "write_errors": stats["write_errors"],
+        "commit_p50_ms": statistics.median(stats["write_ms"]) if stats["write_ms"] else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite profile read/write contention benchmark')
+    parser.add_argument('--server', type=str, default='default', help='Profile section db_<server> to compare')
+    parser.add_argument('--days', type=int, default=365, help='Days of hour_by_hour history to seed')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run')
+    parser.add_argument('--readers', type=int, default=4, help='Concurrent reader threads')
+    parser.add_argument('--interval', type=float, default=0.0, help='Pause between writer commits (s)')
+    args = parser.parse_args()
+
+    for _profile in (DBProfile(), DBProfile.from_config(args.server)):
+        result = run(_profile, args.days, args.seconds, args.readers, args.interval)
+        print(result["profile"])
+        print(f"  reads={result['reads']} errors={result['read_errors']} "
+              f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+              f"p99={result['p99_ms']:.2f}ms max={result['max_ms']:.2f}ms")
+        print(f"  commits={result['commits']} write_errors={result['write_errors']} "
+              f"commit_p50={result['commit_p50_ms']:.2f}ms")
@@ -0,0 +1,82 @@
+"""
+Cold-start time of the API app and of the scheduler, each measured in a fresh interpreter.
+
+- api: `import core.api.main` (what uvicorn does for `core.api.main:app`) plus the first
+  DBConnection()/AsyncDBConnection(), which every worker pays on its first request.
+- scheduler: the imports of `run_feature.py` plus building its HbhService.
+
+Runs against a throwaway database created by `run_db.py --db create_tables` in a temp directory.
+For reference it also times `Base.metadata.create_all` on that up-to-date database, the work every
+process used to repeat at startup.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "api (core.api.main:app)": """
+import core.api.main
+from core.db.database import DBConnection, AsyncDBConnection
+DBConnection(); AsyncDBConnection()
+""",
+    "scheduler (run_feature.py)": """
+from core.data.dao.hbh_dao import HbhDAO
+from core.db.database import DBConnection
+from core.features.hour_by_hour.hbh_service import HbhService
+from core.features.task_handler import AsyncPeriodicExecutor
+HbhService(dao=HbhDAO(connection=DBConnection().get_session()))
+""",
+    "create_all on an existing database": """
+import core.api.main
+from core.db.database import DBConnection, Base
+engine = DBConnection().engine
+started = time.perf_counter()
+Base.metadata.create_all(bind=engine)
+print((time.perf_counter() - started) * 1000)
+raise SystemExit
+""",
+}
+
+WRAPPER = """
+import time
+started = time.perf_counter()
+{code}
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def measure(code: str, cwd: str, env: dict) -> float:
+    output = subprocess.run([sys.executable, "-c", WRAPPER.format(code=code)], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main(runs: int):
+    env = {**os.environ, "PYTHONPATH": ROOT, "PYTHONWARNINGS": "ignore"}
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(ROOT, "config"), os.path.join(tmp, "config"))
+        subprocess.run([sys.executable, os.path.join(ROOT, "run_db.py"), "--db", "create_tables"],
+                       cwd=tmp, env=env, capture_output=True, check=True)
+
+        for name, code in TARGETS.items():
+            measure(code, tmp, env)  # warm the OS file cache and __pycache__
+            samples = [measure(code, tmp, env) for _ in range(runs)]
+            print(f"{name}: median={statistics.median(samples):.1f}ms min={min(samples):.1f}ms "
+                  f"max={max(samples):.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cold-start benchmark')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per target')
+    args = parser.parse_args()
+
+    main(args.runs)
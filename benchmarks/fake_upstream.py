@@ -0,0 +1,183 @@
+"""
+Local stand-in for the Mackenzie MES reporter and the PocketBase of the previous app, for load tests.
+
+Serves synthetic data with the shape of the real services:
+- GET /home/reporte?entrada=YYYYMMDDHH&salida=YYYYMMDDHH00&transtype=INPUT|OUTPUT|PACKING
+  (hbh_mackenzie_api.url), a JSON list of {LINE, HOURS, QTY} items
+- GET /api/collections/day/records?filter=(work_date ~ 'YYYY-MM-DD')&expand=hours
+  (hbh_handlers.get_outputs_from_pocket_base_by_date), {"items": [...]} with the hours expanded,
+  paginated with page/perPage like PocketBase
+
+Counts are derived from (date, line, hour, transtype), so repeated requests return the same data.
+`--latency` adds a uniform random delay of 0..2x the value per request, `--error-rate` answers that
+share of requests with HTTP 500.
+
+Point the app at it with SKY_MES_URL / SKY_POCKETBASE_URL, or use FakeUpstream from a benchmark.
+
+Usage:
+    python -m benchmarks.fake_upstream --port 8899 --lines 9 --items 1 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+import re
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+TRANS_TYPES = ('INPUT', 'OUTPUT', 'PACKING')
+
+_WORK_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class FakeUpstream:
+    """
+    The fake server, runnable in the foreground (serve) or on a background thread (start/stop).
+
+    :param lines: Production lines (J01, J02, ...).
+    :param items: Items per line-hour and TransType in /home/reporte (the MES repeats line-hours per model).
+    :param latency: Mean added delay per request, in seconds.
+    :param error_rate: Share of requests answered with HTTP 500.
+    """
+    def __init__(self, lines: int = 9, items: int = 1, latency: float = 0.0, error_rate: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 8899):
+        self.lines = [f"J{line:02d}" for line in range(1, lines + 1)]
+        self.items = items
+        self.latency = latency
+        self.error_rate = error_rate
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def count(self, date: str, line: str, hour: int, trans_type: str) -> int:
+        return zlib.crc32(f"{date}{line}{hour}{trans_type}".encode()) % 400
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/home/reporte', self.reporte)
+        app.router.add_get('/api/collections/day/records', self.day_records)
+        return app
+
+    async def _delay_or_fail(self) -> bool:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    async def reporte(self, request: web.Request) -> web.Response:
+        if await self._delay_or_fail():
+            return web.Response(status=500, text="Internal Server Error")
+
+        start = datetime.strptime(request.query['entrada'][:10], "%Y%m%d%H")
+        end = datetime.strptime(request.query['salida'][:10], "%Y%m%d%H")
+        trans_type = request.query['transtype']
+
+        items = []
+        hour = start
+        while hour <= end:
+            date = hour.strftime("%Y-%m-%d")
+            for line in self.lines:
+                qty = self.count(date, line, hour.hour, trans_type)
+                items.extend(
+                    {"LINE": f"SMT {line}", "HOURS": f"{hour.hour:02d}:00", "QTY": qty, "MODEL": f"M{i}"}
+                    for i in range(self.items)
+                )
+            hour += timedelta(hours=1)
+        return web.json_response(items)
+
+    async def day_records(self, request: web.Request) -> web.Response:
+        if await self._delay_or_fail():
+            return web.Response(status=500, text="Internal Server Error")
+
+        match = _WORK_DATE.search(request.query.get('filter', ''))
+        if not match:
+            return web.json_response({"items": [], "page": 1, "perPage": 30, "totalItems": 0, "totalPages": 0})
+        date = match.group()
+
+        page = int(request.query.get('page', 1))
+        per_page = int(request.query.get('perPage', 30))
+        lines = self.lines[(page - 1) * per_page:page * per_page]
+        items = [
+            {
+                "id": f"{date}{line}",
+                "line": line,
+                "work_date": f"{date} 00:00:00.000Z",
+                "expand": {"hours": [
+                    {
+                        "place": hour,
+                        "smtIn": self.count(date, line, hour, 'INPUT'),
+                        "smtOut": self.count(date, line, hour, 'OUTPUT'),
+                        "packing": self.count(date, line, hour, 'PACKING'),
+                    }
+                    for hour in range(24)
+                ]},
+            }
+            for line in lines
+        ]
+        return web.json_response({
+            "items": items,
+            "page": page,
+            "perPage": per_page,
+            "totalItems": len(self.lines),
+            "totalPages": -(-len(self.lines) // per_page),
+        })
+
+    def serve(self):
+        web.run_app(self.app(), host=self.host, port=self.port)
+
+    def start(self) -> 'FakeUpstream':
+        """Serve on a daemon thread with its own event loop; returns once it accepts connections."""
+        self._thread = threading.Thread(target=self._run, name="fake-upstream", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.app())
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.TCPSite(self._runner, self.host, self.port).start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--lines", type=int, default=9, help="Production lines")
+    parser.add_argument("--items", type=int, default=1, help="MES items per line-hour and TransType")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean added delay per request (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 500")
+    args = parser.parse_args()
+
+    FakeUpstream(
+        lines=args.lines, items=args.items, latency=args.latency, error_rate=args.error_rate,
+        host=args.host, port=args.port
+    ).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,11 @@ from typing import Optional
 
 from fastapi import APIRouter, HTTPException
 from fastapi.params import Depends
-from openpyxl.workbook import Workbook
 from pydantic import BaseModel, Field, field_validator
 from starlette.responses import StreamingResponse
 
 from core.data.repositories.cycle_time.cycle_time_repository import CycleTimeRepository
-from core.db.database import get_scoped_db_session
+from core.db.database import get_async_db_session
 
 router = APIRouter(
     prefix="/cycle_time",
@@ -17,7 +16,7 @@ router = APIRouter(
 )
 
 
-def get_cycle_time_repository(db=Depends(get_scoped_db_session)):
+def get_cycle_time_repository(db=Depends(get_async_db_session)):
     return CycleTimeRepository(db)
 
 
@@ -168,6 +167,8 @@ async def download_by_id(
         record = await repository.get_by_id_details(record_id)
 
 
+        from openpyxl.workbook import Workbook  # Export only: imported on first download
+
         workbook = Workbook()
         sheet = workbook.active
         sheet.title = "Cycle Times"
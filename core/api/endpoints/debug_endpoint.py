@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+
+from core.db.database import DBConnection
+from core.db.instrumentation import db_stats_registry, N_PLUS_ONE_THRESHOLD
+from core.db.writer import DBWriter
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+)
+
+
+@router.get("/db-stats")
+async def get_db_stats():
+    """
+    Per-route database statistics (statement count, DB time, N+1 suspects),
+    the most recent requests, the read pool status and the group commit counters of the writer.
+    """
+    return {
+        "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+        "pool": DBConnection().pool_stats(),
+        "writer": DBWriter().stats(),
+        **db_stats_registry.summary(),
+    }
+
+
+@router.delete("/db-stats")
+async def reset_db_stats():
+    db_stats_registry.reset()
+    return {"status": "ok", "message": "DB stats reset"}
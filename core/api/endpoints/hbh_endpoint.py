@@ -1,14 +1,16 @@
+import json
 from io import BytesIO
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from openpyxl.workbook import Workbook
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
 from starlette.responses import StreamingResponse
 
 from core.api.fast_util import validate_date_range
 from core.api.querys.hbh_query import GetHbhQuery
 from core.data.models.request_model import RequestWeekEffModel
 from core.data.repositories.hbhRepo import HourByHourRepository
-from core.db.database import get_scoped_db_session
+from core.db.database import get_scoped_db_session, get_async_db_session
+from core.features.hour_by_hour.hbh_ingest import IngestError, parse_ingest_body
+from core.features.hour_by_hour.hbh_scans import ScanAggregator
 from core.logger.logger import Logger
 from core.util import date_str_date_to_excel_date, ExcelDateType
 
@@ -20,8 +22,8 @@ router = APIRouter(
 
 
 # Dependency to get the repository
-def get_hbh_repository(db=Depends(get_scoped_db_session)):
-    return HourByHourRepository(db, _logger)
+def get_hbh_repository(db=Depends(get_scoped_db_session), async_db=Depends(get_async_db_session)):
+    return HourByHourRepository(db, _logger, async_db=async_db)
 
 
 @router.get("/get_hbh")
@@ -56,6 +58,8 @@ async def get_hbh(
         data = await repo.get_hour_by_hour_by(query=query)
 
         if data:
+            from openpyxl.workbook import Workbook  # Export only: imported on first download
+
             workbook = Workbook()
             sheet = workbook.active
             sheet.title = "Hour by Hour"
@@ -106,11 +110,12 @@ async def get_eff_by_week(
 
 @router.patch("/update_day_before")
 async def update_day_before(
+        factory: str = "A6",
         repo: HourByHourRepository = Depends(get_hbh_repository),
 ):
     try:
 
-        await repo.update_previews_day()
+        await repo.update_previews_day(factory)
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -118,15 +123,21 @@ async def update_day_before(
     return {"status": "ok", "message": "Day before updated", "data": []}
 
 
-@router.get("/update_range_of_dates")
+@router.get("/update_range_of_dates", status_code=202)
 async def update_range_of_dates(
         start_date: str,
         end_date: str,
+        factory: str = "A6",
+        resume: bool = False,
         repo: HourByHourRepository = Depends(get_hbh_repository),
 
 ):
     """
-    Updates data for a given range of dates after validating the date range.
+    Queues a backfill of the range after validating the date range and returns its job right away.
+    Follow it with GET /hbh/jobs/{job_id}.
+
+    Every day is fetched again by default; with `resume=true` days a previous backfill completed are
+    skipped (to continue an interrupted one).
     """
     # Validate the date range using the utility function
     try:
@@ -134,14 +145,108 @@ async def update_range_of_dates(
     except HTTPException as e:
         raise e
 
-        # Proceed with updating the range
+    job = repo.submit_range_of_dates(start_date_obj.strftime("%Y-%m-%d"), end_date_obj.strftime("%Y-%m-%d"),
+                                     factory, resume)
+
+    return {"status": "ok", "data": {"job_id": job.id, "status": job.status, "status_url": f"/hbh/jobs/{job.id}"}}
+
+
+@router.post("/ingest")
+async def ingest(
+        request: Request,
+        factory: str = "A6",
+        repo: HourByHourRepository = Depends(get_hbh_repository),
+):
+    """
+    Push line-hour counts (e.g. from line PCs at hour close) as a JSON array or NDJSON
+    (Content-Type application/x-ndjson) of {"line", "date", "hour", "smt_in", "smt_out", "packing"},
+    with an optional "factory" per row (`factory` otherwise).
+
+    The batch is validated as a whole and upserted in one transaction: any invalid row rejects it
+    with 422 and the list of errors. Rows of lines counted by POST /hbh/scans are not written and
+    are listed under "skipped".
+    """
+    body = await request.body()
     try:
-        await repo.update_range_of_dates(start_date_obj.strftime("%Y-%m-%d"),
-                                         end_date_obj.strftime("%Y-%m-%d"))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"An error occurred while updating: {e}"
-        )
+        data = await repo.ingest_hours(body, request.headers.get("content-type"), factory)
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail={"message": str(e), "errors": e.errors})
+
+    _logger.info(f"[ingest] [{request.client[0]}] : {data}")
+    return {"status": "ok", "data": data}
+
+
+@router.post("/scans")
+async def post_scans(
+        request: Request,
+        factory: str = "A6",
+):
+    """
+    Per-unit scan events as a JSON array or NDJSON of {"line", "type": SMT_IN|SMT_OUT|PACKING, "ts", "qty"}
+    ("ts" defaults to now, "qty" to 1). Counted in memory and flushed to hour_by_hour every few seconds;
+    invalid events are skipped and reported.
+    """
+    try:
+        events = parse_ingest_body(await request.body(), request.headers.get("content-type"))
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail={"message": str(e), "errors": e.errors})
+
+    return {"status": "ok", "data": ScanAggregator().add(events, factory)}
+
+
+@router.websocket("/scans/ws")
+async def scans_websocket(websocket: WebSocket, factory: str = "A6"):
+    """
+    Same as POST /hbh/scans over a websocket: each message is an event or an array of events and is
+    answered with {"accepted", "rejected", "errors"}.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                events = json.loads(message)
+            except ValueError as e:
+                await websocket.send_json({"accepted": 0, "rejected": 0, "errors": [{"error": f"Invalid JSON: {e}"}]})
+                continue
+            await websocket.send_json(ScanAggregator().add(events if isinstance(events, list) else [events], factory))
+    except WebSocketDisconnect:
+        pass
+
+
+@router.get("/scans/stats")
+async def get_scans_stats():
+    """Events counted, line-hours waiting for the next flush and the flushes done."""
+    return {"status": "ok", "data": ScanAggregator().stats()}
+
+
+@router.get("/gaps")
+async def get_gaps(
+        start_date: str,
+        end_date: str,
+        factory: str = "A6",
+        repo: HourByHourRepository = Depends(get_hbh_repository),
+):
+    """
+    Hours of planned lines missing from hour_by_hour in the range. The scheduler heals the last days
+    on its own (HbhService.heal_gaps); older ones can be re-fetched with /hbh/update_range_of_dates.
+    """
+    start_date_obj, end_date_obj = validate_date_range(start_date, end_date)
+    gaps = repo.get_gaps(start_date_obj.strftime("%Y-%m-%d"), end_date_obj.strftime("%Y-%m-%d"), factory)
+
+    return {"status": "ok", "data": {"missing_hours": sum(len(gap["hours"]) for gap in gaps), "gaps": gaps}}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+        job_id: str,
+        repo: HourByHourRepository = Depends(get_hbh_repository),
+):
+    """
+    Status of a backfill job: queued/running/done/failed and its progress (days done, rows written, errors).
+    """
+    job = repo.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
 
-    return {"status": "ok", "data": True}
+    return {"status": "ok", "data": job.to_dict()}
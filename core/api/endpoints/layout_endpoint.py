@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from core.data.dao.cycle_time.layout_dao import LayoutDAO
 from core.data.repositories.cycle_time.layout_repository import LayoutRepository
-from core.db.database import get_scoped_db_session
+from core.db.database import get_async_db_session
 
 router = APIRouter(
     prefix="/layout",
@@ -10,7 +10,7 @@ router = APIRouter(
 )
 
 
-def get_layout_repository(db=Depends(get_scoped_db_session)):
+def get_layout_repository(db=Depends(get_async_db_session)):
     return LayoutRepository(dao=LayoutDAO(db))
 
 
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from core.data.dao.line_dao import LineDAO
 from core.data.repositories.line_repository import LineRepository
-from core.db.database import get_scoped_db_session
+from core.db.database import get_async_db_session
 
 router = APIRouter(
     prefix="/line",
@@ -10,7 +10,7 @@ router = APIRouter(
 )
 
 
-def get_line_repository(db=Depends(get_scoped_db_session)):
+def get_line_repository(db=Depends(get_async_db_session)):
     return LineRepository(dao= LineDAO(db))
 
 
@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 
-from sqlalchemy.orm.scoping import ScopedSession
+from sqlalchemy.orm import Session
 
 from core.data.models.user_model import UserModel
 from core.data.repositories.userRepo import UserRepository
 from core.data.schemas import user_schema
-from core.db.database import get_scoped_db_session
 from core.data.models import user_model
-from core.security.auth import get_user_by_token, has_permission, get_user_by_basic, has_role_permission
+from core.security.auth import get_user_by_token, has_permission, get_user_by_basic, has_role_permission, \
+    get_auth_db_session
 
 router = APIRouter(
     prefix="/users",
@@ -17,7 +17,7 @@ router = APIRouter(
 
 
 # Dependency to get the repository
-def get_user_repository(db : ScopedSession = Depends(get_scoped_db_session)):
+def get_user_repository(db: Session = Depends(get_auth_db_session)):
     return UserRepository(db)
 
 
@@ -25,7 +25,7 @@ def get_user_repository(db : ScopedSession = Depends(get_scoped_db_session)):
 async def read_users(
         skip: int = 0,
         limit: int = 100,
-        db = Depends(get_scoped_db_session),
+        db = Depends(get_auth_db_session),
         current_user: user_model = Depends(get_user_by_token)
 ):
     if not has_permission(current_user, "read"):
@@ -39,7 +39,7 @@ async def read_users(
 async def read_users(
         skip: int = 0,
         limit: int = 100,
-        db = Depends(get_scoped_db_session),
+        db = Depends(get_auth_db_session),
         current_user: user_model.UserModel = Depends(get_user_by_basic)
 ):
     if not has_role_permission(current_user, ["admin", "user"]):
@@ -59,7 +59,7 @@ async def create_user(
 ):
 
     try:
-        _result = repo.create_user(user)
+        _result = await repo.create_user(user)
 
         return {"message": "User created successfully", "user": _result}
     except Exception as e:
@@ -57,7 +57,7 @@ async def create_work_plan(work_plan: WorkPlanModel,
                            repository: WorkPlanRepository = Depends(get_work_plan_repository)):
 
     try:
-        respond = repository.create_work_plan(work_plan)
+        respond = await repository.create_work_plan(work_plan)
         return respond
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
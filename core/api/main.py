@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from datetime import timedelta
 from fastapi import FastAPI, Depends, HTTPException, status
 
@@ -5,13 +6,27 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from starlette.middleware.cors import CORSMiddleware
 
+from core.api.middleware import RequestScopeMiddleware, DBInstrumentationMiddleware
 from core.api.endpoints import user_endpoint, hbh_endpoint, work_plan_endpoint, line_endpoint, layout_endpoint, \
-    cycle_time_endpoint, platform_endpoint
+    cycle_time_endpoint, platform_endpoint, debug_endpoint
 from core.data.models.token_model import TokenModel
+from core.features.hour_by_hour.hbh_mackenzie_api import MackenzieClient
+from core.features.hour_by_hour.hbh_scans import ScanAggregator
+from core.features.job_runner import JobRunner
 from core.security import auth
 from core.security.auth import authenticate_user, ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Write the scan counts not flushed yet
+    await ScanAggregator().stop()
+    # Stop the background jobs, then close the pooled MES connections they use
+    await JobRunner().stop()
+    await MackenzieClient().close()
+
+
+app = FastAPI(lifespan=lifespan)
 # Allow CORS for localhost:3000
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +36,10 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
 )
+# One database session per request (contextvars), closed when the request ends
+app.add_middleware(RequestScopeMiddleware)
+# Server-Timing header and /debug/db-stats (statement count, DB time, N+1 suspects)
+app.add_middleware(DBInstrumentationMiddleware)
 # Include endpoints
 app.include_router(user_endpoint.router)
 app.include_router(hbh_endpoint.router)
@@ -31,10 +50,11 @@ app.include_router(line_endpoint.router)
 app.include_router(layout_endpoint.router)
 app.include_router(platform_endpoint.router)
 app.include_router(cycle_time_endpoint.router)
+app.include_router(debug_endpoint.router)
 @app.post("/token", response_model=TokenModel)
 async def login_for_access_token(
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(auth.get_db_session)
+        db: Session = Depends(auth.get_auth_db_session)
 ):
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
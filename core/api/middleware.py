@@ -0,0 +1,71 @@
+from core.db.database import DBConnection
+from core.db.instrumentation import begin_request_stats, end_request_stats, db_stats_registry
+from core.logger.logger import Logger
+
+_logger = Logger.get_logger(name="FastApi")
+
+
+class RequestScopeMiddleware:
+    """
+    ASGI middleware that gives every HTTP/websocket request its own database scope.
+
+    The scope key lives in a contextvar, so ScopedSession hands each request its own Session
+    (and identity map) even though all `async def` endpoints run on the event loop thread.
+    The session is closed and returned to the pool once the request has finished.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = DBConnection()
+        token = connection.begin_request_scope()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            connection.end_request_scope(token)
+
+
+class DBInstrumentationMiddleware:
+    """
+    ASGI middleware that records what each request does to the database.
+
+    Statement count, DB time and repeated statement fingerprints (the N+1 signal) are collected by the
+    engine hooks of core.db.instrumentation, returned in a `Server-Timing` header and aggregated
+    per route for `/debug/db-stats`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = begin_request_stats(scope.get("method", ""), scope.get("path", ""))
+
+        async def send_with_server_timing(message):
+            if message["type"] == "http.response.start":
+                # The router has resolved the route by now; aggregate by its template, not the raw path
+                route = scope.get("route")
+                if route is not None and hasattr(route, "path"):
+                    stats.route = route.path
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            end_request_stats(token)
+            db_stats_registry.add(stats)
+            repeated = stats.repeated()
+            if repeated:
+                _logger.warning(f"[db] {stats.method} {stats.route}: {stats.statements} queries, "
+                                f"N+1 suspects: {repeated}")
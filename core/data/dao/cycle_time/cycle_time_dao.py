@@ -1,64 +1,80 @@
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 
 from core.data.schemas.all_schemas import CycleTimeRecordSchema, CycleTimeSchema, LayoutSchema, LineSchema
 from core.data.schemas.hour_by_hour_schema import WorkPlanSchema
+from core.db.writer import DBWriter
 
 
 class CycleTimeDAO:
 
-    def __init__(self, session):
+    def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def fetch_create_record(self, record: CycleTimeRecordSchema) -> 'CycleTimeRecordSchema':
-        self.session.add(record)
-        self.session.commit()
-        self.session.refresh(record)
-        return record
-
-    async def fetch_get_by_week(self, week)-> list[CycleTimeRecordSchema]:
-        return self.session.query(CycleTimeRecordSchema).options(
+    @staticmethod
+    def _record_details():
+        # Everything _process_record touches must be eager loaded: lazy loads are not allowed under asyncio
+        return (
             joinedload(CycleTimeRecordSchema.line),
             joinedload(CycleTimeRecordSchema.platform),
-            joinedload(CycleTimeRecordSchema.user),
+            selectinload(CycleTimeRecordSchema.user),  # Separate query: users may be in the auth database
             joinedload(CycleTimeRecordSchema.cycle_times),
             joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout),
             joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout).joinedload(
                 LayoutSchema.station),
             joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout).joinedload(
                 LayoutSchema.layout_section),
-        ).filter_by(week=week).all()
+        )
+
+    # Writes are DBWriter jobs: the request session is read-only
+
+    async def fetch_create_record(self, record: CycleTimeRecordSchema) -> 'CycleTimeRecordSchema':
+        def create(session):
+            session.add(record)
+            session.flush()
+            session.refresh(record)
+            return record
+
+        return await DBWriter().execute_async(create)
+
+    async def fetch_get_by_week(self, week)-> list[CycleTimeRecordSchema]:
+        result = await self.session.execute(
+            select(CycleTimeRecordSchema).options(*self._record_details()).filter_by(week=week)
+        )
+        return list(result.unique().scalars().all())
 
     async def fetch_delete_record(self, record_id):
-        self.session.query(CycleTimeRecordSchema).filter_by(id=record_id).delete()
-        self.session.commit()
+        await DBWriter().execute_async(
+            lambda session: session.execute(delete(CycleTimeRecordSchema).filter_by(id=record_id))
+        )
         return True
 
     async def fetch_get_by_id(self, record_id):
-        return self.session.query(CycleTimeRecordSchema).options(
-            joinedload(CycleTimeRecordSchema.line),
-            joinedload(CycleTimeRecordSchema.platform),
-            joinedload(CycleTimeRecordSchema.user),
-            joinedload(CycleTimeRecordSchema.cycle_times),
-            joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout),
-            joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout).joinedload(
-                LayoutSchema.station),
-            joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout).joinedload(
-                LayoutSchema.layout_section),
-        ).filter_by(id=record_id).first()
+        result = await self.session.execute(
+            select(CycleTimeRecordSchema).options(*self._record_details()).filter_by(id=record_id)
+        )
+        return result.unique().scalars().first()
 
     async def fetch_update_cycle_time(self, cycle_time_id: str, cycles):
-        self.session.query(CycleTimeSchema).filter(CycleTimeSchema.id == cycle_time_id).update({"cycles": cycles})
-        self.session.commit()
+        await DBWriter().execute_async(
+            lambda session: session.execute(
+                update(CycleTimeSchema).where(CycleTimeSchema.id == cycle_time_id).values(cycles=cycles)
+            )
+        )
 
         # Fetch the updated record
         # updated_record = self.session.query(CycleTimeSchema).filter_by(id=cycle_time_id).first()
 
-    async def fetch_get_work_plan_by_str_date_and_line(self, str_date, line):
-
-        return self.session.query(WorkPlanSchema).options(
-            joinedload(WorkPlanSchema.platform),
-        ).filter_by(date=str_date, line = line).first()
+    async def fetch_get_work_plan_by_str_date_and_line(self, str_date, line, factory="A6"):
+        result = await self.session.execute(
+            select(WorkPlanSchema).options(
+                joinedload(WorkPlanSchema.platform),
+            ).filter_by(factory=factory, date=str_date, line=line).limit(1)
+        )
+        return result.scalars().first()
 
 
     async def fetch_get_lines(self):
-        return self.session.query(LineSchema).all()
\ No newline at end of file
+        result = await self.session.execute(select(LineSchema))
+        return list(result.scalars().all())
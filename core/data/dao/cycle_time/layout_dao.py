@@ -1,3 +1,5 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
 from core.data.schemas.all_schemas import LayoutSchema
@@ -5,21 +7,21 @@ from core.data.schemas.all_schemas import LayoutSchema
 
 # DAO implementation 3.0
 class LayoutDAO:
-    def __init__(self, session):
+    def __init__(self, session: AsyncSession):
         self.session = session
 
     # For API call
     async def fetch_get_layout_by_id(self, layout_id):
-        layout = self.session.query(LayoutSchema).filter_by(id=layout_id).first()
-        return layout
+        result = await self.session.execute(select(LayoutSchema).filter_by(id=layout_id).limit(1))
+        return result.scalars().first()
 
     async def fetch_get_layouts(self):
-        return self.session.query(LayoutSchema).all()
+        result = await self.session.execute(select(LayoutSchema))
+        return list(result.scalars().all())
 
     async def fetch_get_layout_by_line_id(self, line_id)-> list[LayoutSchema]:
-        layout = (
-            self.session
-            .query(LayoutSchema)
+        result = await self.session.execute(
+            select(LayoutSchema)
             .options(
                 joinedload(LayoutSchema.station),
                 joinedload(LayoutSchema.cluster),
@@ -27,9 +29,9 @@ class LayoutDAO:
                 joinedload(LayoutSchema.machine),
                 joinedload(LayoutSchema.layout_section)
             )
-            .filter_by(line_id=line_id).all())
+            .filter_by(line_id=line_id))
 
-        return layout
+        return list(result.scalars().all())
 
     # For Internal use
 
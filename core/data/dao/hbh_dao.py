@@ -1,17 +1,81 @@
 import json
+from datetime import datetime
 
 from colorama import Fore, Style
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, select, exists, literal, true, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.data.handlers.handler_hour_by_hour import SHIFT_HOURS
 from core.data.handlers.translator import translate_hour_by_hour_schema_list_to_model_list
 from core.data.models.hour_by_hour_model import HourByHourModel, PlatformModel, WorkPlanModel
-from core.data.schemas.hour_by_hour_schema import HourByHourSchema, PlatformSchema, WorkPlanSchema
-from core.db.util import QueryResult, QueryResultError, QueryResultErrorType
+from core.data.schemas.all_schemas import LineSchema
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema, PlatformSchema, WorkPlanSchema, HbhBackfillDaySchema, \
+    HbhSyncWatermarkSchema, HbhLineSourceSchema
+from core.db.util import QueryResult, QueryResultError, QueryResultErrorType, UpsertResult, generate_sortable_id
+from core.db.writer import DBWriter
+
+# Rows per executemany call of HbhDAO.query_upsert_hours
+UPSERT_BATCH_SIZE = 2000
+
+# Work plan states of a line that is not expected to produce
+IDLE_PLAN_STATES = ('NO_PLAN',)
+
+# hbh_line_sources.source of the lines counted by ScanAggregator
+LINE_SOURCE_SCAN = 'scan'
+
+
+def hour_row(record: HourByHourSchema) -> dict:
+    """Column dict of an HourByHourSchema for Core inserts."""
+    return {
+        "id": record.id,
+        "factory": record.factory,
+        "line": record.line,
+        "date": record.date,
+        "hour": record.hour,
+        "smt_in": record.smt_in,
+        "smt_out": record.smt_out,
+        "packing": record.packing,
+    }
+
+
+def upsert_rows_by_key(session, table, rows: list[dict], key: tuple[str, ...]) -> UpsertResult:
+    """
+    INSERT ... ON CONFLICT(`key`) DO UPDATE of `rows` (dicts with the same keys, `id` included) in one
+    executemany; `key` must be backed by a unique index. The id only names new rows: a stored row
+    keeps its own. Only the columns present in the rows are written, and rows equal to the stored ones
+    are left untouched, so loading the same data twice changes nothing. A key repeated in `rows`
+    keeps its last row. The caller owns the transaction (commit/rollback).
+    """
+    result = UpsertResult()
+    if not rows:
+        return result
+
+    rows = list({tuple(row[name] for name in key): row for row in rows}.values())
+    columns = [name for name in rows[0] if name != "id" and name not in key]
+    key_columns = [table.c[name] for name in key]
+    keys = [tuple(row[name] for name in key) for row in rows]
+    existing = set(session.execute(select(*key_columns).where(tuple_(*key_columns).in_(keys))).tuples())
+
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={name: stmt.excluded[name] for name in columns},
+        where=or_(*(table.c[name].is_distinct_from(stmt.excluded[name]) for name in columns)),
+    ).returning(*key_columns)
+
+    returned = session.execute(stmt, rows).tuples().all()
+    result.inserted = sum(1 for row_key in returned if row_key not in existing)
+    result.updated = len(returned) - result.inserted
+    result.unchanged = len(rows) - len(returned)
+    return result
 
 
 class HbhDAO:
-    def __init__(self, connection):
+    def __init__(self, connection, async_session: AsyncSession = None):
         self.session = connection
+        # AsyncSession used by the fetch_* methods (API reads)
+        self.async_session = async_session
         # logger
 
     def query_all(self) -> list[HourByHourModel] | None:
@@ -54,55 +118,276 @@ class HbhDAO:
 
     # if record exists, update it. Otherwise, insert it
     def query_update_hour(self, record):
+        return self.query_update_hours([record])
+
+    def query_update_hours(self, records) -> UpsertResult | None:
+        """
+        Upsert hour by hour records in a single transaction, committed by the DBWriter.
+
+        :param records: HourByHourSchema instances or row dicts (see HourByHourModel.to_row).
+        :return: Inserted/updated/unchanged counts, or None if the transaction failed.
+        """
+        rows = [record if isinstance(record, dict) else hour_row(record) for record in records]
         try:
-            last_hour = self.session.query(HourByHourSchema).filter(HourByHourSchema.date == record.date).filter(
-                HourByHourSchema.hour == record.hour).filter(HourByHourSchema.line == record.line).first()
-            if last_hour is not None:
-                last_hour.smt_in = record.smt_in
-                last_hour.smt_out = record.smt_out
-                last_hour.packing = record.packing
-                self.session.commit()
-                print(f"{Fore.GREEN}Record {Fore.YELLOW}{record.to_dict()} updated{Style.RESET_ALL}")
-            else:
-                self.session.add(record)
-                self.session.commit()
-                print(f"{Fore.GREEN}Record {Fore.YELLOW}{record.to_dict()} pushed{Style.RESET_ALL}")
+            result = DBWriter().execute(lambda session: HbhDAO(session).query_upsert_hours(rows))
+            print(f"{Fore.GREEN}Hour by hour upsert {Fore.YELLOW}{result}{Style.RESET_ALL}")
+            return result
         except Exception as e:
             print(f"{Fore.RED}{e}{Style.RESET_ALL}")
-            self.session.close()
-        finally:
-            print(f"{Fore.GREEN}Session close{Style.RESET_ALL}")
 
-    def query_update_hours(self, records):
+    async def query_update_hours_async(self, records) -> UpsertResult | None:
+        """Same as query_update_hours, awaiting the DBWriter commit without blocking the event loop."""
+        rows = [record if isinstance(record, dict) else hour_row(record) for record in records]
         try:
-            for record in records:
-                last_hour = self.session.query(HourByHourSchema).filter(HourByHourSchema.date == record.date).filter(
-                    HourByHourSchema.hour == record.hour).filter(HourByHourSchema.line == record.line).first()
-                if last_hour is not None:
-                    last_hour.smt_in = record.smt_in
-                    last_hour.smt_out = record.smt_out
-                    last_hour.packing = record.packing
-                    print(f"{Fore.GREEN}Record {Fore.YELLOW}{record.to_dict()} {Fore.BLUE}updated{Style.RESET_ALL}")
-                else:
-                    self.session.add(record)
-                    print(f"{Fore.GREEN}Record {Fore.YELLOW}{record.to_dict()} {Fore.BLUE}pushed{Style.RESET_ALL}")
-            self.session.commit()
-            return True
+            result = await DBWriter().execute_async(lambda session: HbhDAO(session).query_upsert_hours(rows))
+            print(f"{Fore.GREEN}Hour by hour upsert {Fore.YELLOW}{result}{Style.RESET_ALL}")
+            return result
         except Exception as e:
             print(f"{Fore.RED}{e}{Style.RESET_ALL}")
-            self.session.rollback()
-        finally:
-            self.session.close()
-            print(f"{Fore.GREEN}Session close{Style.RESET_ALL}")
+
+    def query_ingest_hours(self, rows: list[dict]) -> tuple[UpsertResult, list[dict]]:
+        """
+        Upsert a pushed batch, minus the rows of lines counted by scans (hbh_line_sources): their
+        absolute counters would replace the scanned ones. Returns the result and the skipped rows.
+        The caller owns the transaction, so a line marked by a concurrent scan flush is seen.
+        """
+        scan_lines = {factory: self.query_get_scan_lines(factory) for factory in {row["factory"] for row in rows}}
+        kept, skipped = [], []
+        for row in rows:
+            (skipped if row["line"] in scan_lines[row["factory"]] else kept).append(row)
+        return (self.query_upsert_hours(kept) if kept else UpsertResult()), skipped
+
+    async def query_ingest_hours_async(self, rows: list[dict]) -> tuple[UpsertResult, list[dict]]:
+        """query_ingest_hours in one DBWriter transaction: every kept row or none. Raises on failure."""
+        return await DBWriter().execute_async(lambda session: HbhDAO(session).query_ingest_hours(rows))
+
+    def query_upsert_backfill_day(self, rows: list[dict], factory: str, date: str, complete: bool) -> UpsertResult:
+        """
+        Upsert the rows of one backfilled day. When the day is over (`complete`) it is also recorded in
+        hbh_backfill_days, in the same transaction, so a resumed backfill skips it. The caller commits.
+        """
+        result = self.query_upsert_hours(rows)
+        if complete:
+            statement = sqlite_insert(HbhBackfillDaySchema.__table__).values(
+                factory=factory, date=date, rows=len(rows), completed_at=datetime.now())
+            self.session.execute(statement.on_conflict_do_update(
+                index_elements=["factory", "date"],
+                set_={"rows": statement.excluded.rows, "completed_at": statement.excluded.completed_at},
+            ))
+        return result
+
+    async def query_backfill_day_async(self, rows: list[dict], factory: str, date: str, complete: bool) -> UpsertResult:
+        """Commit one backfilled day through the DBWriter (one transaction per day). Raises on failure."""
+        return await DBWriter().execute_async(
+            lambda session: HbhDAO(session).query_upsert_backfill_day(rows, factory, date, complete))
+
+    def query_get_watermarks(self, factory: str) -> dict[str, datetime | None]:
+        """
+        Sync watermark (hbh_sync_watermarks) of every active line of the factory and of every line synced
+        before; None for a line never synced.
+        """
+        watermarks: dict[str, datetime | None] = dict.fromkeys(self.session.execute(
+            select(LineSchema.name).where(LineSchema.factory == factory, LineSchema.is_active)
+        ).scalars())
+        watermarks.update(self.session.execute(
+            select(HbhSyncWatermarkSchema.line, HbhSyncWatermarkSchema.synced_until)
+            .where(HbhSyncWatermarkSchema.factory == factory)
+        ).tuples().all())
+        return watermarks
+
+    def query_upsert_sync(self, rows: list[dict], factory: str, lines: list[str], synced_until: datetime) -> UpsertResult:
+        """
+        Upsert the rows of a sync run and move the watermark of `lines` to `synced_until` in the caller's
+        transaction, so the rows and the watermark are stored together or not at all. A watermark
+        never moves back (an overlapping older run changes nothing).
+        """
+        result = self.query_upsert_hours(rows) if rows else UpsertResult()
+        if lines:
+            table = HbhSyncWatermarkSchema.__table__
+            statement = sqlite_insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.factory, table.c.line],
+                set_={"synced_until": statement.excluded.synced_until, "updated_at": statement.excluded.updated_at},
+                where=table.c.synced_until < statement.excluded.synced_until,
+            )
+            updated_at = datetime.now()
+            self.session.execute(statement, [
+                {"factory": factory, "line": line, "synced_until": synced_until, "updated_at": updated_at}
+                for line in lines
+            ])
+        return result
+
+    async def query_sync_async(self, rows: list[dict], factory: str, lines: list[str],
+                               synced_until: datetime) -> UpsertResult:
+        """Commit a sync run through the DBWriter (one transaction). Raises on failure."""
+        return await DBWriter().execute_async(
+            lambda session: HbhDAO(session).query_upsert_sync(rows, factory, lines, synced_until))
+
+    def query_get_scan_lines(self, factory: str) -> set[str]:
+        """Lines of the factory counted by ScanAggregator (hbh_line_sources), not written from the MES."""
+        return set(self.session.execute(
+            select(HbhLineSourceSchema.line).where(
+                HbhLineSourceSchema.factory == factory,
+                HbhLineSourceSchema.source == LINE_SOURCE_SCAN,
+            )
+        ).scalars())
+
+    def query_mark_line_sources(self, lines: set[tuple[str, str]], source: str):
+        """Record the source of (factory, line) pairs not recorded yet. The caller owns the transaction."""
+        if not lines:
+            return
+        statement = sqlite_insert(HbhLineSourceSchema.__table__).on_conflict_do_nothing(
+            index_elements=["factory", "line"])
+        since = datetime.now()
+        self.session.execute(statement, [
+            {"factory": factory, "line": line, "source": source, "since": since} for factory, line in sorted(lines)
+        ])
+
+    def query_get_backfilled_dates(self, factory: str, start_date: str, end_date: str) -> set[str]:
+        """Dates of the range already recorded as complete in hbh_backfill_days."""
+        return set(self.session.execute(
+            select(HbhBackfillDaySchema.date).where(
+                HbhBackfillDaySchema.factory == factory,
+                HbhBackfillDaySchema.date.between(start_date, end_date),
+            )
+        ).scalars())
+
+    def query_missing_hours(self, factory: str, start_date: str, end_date: str,
+                            until: datetime | None = None) -> list[tuple[str, str, int]]:
+        """
+        (date, line, hour) slots expected but absent from hour_by_hour, ordered by date, hour and line.
+
+        Expected slots are the hours (a recursive CTE) of the shifts the planned hours of each work plan
+        of the range reach (SHIFT_HOURS, as planned_hours_of_day), for plans that are not idle, up to the
+        hour before `until`. The anti-join probes unique_hbh_record_factory once
+        per slot. Days recorded in hbh_backfill_days are skipped: they were fetched whole from the MES,
+        so an hour missing there had no production. Lines counted by scans (hbh_line_sources) are not
+        expected from the MES.
+        """
+        plan = WorkPlanSchema.__table__
+        hbh = HourByHourSchema.__table__
+        backfilled = HbhBackfillDaySchema.__table__
+        sources = HbhLineSourceSchema.__table__
+
+        hours = select(literal(0).label("hour")).cte("hours", recursive=True)
+        hours = hours.union_all(select(hours.c.hour + 1).where(hours.c.hour < 23))
+
+        statement = (
+            select(plan.c.date, plan.c.line, hours.c.hour)
+            .distinct()
+            .select_from(plan.join(hours, true()))
+            .where(
+                plan.c.factory == factory,
+                plan.c.date.between(start_date, end_date),
+                plan.c.state.not_in(IDLE_PLAN_STATES),
+                or_(*(
+                    and_(plan.c.planned_hours > reached_after,
+                         hours.c.hour.between(shift_hours.start, shift_hours.stop - 1))
+                    for reached_after, shift_hours in SHIFT_HOURS
+                )),
+                ~exists().where(
+                    hbh.c.factory == plan.c.factory,
+                    hbh.c.line == plan.c.line,
+                    hbh.c.date == plan.c.date,
+                    hbh.c.hour == hours.c.hour,
+                ),
+                ~exists().where(backfilled.c.factory == plan.c.factory, backfilled.c.date == plan.c.date),
+                ~exists().where(sources.c.factory == plan.c.factory, sources.c.line == plan.c.line,
+                                sources.c.source == LINE_SOURCE_SCAN),
+            )
+            .order_by(plan.c.date, hours.c.hour, plan.c.line)
+        )
+        if until is not None:
+            today = until.strftime("%Y-%m-%d")
+            statement = statement.where(or_(plan.c.date < today, and_(plan.c.date == today, hours.c.hour < until.hour)))
+
+        return [tuple(row) for row in self.session.execute(statement)]
+
+    def query_upsert_hours(self, rows: list[dict], batch_size: int = UPSERT_BATCH_SIZE) -> UpsertResult:
+        """
+        INSERT ... ON CONFLICT(factory, line, date, hour) DO UPDATE on `unique_hbh_record_factory`.
+
+        Rows are sent in batches of `batch_size` through executemany. The update only fires when a
+        counter changed, and RETURNING id tells the cases apart: a returned id that is the one we
+        proposed was inserted, any other returned id was updated, rows not returned were unchanged.
+        The caller owns the transaction (commit/rollback).
+        """
+        result = UpsertResult()
+        table = HourByHourSchema.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.factory, table.c.line, table.c.date, table.c.hour],
+            set_={
+                "smt_in": stmt.excluded.smt_in,
+                "smt_out": stmt.excluded.smt_out,
+                "packing": stmt.excluded.packing,
+            },
+            where=or_(
+                table.c.smt_in != stmt.excluded.smt_in,
+                table.c.smt_out != stmt.excluded.smt_out,
+                table.c.packing != stmt.excluded.packing,
+            ),
+        ).returning(table.c.id)
+
+        for offset in range(0, len(rows), batch_size):
+            batch = [
+                row if row.get("id") else {**row, "id": generate_sortable_id()}
+                for row in rows[offset:offset + batch_size]
+            ]
+            proposed = {row["id"] for row in batch}
+            returned = self.session.execute(stmt, batch).scalars().all()
+            inserted = sum(1 for row_id in returned if row_id in proposed)
+            result.inserted += inserted
+            result.updated += len(returned) - inserted
+            result.unchanged += len(batch) - len(returned)
+
+        return result
+
+    def query_increment_hours(self, rows: list[dict], batch_size: int = UPSERT_BATCH_SIZE) -> UpsertResult:
+        """
+        Add the smt_in/smt_out/packing of `rows` to the stored counters of their line-hour, inserting the
+        line-hours not stored yet (ON CONFLICT on unique_hbh_record_factory ... SET smt_in = smt_in + ...).
+        For deltas such as the scan counts of ScanAggregator. The caller owns the transaction.
+        """
+        result = UpsertResult()
+        table = HourByHourSchema.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.factory, table.c.line, table.c.date, table.c.hour],
+            set_={
+                "smt_in": table.c.smt_in + stmt.excluded.smt_in,
+                "smt_out": table.c.smt_out + stmt.excluded.smt_out,
+                "packing": table.c.packing + stmt.excluded.packing,
+            },
+        ).returning(table.c.id)
+
+        for offset in range(0, len(rows), batch_size):
+            batch = [{**row, "id": generate_sortable_id()} for row in rows[offset:offset + batch_size]]
+            proposed = {row["id"] for row in batch}
+            returned = self.session.execute(stmt, batch).scalars().all()
+            inserted = sum(1 for row_id in returned if row_id in proposed)
+            result.inserted += inserted
+            result.updated += len(returned) - inserted
+
+        return result
 
     # To use in api call
     # -------------------------------------------------------------------------------
 
-    async def fetch_get_all_record_by_date(self, date: str):
-        return self.session.query(HourByHourSchema).filter(HourByHourSchema.date == date).all()
+    async def fetch_get_all_record_by_date(self, date: str, factory: str | None = None):
+        query = select(HourByHourSchema).filter(HourByHourSchema.date == date)
+        if factory:
+            query = query.filter(HourByHourSchema.factory == factory)
+        result = await self.async_session.execute(query)
+        return list(result.scalars().all())
 
-    async def fetch_get_all_record_by_date_range(self, start_date: str, end_date: str) -> list[HourByHourSchema]:
-        return self.session.query(HourByHourSchema).filter(HourByHourSchema.date.between(start_date, end_date)).all()
+    async def fetch_get_all_record_by_date_range(self, start_date: str, end_date: str,
+                                                 factory: str | None = None) -> list[HourByHourSchema]:
+        query = select(HourByHourSchema).filter(HourByHourSchema.date.between(start_date, end_date))
+        if factory:
+            query = query.filter(HourByHourSchema.factory == factory)
+        result = await self.async_session.execute(query)
+        return list(result.scalars().all())
 
 
 class PlatformDAO:
@@ -145,6 +430,10 @@ class PlatformDAO:
             self.session.close()
             print(f"{Fore.GREEN}Session close{Style.RESET_ALL}")
 
+    def query_upsert_records(self, rows: list[dict]) -> UpsertResult:
+        """Upsert platform row dicts on (name, sku) (upsert_rows_by_key). The caller owns the transaction."""
+        return upsert_rows_by_key(self.session, PlatformSchema.__table__, rows, ("name", "sku"))
+
 
     async def fetch_get_platforms(self) -> list[PlatformSchema]:
         return self.session.query(PlatformSchema).all()
@@ -190,9 +479,28 @@ class WorkPlanDAO:
             self.session.close()
             print(f"{Fore.GREEN}Session close{Style.RESET_ALL}")
 
-    def get_work_hour_by_week(self, week: int = None, date: str = None, date_range: tuple = None, dates: list = None):
+    def query_active_plans(self, factory: str, dates: list[str]) -> list[tuple[str, str, float]]:
+        """(date, line, planned_hours) of the work plans of `dates` that are not idle (IDLE_PLAN_STATES)."""
+        return [tuple(row) for row in self.session.execute(
+            select(WorkPlanSchema.date, WorkPlanSchema.line, WorkPlanSchema.planned_hours).where(
+                WorkPlanSchema.factory == factory,
+                WorkPlanSchema.date.in_(dates),
+                WorkPlanSchema.state.not_in(IDLE_PLAN_STATES),
+            )
+        )]
+
+    def query_upsert_records(self, rows: list[dict]) -> UpsertResult:
+        """
+        Upsert work_plan row dicts on (factory, date, line), the key of query_create_record
+        (upsert_rows_by_key). The caller owns the transaction.
+        """
+        return upsert_rows_by_key(self.session, WorkPlanSchema.__table__, rows, ("factory", "date", "line"))
+
+    def get_work_hour_by_week(self, week: int = None, date: str = None, date_range: tuple = None, dates: list = None,
+                              factory: str = None):
         """
         Join PlatformSchema, WorkPlanSchema, and HourByHourSchema, filtered by week.
+        :param factory: The factory to filter by.
         :param week: The week number to filter by.
         :param date: The date to filter by.
         :param date_range: The date range to filter by.
@@ -214,6 +522,7 @@ class WorkPlanDAO:
             .join(
                 HourByHourSchema,
                 and_(
+                    WorkPlanSchema.factory == HourByHourSchema.factory,
                     WorkPlanSchema.line == HourByHourSchema.line,
                     WorkPlanSchema.date == HourByHourSchema.date
                 )
@@ -221,6 +530,8 @@ class WorkPlanDAO:
         )
 
         # Apply filters dynamically
+        if factory:
+            query = query.filter(WorkPlanSchema.factory == factory)
         if week:
             query = query.filter(WorkPlanSchema.week == week)
         if date:
@@ -271,17 +582,18 @@ class WorkPlanDAO:
             WorkPlanSchema.factory == record.factory
         ).first()
 
+        # Runs as a DBWriter job: flush only, the writer commits
         if find_work_plan:
             find_work_plan.uph_i = record.uph_i
             find_work_plan.target_oee = record.target_oee
             find_work_plan.planned_hours = record.planned_hours
             find_work_plan.week = record.week
             find_work_plan.state = record.state
-            self.session.commit()
+            self.session.flush()
             return QueryResult(data=find_work_plan)
         else:
             self.session.add(record)
-            self.session.commit()
+            self.session.flush()
             return QueryResult(data=record)
 
 
@@ -1,18 +1,23 @@
 # DAO implementation 3.0
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from core.data.schemas.all_schemas import LineSchema
 
 
 class LineDAO:
 
-    def __init__(self, session):
+    def __init__(self, session: AsyncSession):
         self.session = session
 
     async def fetch_get_lines(self)-> list[LineSchema]:
-        return self.session.query(LineSchema).all()
+        result = await self.session.execute(select(LineSchema))
+        return list(result.scalars().all())
 
     async def fetch_get_line(self, line_id) -> LineSchema | None:
-        line = self.session.query(LineSchema).filter_by(id=line_id).first()
-        return line
+        result = await self.session.execute(select(LineSchema).filter_by(id=line_id).limit(1))
+        return result.scalars().first()
+
     async def fetch_get_line_by_name(self, line_name) -> LineSchema | None:
-        line = self.session.query(LineSchema).filter_by(name=line_name).first()
-        return line
\ No newline at end of file
+        result = await self.session.execute(select(LineSchema).filter_by(name=line_name).limit(1))
+        return result.scalars().first()
@@ -15,16 +15,17 @@ class UserDAO:
 
     def query_add_record(self, record: UserSchema) -> UserSchema:
         self.session.add(record)
-        self.session.commit()
+        self.session.flush()  # The caller commits (DBWriter job or auth session)
         return record
 
-    def query_create_user(self, user: CreateUserModel) -> QueryResult:
+    def query_create_user(self, user: CreateUserModel, hashed_password: Optional[str] = None) -> QueryResult:
         role = self.session.query(RoleSchema).filter_by(name=user.role).first()
         if not role:
             return QueryResult(data=None,
                                error=QueryResultError(message=f"Role: {user.role}. not found",
                                                       error_type=QueryResultErrorType.NOT_FOUND))
-        user_schema = UserSchema(username=user.username, hashed_password=get_password_hash(user.password))
+        user_schema = UserSchema(username=user.username,
+                                 hashed_password=hashed_password or get_password_hash(user.password))
         user_schema.roles.append(role)
         _result = self.query_add_record(user_schema)
         return QueryResult(data=_result)
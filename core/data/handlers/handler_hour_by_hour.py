@@ -3,6 +3,23 @@ from core.data.models.request_model import RequestWeekEffModel
 from core.data.types import ShiftType, OutputType
 from core.db.util import generate_custom_id
 
+# Hours of each shift with the planned hours needed to reach it (handle_shift_to_work_hours:
+# 9.25 first, 9.25 + 7.75 second, 17 + 6.25 third)
+SHIFT_HOURS = (
+    (0.0, range(6, 16)),
+    (9.25, range(16, 24)),
+    (17.0, range(0, 6)),
+)
+
+
+def planned_hours_of_day(planned_hours: float) -> set[int]:
+    """Hours of the day covered by a work plan, from the shifts its planned hours reach."""
+    hours = set()
+    for reached_after, shift_hours in SHIFT_HOURS:
+        if planned_hours > reached_after:
+            hours.update(shift_hours)
+    return hours
+
 
 def handle_normalized_hbh(hbh: list[HourByHourModel]) -> list[HourByHourModel]:
     """Handle the normalized hour by hour."""
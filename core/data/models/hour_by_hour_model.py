@@ -35,6 +35,18 @@ class HourByHourModel(BaseModel):
             packing=self.packing
         )
 
+    def to_row(self, factory: str) -> dict:
+        """Column dict for HbhDAO.query_upsert_hours (no ORM object per row)."""
+        return {
+            "factory": factory,
+            "line": self.line,
+            "date": self.date,
+            "hour": self.hour,
+            "smt_in": self.smt_in,
+            "smt_out": self.smt_out,
+            "packing": self.packing
+        }
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -13,4 +13,5 @@ class RequestWeekEffDatesModel(BaseModel):
 class RequestWeekEffModel(BaseModel):
     year: int
     week: int
+    factory: str = "A6"
     dates: list[RequestWeekEffDatesModel]
@@ -50,10 +50,8 @@ class CycleTimeRepository:
 
         except Exception as e:
 
-            self.db.rollback()
+            await self.db.rollback()
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
     async def get_by_week(self, week):
 
@@ -66,8 +64,6 @@ class CycleTimeRepository:
             return records
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
     # async def get_by_week_details(self, week):
     #     try:
@@ -231,8 +227,6 @@ class CycleTimeRepository:
         except Exception as e:
 
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
     async def get_by_id(self, record_id: str):
         try:
@@ -244,8 +238,6 @@ class CycleTimeRepository:
             return {"data": record}
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
     async def update_cycle_time(self, cycle_time_id, cycles):
         try:
@@ -253,8 +245,6 @@ class CycleTimeRepository:
 
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
 
 
@@ -273,8 +263,6 @@ class CycleTimeRepository:
 
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
     async def get_by_id_details(self, record_id):
         """
@@ -290,8 +278,6 @@ class CycleTimeRepository:
 
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            self.db.remove()
 
 
     async def get_by_week_details_group_lines(self, week: int):
@@ -310,8 +296,6 @@ class CycleTimeRepository:
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-        finally:
-            self.db.remove()
 
 
 
@@ -321,7 +305,7 @@ class CycleTimeRepository:
         """
         # Fetch work plan
         work_plan = await self.ct_dao.fetch_get_work_plan_by_str_date_and_line(
-            record.str_date, record.line.name
+            record.str_date, record.line.name, record.line.factory
         )
 
         # Process cycle times
@@ -18,8 +18,6 @@ class LayoutRepository:
         except Exception as e:
             print(e)
             return []
-        finally:
-            self.dao.session.remove()
 
     async def get_layout_by_id(self, layout_id):
         try:
@@ -32,8 +30,6 @@ class LayoutRepository:
         except Exception as e:
             print(e)
             return None
-        finally:
-            self.dao.session.remove()
 
 
 
@@ -48,5 +44,3 @@ class LayoutRepository:
         except Exception as e:
             print(e)
             return None
-        finally:
-            self.dao.session.remove()
\ No newline at end of file
@@ -1,10 +1,8 @@
 import json
+import time
 from io import BytesIO
 from typing import Optional
 
-from openpyxl.workbook import Workbook
-from requests import session
-
 from core.api.querys.hbh_query import GetHbhQuery
 from core.data.dao.hbh_dao import WorkPlanDAO, HbhDAO
 from core.data.handlers.handler_hour_by_hour import handle_weekly_kpi
@@ -13,25 +11,33 @@ from core.data.handlers.translator import translate_hour_by_hour_schema_to_model
 from core.data.models.hour_by_hour_model import HourByHourModel
 from core.data.models.request_model import RequestWeekEffModel
 from core.db.util import scoped_execute, http_handle_error, scoped_execute_async
-from core.features.hour_by_hour.hbh_service import HbhService
+from core.db.database import DBConnection
+from core.features.hour_by_hour.hbh_ingest import parse_ingest_body, validate_ingest_rows
+from core.features.hour_by_hour.hbh_service import HbhService, BackfillReport
+from core.features.job_runner import JobRunner, Job
 from core.util import date_get_range_from_year_and_week, date_str_date_to_excel_date, ExcelDateType, \
     date_str_from_date_obj
 
 
 class HourByHourRepository:
 
-    def __init__(self, db, logger=None):
+    def __init__(self, db, logger=None, async_db=None):
         self.scoped_session = db
         self.dao = WorkPlanDAO(db)
-        self.hbh_dao = HbhDAO(db)
+        self.hbh_dao = HbhDAO(db, async_session=async_db)
         self.service = HbhService(dao=self.hbh_dao)
         self.logger = logger
 
+    def service_for(self, factory: str) -> HbhService:
+        """HbhService of the factory, over the request session."""
+        return self.service if factory == self.service.factory else HbhService(dao=self.hbh_dao, factory=factory)
+
     async def get_kpi_by_week(self, request_body: RequestWeekEffModel) -> dict | None:
 
         db_result = scoped_execute(
-            session_factory=session,
-            query_function=lambda _session: self.dao.get_work_hour_by_week(week=request_body.week),
+            session_factory=self.scoped_session,
+            query_function=lambda _session: self.dao.get_work_hour_by_week(week=request_body.week,
+                                                                             factory=request_body.factory),
             on_complete=lambda query_result: print(f'data fetched'),
             handle_error=http_handle_error
         )
@@ -45,15 +51,61 @@ class HourByHourRepository:
 
         return ie_kpi
 
-    async def update_previews_day(self):
+    async def update_previews_day(self, factory: str = "A6"):
 
-        return self.service.update_previews_day()
+        return await self.service_for(factory).update_previews_day()
 
-    async def update_range_of_dates(self, start_date: str, end_date: str):
+    async def update_range_of_dates(self, start_date: str, end_date: str, factory: str = "A6"):
 
-        _responds = await self.service.update_hours_form_range_of_dates(start_date, end_date)
+        _responds = await self.service_for(factory).update_hours_form_range_of_dates(start_date, end_date)
         return _responds
 
+    def submit_range_of_dates(self, start_date: str, end_date: str, factory: str = "A6", resume: bool = False) -> Job:
+        """
+        Queue a backfill of the range on the JobRunner; follow it with get_job.
+        A request for a range already queued or running returns that job instead of a duplicate.
+        """
+        params = {"start_date": start_date, "end_date": end_date, "factory": factory, "resume": resume}
+        for job in JobRunner().list():
+            if job.name == "hbh_backfill" and not job.finished and job.kwargs == params:
+                return job
+        return JobRunner().submit("hbh_backfill", run_backfill_job, **params)
+
+    def get_job(self, job_id: str) -> Job | None:
+        return JobRunner().get(job_id)
+
+    async def ingest_hours(self, body: bytes, content_type: str | None, factory: str = "A6") -> dict:
+        """
+        Validate a pushed batch of line-hours (JSON array or NDJSON) and upsert it in one transaction.
+        Rows of lines counted by scans are not written; "skipped" reports them per line.
+        Raises IngestError when the batch is rejected; nothing is written then.
+        """
+        started = time.perf_counter()
+        rows = validate_ingest_rows(parse_ingest_body(body, content_type), factory)
+        result, skipped = await self.hbh_dao.query_ingest_hours_async(rows) if rows else (None, [])
+
+        skipped_lines: dict[tuple[str, str], int] = {}
+        for row in skipped:
+            key = (row["factory"], row["line"])
+            skipped_lines[key] = skipped_lines.get(key, 0) + 1
+
+        return {
+            "rows": len(rows),
+            **(result.to_dict() if result else {"inserted": 0, "updated": 0, "unchanged": 0}),
+            "skipped": [
+                {"factory": row_factory, "line": line, "rows": count, "reason": "line counted by scans"}
+                for (row_factory, line), count in sorted(skipped_lines.items())
+            ],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def get_gaps(self, start_date: str, end_date: str, factory: str = "A6") -> list[dict]:
+        """Missing hours of the range grouped by date and line (HbhService.find_gaps)."""
+        gaps: dict[tuple[str, str], list[int]] = {}
+        for date, line, hour in self.service_for(factory).find_gaps(start_date, end_date):
+            gaps.setdefault((date, line), []).append(hour)
+        return [{"date": date, "line": line, "hours": hours} for (date, line), hours in sorted(gaps.items())]
+
     async def get_hour_by_hour_by(self, query: GetHbhQuery) -> list[HourByHourModel] :
         self.logger.info("Processing get_hour_by_hour_by request")
         # Determine date range
@@ -81,15 +133,16 @@ class HourByHourRepository:
         _result: list[HourByHourModel] = []
         if end_date_str:
             await scoped_execute_async(
-                session_factory=self.hbh_dao.session,
-                query_function=lambda s: self.hbh_dao.fetch_get_all_record_by_date_range(start_date_str, end_date_str),
+                session_factory=self.hbh_dao.async_session,
+                query_function=lambda s: self.hbh_dao.fetch_get_all_record_by_date_range(start_date_str, end_date_str,
+                                                                                               query.factory),
                 on_complete=lambda q_res: _result.extend(translate_hour_by_hour_schema_list_to_model_list(q_res)),
                 handle_http_error=http_handle_error
             )
         else:
             await scoped_execute_async(
-                session_factory=self.hbh_dao.session,
-                query_function=lambda s: self.hbh_dao.fetch_get_all_record_by_date(start_date_str),
+                session_factory=self.hbh_dao.async_session,
+                query_function=lambda s: self.hbh_dao.fetch_get_all_record_by_date(start_date_str, query.factory),
                 on_complete=lambda q_res: _result.extend(translate_hour_by_hour_schema_list_to_model_list(q_res)),
                 handle_http_error=http_handle_error
             )
@@ -97,3 +150,16 @@ class HourByHourRepository:
         self.logger.info(f"Returning {len(_result)} records")
 
         return _result
+
+
+async def run_backfill_job(job: Job, start_date: str, end_date: str, factory: str = "A6", resume: bool = False) -> dict:
+    # The job outlives the request: it reads through its own session, not the request scoped one
+    session = DBConnection().get_session()
+    try:
+        report = BackfillReport(factory, start_date, end_date)
+        job.progress = report
+        await HbhService(dao=HbhDAO(session), factory=factory).backfill_range_of_dates(start_date, end_date,
+                                                                                         resume=resume, report=report)
+        return report.to_dict()
+    finally:
+        session.close()
@@ -19,5 +19,3 @@ class PlatformRepository:
         except Exception as e:
             print(e)
             return []
-        finally:
-            self.dao.session.remove()
\ No newline at end of file
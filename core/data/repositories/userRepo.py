@@ -1,20 +1,42 @@
+import asyncio
+
 from core.data.dao.user_dao import UserDAO
 from core.data.models.user_model import CreateUserModel
-from core.db.util import scoped_execute,http_handle_error
+from core.db.database import DBConnection
+from core.db.util import scoped_execute, writer_execute_async, http_handle_error
+from core.security.auth import get_password_hash
+
+
+def _create_user_on_auth_session(session, user: CreateUserModel, hashed_password: str):
+    query_result = UserDAO(session).query_create_user(user, hashed_password)
+    if query_result.data is not None:
+        session.commit()
+    return query_result
 
 
 class UserRepository:
     def __init__(self, db):
+        # Session on the auth database, used for writes only when it is a separate file
         self.user_dao = UserDAO(db)
 
-    def create_user(self, user: CreateUserModel):
-
+    async def create_user(self, user: CreateUserModel):
+        # Hash off the event loop and before queuing: bcrypt is slow and would hold up every write of the batch
+        hashed_password = await asyncio.to_thread(get_password_hash, user.password)
 
-        scoped_execute(
-            session_factory=self.user_dao.session,
-            query_function=lambda _session: self.user_dao.query_create_user(user),
-            on_complete=lambda query_result: print(f"User  added successfully"),
-            handle_error=http_handle_error
-        )
+        if DBConnection().is_auth_split:
+            # Own file and own write lock: commit on the auth session, off the event loop
+            await asyncio.to_thread(
+                scoped_execute,
+                session_factory=self.user_dao.session,
+                query_function=lambda _session: _create_user_on_auth_session(_session, user, hashed_password),
+                on_complete=lambda query_result: print(f"User  added successfully"),
+                handle_error=http_handle_error
+            )
+        else:
+            await writer_execute_async(
+                query_function=lambda _session: UserDAO(_session).query_create_user(user, hashed_password),
+                on_complete=lambda query_result: print(f"User  added successfully"),
+                handle_error=http_handle_error
+            )
 
         return user
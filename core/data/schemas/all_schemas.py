@@ -5,7 +5,7 @@ from sqlalchemy import Column, String, Boolean, ForeignKey, Integer, Index, Chec
 from sqlalchemy.orm import relationship, backref
 
 from core.db.database import Base
-from core.db.util import generate_16_uuid
+from core.db.util import generate_16_uuid, generate_sortable_id
 
 from core.data.schemas.hour_by_hour_schema import PlatformSchema
 from core.data.schemas.user_schema import UserSchema
@@ -225,6 +225,9 @@ class ClusterSchema(Base):
 
 class LayoutSchema(Base):
     __tablename__ = 'layouts'
+    __table_args__ = (
+        Index('ix_layouts_line_id', 'line_id'),
+    )
 
     id = Column(String(16), primary_key=True, default=generate_16_uuid, unique=True, nullable=False)
     index = Column(Integer, nullable=False)
@@ -268,8 +271,12 @@ class LayoutSchema(Base):
 
 class CycleTimeSchema(Base):
     __tablename__ = 'cycle_times'
+    __table_args__ = (
+        Index('ix_cycle_times_cycle_time_record_id', 'cycle_time_record_id'),
+    )
 
-    id = Column(String(16), primary_key=True, default=lambda: str(generate_16_uuid()), unique=True, nullable=False)
+    # Time-ordered key: inserts append to the B-tree (primary key already implies unique)
+    id = Column(String(16), primary_key=True, default=generate_sortable_id, nullable=False)
 
     cycles = Column(JSON, nullable=False, default=list)
 
@@ -306,8 +313,12 @@ class CycleTimeSchema(Base):
 
 class CycleTimeRecordSchema(Base):
     __tablename__ = 'cycle_time_records'
+    __table_args__ = (
+        Index('ix_cycle_time_records_week', 'week'),
+    )
 
-    id = Column(String(16), primary_key=True, default=lambda: str(generate_16_uuid()), unique=True, nullable=False)
+    # Time-ordered key: inserts append to the B-tree (primary key already implies unique)
+    id = Column(String(16), primary_key=True, default=generate_sortable_id, nullable=False)
 
     str_date = Column(String(10), nullable=False)
     week = Column(Integer, nullable=False)
@@ -320,13 +331,15 @@ class CycleTimeRecordSchema(Base):
 
     # Foreign key to Platform
     line_id = Column(String(16), ForeignKey('lines.id'), nullable=False)
-    user_id = Column(String(16), ForeignKey('users.id'), nullable=True)
+    # No database-level foreign key: users may live in the separate auth database
+    user_id = Column(String(16), nullable=True)
     # Foreign key to Platform
     platform_id = Column(String(16), ForeignKey('platforms.id'), nullable=False)
 
     # Use backref to define bidirectional relationship
     line = relationship('LineSchema', backref='cycle_time_records')
-    user = relationship('UserSchema', backref='cycle_time_records')
+    user = relationship('UserSchema', primaryjoin='foreign(CycleTimeRecordSchema.user_id) == UserSchema.id',
+                        backref='cycle_time_records')
 
     cycle_times = relationship(
         'CycleTimeSchema',
@@ -1,11 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, JSON, ForeignKey, UniqueConstraint
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Float, JSON, ForeignKey, UniqueConstraint, Index, DateTime
 from sqlalchemy.orm import relationship
 
 from core.db.database import Base
-from core.db.util import generate_16_uuid
+from core.db.util import generate_16_uuid, generate_sortable_id
 
 class PlatformSchema(Base):
     __tablename__ = 'platforms'
+    __table_args__ = (
+        # Natural key of the seed upsert (PlatformDAO.query_upsert_records)
+        Index('ix_platforms_name_sku', 'name', 'sku', unique=True),
+    )
     id = Column(String(16), primary_key=True, default=lambda: str(generate_16_uuid()), unique=True, nullable=False)
     sku = Column(String(5), nullable=False)
     name = Column(String(50), nullable=False)
@@ -50,6 +56,11 @@ class PlatformSchema(Base):
 
 class WorkPlanSchema(Base):
     __tablename__ = 'work_plans'
+    __table_args__ = (
+        # Also created on existing databases by `run_db.py --db migrate`; one plan per line and day
+        Index('ix_work_plans_factory_date_line', 'factory', 'date', 'line', unique=True),
+        Index('ix_work_plans_factory_week', 'factory', 'week'),
+    )
     id = Column(String(16), primary_key=True, default=lambda: str(generate_16_uuid()), unique=True, nullable=False)
     factory = Column(String(10), nullable=False)
     line = Column(String(3), nullable=False)
@@ -135,10 +146,12 @@ class HourByHourSchema(Base):
     __tablename__ = 'hour_by_hour'
     __table_args__ = (
         UniqueConstraint('factory', 'line' ,'date','hour', name='unique_hbh_record_factory'),
+        Index('ix_hour_by_hour_factory_date_line', 'factory', 'date', 'line', 'hour'),
     )
 
 
-    id = Column(String(16), primary_key=True, default=lambda: str(generate_16_uuid()), unique=True, nullable=False)
+    # Time-ordered key: inserts append to the B-tree (primary key already implies unique)
+    id = Column(String(16), primary_key=True, default=generate_sortable_id, nullable=False)
     factory = Column(String(10), nullable=False)
     line = Column(String(3), nullable=False)
     date = Column(String(10), nullable=False)
@@ -159,3 +172,44 @@ class HourByHourSchema(Base):
             "packing": self.packing
         }
 
+
+class HbhBackfillDaySchema(Base):
+    """
+    Days of hour_by_hour fully fetched from the MES by a range backfill; a resumed backfill skips them.
+    Written in the same transaction as the day's rows.
+    """
+    __tablename__ = 'hbh_backfill_days'
+
+    factory = Column(String(10), primary_key=True)
+    date = Column(String(10), primary_key=True)
+    rows = Column(Integer, nullable=False)
+    completed_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class HbhSyncWatermarkSchema(Base):
+    """
+    Start of the first hour of a line that may still change in hour_by_hour: every hour before it was
+    fetched from the MES after it closed. HbhService.sync_hours fetches from it up to now and advances
+    it in the same transaction as the rows it wrote.
+    """
+    __tablename__ = 'hbh_sync_watermarks'
+
+    factory = Column(String(10), primary_key=True)
+    line = Column(String(3), primary_key=True)
+    synced_until = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class HbhLineSourceSchema(Base):
+    """
+    Lines whose hour_by_hour counters are not written from the MES. A 'scan' line is counted by
+    ScanAggregator (recorded by the flush that first counts it); HbhService leaves it out of every MES
+    write, which would replace the scanned counts and have the next deltas added on top of them.
+    Delete the row to give a line back to the MES.
+    """
+    __tablename__ = 'hbh_line_sources'
+
+    factory = Column(String(10), primary_key=True)
+    line = Column(String(3), primary_key=True)
+    source = Column(String(10), nullable=False)
+    since = Column(DateTime, nullable=False, default=datetime.now)
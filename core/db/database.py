@@ -1,14 +1,68 @@
+import itertools
+import threading
+from contextvars import ContextVar
+
 from sqlalchemy import create_engine, event
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql.util import find_tables
+
+from core.db.instrumentation import install_query_instrumentation
+from core.db.profile import DBProfile
+from core.logger.logger import Logger
 
 # Define the database URL - using SQLite with a local file named `sky_db.db`.
 DATABASE_URL = "sqlite:///./sky_db.db"
 
+# Same database file served through the aiosqlite driver for the async read path.
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+
+logger = Logger.get_logger(name="DBConnection")
 
 # Base class for defining ORM models.
 Base = declarative_base()
 
+# Tables of core/data/schemas/user_schema.py, stored in the auth database when `auth_database` is configured
+AUTH_TABLES = frozenset({'users', 'roles', 'routes', 'permissions', 'user_roles', 'user_routes', 'role_permissions'})
+
+
+def is_auth_table(table) -> bool:
+    return table.name in AUTH_TABLES
+
+
+class RoutingSession(Session):
+    """
+    Session that sends statements on the auth tables to `info['auth_bind']` and everything else to its bind.
+    Without an auth bind it behaves like a plain Session.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        auth_bind = self.info.get('auth_bind')
+        if auth_bind is not None:
+            if mapper is not None and is_auth_table(mapper.local_table):
+                return auth_bind
+            if mapper is None and clause is not None and any(
+                    is_auth_table(table) for table in find_tables(clause, include_crud=True)):
+                return auth_bind
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+# Key of the current request scope. Set by RequestScopeMiddleware, None outside of a request.
+_request_scope: ContextVar[int | None] = ContextVar('db_request_scope', default=None)
+_request_ids = itertools.count(1)
+
+
+def current_request_scope():
+    """
+    Scope function for ScopedSession: one session per request, keyed by contextvars.
+    Outside of a request (scripts, scheduler) it falls back to the thread, as before.
+    """
+    scope = _request_scope.get()
+    return scope if scope is not None else ('thread', threading.get_ident())
+
 class DBConnection:
     """
     Singleton class to manage database connection and session factories.
@@ -25,8 +79,11 @@ class DBConnection:
 
     def _initialize(self):
         """
-        Initialize the database engine, create tables, and setup session factories.
+        Initialize the database engines, check the schema version and setup session factories.
         """
+        # Performance profile (WAL, cache, mmap, busy timeout) for the selected server
+        self.profile = DBProfile.from_config()
+
         self.engine = create_engine(
             DATABASE_URL,
             connect_args={"check_same_thread": False},  # Required for SQLite in multi-threaded apps
@@ -35,24 +92,157 @@ class DBConnection:
 
         @event.listens_for(self.engine, "connect")
         def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA foreign_keys=ON;")
-            cursor.close()
+            # Applied on every new pooled connection
+            self.profile.apply(dbapi_connection)
+
+        # Read-only connections for the API request sessions; writes go through DBWriter
+        self.read_engine = create_engine(
+            DATABASE_URL,
+            connect_args={"check_same_thread": False},
+            echo=False
+        )
+
+        @event.listens_for(self.read_engine, "connect")
+        def set_sqlite_read_pragma(dbapi_connection, connection_record):
+            self.profile.apply(dbapi_connection, read_only=True)
 
+        # Auth tables in their own file: logins do not wait on ingestion write locks
+        if self.profile.auth_database:
+            self.auth_engine = create_engine(
+                f"sqlite:///{self.profile.auth_database}",
+                connect_args={"check_same_thread": False},
+                echo=False
+            )
 
+            @event.listens_for(self.auth_engine, "connect")
+            def set_sqlite_auth_pragma(dbapi_connection, connection_record):
+                self.profile.apply(dbapi_connection)
+        else:
+            self.auth_engine = self.engine
 
-        Base.metadata.create_all(bind=self.engine)
+        # Per-request statement count, DB time and N+1 fingerprints
+        install_query_instrumentation(self.engine)
+        install_query_instrumentation(self.read_engine)
+        if self.is_auth_split:
+            install_query_instrumentation(self.auth_engine)
+
+
+        # Tables are created by run_db.py (create_tables / migrate); startup only reads the schema version
+        self.check_schema_version()
+
+        # Sessions on the main database still reach the auth tables (e.g. CycleTimeRecordSchema.user)
+        auth_info = {'auth_bind': self.auth_engine} if self.is_auth_split else {}
 
         # Create a session factory
         self.SessionFactory = sessionmaker(
             bind=self.engine,
+            class_=RoutingSession,
+            info=auth_info,
+            autoflush=False,
+            autocommit=False
+        )
+
+        self.ReadSessionFactory = sessionmaker(
+            bind=self.read_engine,
+            class_=RoutingSession,
+            info=auth_info,
             autoflush=False,
             autocommit=False
         )
 
-        # Create a thread-safe scoped session
-        self.ScopedSession = scoped_session(self.SessionFactory)
+        # Sessions for /token and the auth dependencies
+        self.AuthSessionFactory = sessionmaker(
+            bind=self.auth_engine,
+            autoflush=False,
+            autocommit=False
+        )
 
+        # Request-scoped session: each request gets its own Session and identity map,
+        # even when all requests share the event loop thread
+        self._stats_lock = threading.Lock()
+        self._sessions_opened = 0
+        self._sessions_closed = 0
+        self._active_scopes = 0
+        self._peak_scopes = 0
+        self.ScopedSession = scoped_session(self._open_scoped_session, scopefunc=current_request_scope)
+
+    @property
+    def is_auth_split(self) -> bool:
+        """True when the auth tables live in their own database file."""
+        return self.auth_engine is not self.engine
+
+    def create_all(self):
+        """
+        Create the missing tables, the auth tables in the auth database when it is split.
+        """
+        if not self.is_auth_split:
+            Base.metadata.create_all(bind=self.engine)
+            return
+        tables = Base.metadata.sorted_tables
+        Base.metadata.create_all(bind=self.engine, tables=[t for t in tables if not is_auth_table(t)])
+        Base.metadata.create_all(bind=self.auth_engine, tables=[t for t in tables if is_auth_table(t)])
+
+    def check_schema_version(self) -> int:
+        """
+        Compare `PRAGMA user_version` with the version this code expects.
+        One PRAGMA instead of the table-by-table inspection of create_all; an outdated database is
+        reported, never altered.
+        """
+        from core.db.migrations import SCHEMA_VERSION, get_schema_version  # migrations imports the schemas
+
+        with self.engine.connect() as connection:
+            version = get_schema_version(connection)
+        if version < SCHEMA_VERSION:
+            logger.warning(f"Database schema version {version} is older than {SCHEMA_VERSION}: "
+                           f"run `python run_db.py --db create_tables` (new database) or `--db migrate`")
+        return version
+
+    def _open_scoped_session(self):
+        with self._stats_lock:
+            self._sessions_opened += 1
+        return self.ReadSessionFactory()
+
+    def begin_request_scope(self):
+        """
+        Open a new request scope. Returns the token needed by `end_request_scope`.
+        Called once per request by RequestScopeMiddleware.
+        """
+        with self._stats_lock:
+            self._active_scopes += 1
+            self._peak_scopes = max(self._peak_scopes, self._active_scopes)
+        return _request_scope.set(next(_request_ids))
+
+    def end_request_scope(self, token):
+        """
+        Close the session of the current request (if one was opened) and restore the previous scope.
+        """
+        try:
+            if self.ScopedSession.registry.has():
+                self.ScopedSession.remove()
+                with self._stats_lock:
+                    self._sessions_closed += 1
+        finally:
+            _request_scope.reset(token)
+            with self._stats_lock:
+                self._active_scopes -= 1
+
+    def pool_stats(self) -> dict:
+        """
+        Connection pool and request-scoped session statistics.
+        `sessions_closed` counts the sessions closed by the middleware at the end of a request.
+        """
+        pool = self.read_engine.pool
+        with self._stats_lock:
+            return {
+                "pool": pool.status(),
+                "pool_size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "sessions_opened": self._sessions_opened,
+                "sessions_closed": self._sessions_closed,
+                "active_request_scopes": self._active_scopes,
+                "peak_request_scopes": self._peak_scopes,
+            }
 
 
     def create_table(self, model):
@@ -71,7 +261,7 @@ class DBConnection:
             DBConnection().create_table(ExampleModel)
         """
         try:
-            model.metadata.create_all(self.engine)  # Create the table for the provided model
+            self.create_all()  # Create the table for the provided model
             print(f"Table for model '{model.__tablename__}' created successfully.")
         except SQLAlchemyError as e:
             print(f"Error creating table for model '{model.__tablename__}': {e}")
@@ -91,13 +281,20 @@ class DBConnection:
         """
         return self.SessionFactory()
 
+    def get_auth_session(self):
+        """
+        Create and return a new session on the auth database (the main database when it is not split).
+        """
+        return self.AuthSessionFactory()
+
     def get_scoped_session(self):
         """
-        Get a thread-safe scoped session.
+        Get the request-scoped, read-only session (thread-scoped outside of a request).
+        Mutations must be submitted to DBWriter.
 
         **Use Case**:
-        - For use in multi-threaded applications or web frameworks where each thread requires its own session.
-        - Example: Flask or FastAPI applications with multiple simultaneous requests.
+        - For FastAPI endpoints: every request gets its own session, even on the event loop thread.
+        - The session is removed by RequestScopeMiddleware when the request ends.
 
         Example:
             session = DBConnection().get_scoped_session()
@@ -106,6 +303,75 @@ class DBConnection:
         return self.ScopedSession
 
 
+class AsyncDBConnection:
+    """
+    Singleton class to manage the asyncio engine (aiosqlite) and AsyncSession factory.
+    Queries awaited through this connection run off the event loop thread, so a slow
+    query no longer blocks other requests served by the same worker.
+    """
+    _instance = None  # Class-level attribute to hold the singleton instance
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AsyncDBConnection, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """
+        Initialize the async engine and the AsyncSession factory.
+        Tables are created by run_db.py; connections are read-only, writes go through DBWriter.
+        """
+        self.profile = DBProfile.from_config()
+
+        self.engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            poolclass=AsyncAdaptedQueuePool,  # Reuse aiosqlite connections instead of one per session
+            echo=False
+        )
+
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def set_sqlite_pragma(dbapi_connection, connection_record):
+            self.profile.apply(dbapi_connection, read_only=True)
+
+        install_query_instrumentation(self.engine.sync_engine)
+
+        auth_info = {}
+        if self.profile.auth_database:
+            self.auth_engine = create_async_engine(
+                f"sqlite+aiosqlite:///{self.profile.auth_database}",
+                poolclass=AsyncAdaptedQueuePool,
+                echo=False
+            )
+
+            @event.listens_for(self.auth_engine.sync_engine, "connect")
+            def set_sqlite_auth_pragma(dbapi_connection, connection_record):
+                self.profile.apply(dbapi_connection, read_only=True)
+
+            install_query_instrumentation(self.auth_engine.sync_engine)
+            # RoutingSession runs inside the AsyncSession and needs the sync facade of the engine
+            auth_info = {'auth_bind': self.auth_engine.sync_engine}
+
+        # expire_on_commit=False: attributes must stay loaded, lazy loads are not allowed under asyncio
+        self.SessionFactory = async_sessionmaker(
+            bind=self.engine,
+            sync_session_class=RoutingSession,
+            info=auth_info,
+            autoflush=False,
+            expire_on_commit=False
+        )
+
+    def get_session(self):
+        """
+        Create and return a new AsyncSession.
+
+        Example:
+            async with AsyncDBConnection().get_session() as session:
+                result = await session.execute(select(Model))
+        """
+        return self.SessionFactory()
+
+
 def get_db_session():
     db = DBConnection().get_session()  # Create a new session
     try:
@@ -118,13 +384,20 @@ def get_db_session():
 
 
 def get_scoped_db_session():
-    db = DBConnection().ScopedSession  # Get the ScopedSession instance
+    db = DBConnection().ScopedSession  # Session of the current request scope
 
     try:
         yield db  # Provide the session to the caller
     except SQLAlchemyError as e:
         db.rollback()  # Rollback transaction in case of an exception
         raise e  # Re-raise the exception
-    finally:
-        db.remove()  # Call remove() to clear the thread-local session
+    # No remove() here: RequestScopeMiddleware closes the session when the request ends
+
 
+async def get_async_db_session():
+    async with AsyncDBConnection().get_session() as db:  # Closed when the request ends
+        try:
+            yield db  # Provide the session to the caller
+        except SQLAlchemyError as e:
+            await db.rollback()  # Rollback transaction in case of an exception
+            raise e  # Re-raise the exception
@@ -0,0 +1,154 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# A statement fingerprint repeated this many times in one request is reported as an N+1 suspect
+N_PLUS_ONE_THRESHOLD = 5
+
+# Statistics of the request being served, set by DBInstrumentationMiddleware
+_request_stats: ContextVar['RequestDBStats | None'] = ContextVar('db_request_stats', default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalize a SQL statement so that executions differing only by parameters compare equal.
+    """
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _IN_LIST.sub("IN (?...)", statement)
+
+
+class RequestDBStats:
+    """
+    Database statistics of a single request: statement count, DB time and repeated fingerprints.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = path
+        self.statements = 0
+        self.db_ms = 0.0
+        self.fingerprints = Counter()
+        self._lock = threading.Lock()  # Sync dependencies run in the threadpool
+
+    def record(self, statement: str, elapsed_ms: float):
+        with self._lock:
+            self.statements += 1
+            self.db_ms += elapsed_ms
+            self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        """Fingerprints executed at least `threshold` times (the N+1 signal)."""
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header."""
+        return (f'db;dur={self.db_ms:.2f};desc="{self.statements} queries", '
+                f'db-repeated;desc="{len(self.repeated())} N+1 suspects"')
+
+    def to_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "route": self.route,
+            "path": self.path,
+            "statements": self.statements,
+            "db_ms": round(self.db_ms, 3),
+            "repeated": self.repeated(),
+        }
+
+
+class DBStatsRegistry:
+    """
+    Aggregates finished requests per route and keeps the most recent ones for /debug/db-stats.
+    """
+
+    def __init__(self, history: int = 200):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self._routes = {}
+
+    def add(self, stats: RequestDBStats):
+        with self._lock:
+            self._recent.append(stats.to_dict())
+            key = f"{stats.method} {stats.route}"
+            route = self._routes.setdefault(key, {
+                "requests": 0,
+                "statements": 0,
+                "db_ms": 0.0,
+                "max_statements": 0,
+                "n_plus_one_suspects": {},
+            })
+            route["requests"] += 1
+            route["statements"] += stats.statements
+            route["db_ms"] += stats.db_ms
+            route["max_statements"] = max(route["max_statements"], stats.statements)
+            for sql, count in stats.repeated().items():
+                route["n_plus_one_suspects"][sql] = max(route["n_plus_one_suspects"].get(sql, 0), count)
+
+    def summary(self) -> dict:
+        with self._lock:
+            routes = {
+                key: {
+                    **route,
+                    "db_ms": round(route["db_ms"], 3),
+                    "avg_statements": round(route["statements"] / route["requests"], 2),
+                    "avg_db_ms": round(route["db_ms"] / route["requests"], 3),
+                }
+                for key, route in self._routes.items()
+            }
+            return {"routes": routes, "recent": list(self._recent)}
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._routes.clear()
+
+
+# Process-wide registry
+db_stats_registry = DBStatsRegistry()
+
+
+def begin_request_stats(method: str, path: str):
+    """Start collecting statistics for the current request. Returns (stats, token)."""
+    stats = RequestDBStats(method, path)
+    return stats, _request_stats.set(stats)
+
+
+def end_request_stats(token):
+    _request_stats.reset(token)
+
+
+def install_query_instrumentation(engine):
+    """
+    Hook before/after_cursor_execute on a (sync) engine. For an AsyncEngine pass `engine.sync_engine`.
+    Statements executed outside of a request are not recorded.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.record(statement, (time.perf_counter() - started) * 1000)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute is not called for failed statements
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
@@ -0,0 +1,327 @@
+import calendar
+from datetime import datetime
+
+from sqlalchemy import select, and_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.schema import CreateTable
+
+from core.data.schemas.all_schemas import CycleTimeRecordSchema, CycleTimeSchema, LayoutSchema
+from core.data.schemas.hour_by_hour_schema import WorkPlanSchema, PlatformSchema, HourByHourSchema
+from core.db.util import generate_sortable_id, is_sortable_id
+
+
+class Migration:
+    """
+    A versioned, idempotent schema change. The applied version is stored in `PRAGMA user_version`.
+    """
+
+    def __init__(self, version: int, name: str, statements: list[str]):
+        self.version = version
+        self.name = name
+        self.statements = statements
+
+    def __str__(self):
+        return f"Migration({self.version}: {self.name})"
+
+
+# Index names match the Index() declarations in the schemas, so create_all and migrate agree.
+MIGRATIONS: list[Migration] = [
+    Migration(1, 'hot_predicate_indexes', [
+        # get_work_hour_by_week, fetch_get_work_plan_by_str_date_and_line, query_create_record
+        "CREATE INDEX IF NOT EXISTS ix_work_plans_date_line_factory ON work_plans (date, line, factory)",
+        "CREATE INDEX IF NOT EXISTS ix_work_plans_week ON work_plans (week)",
+        # fetch_get_by_week
+        "CREATE INDEX IF NOT EXISTS ix_cycle_time_records_week ON cycle_time_records (week)",
+        # cycle_times joined to their record
+        "CREATE INDEX IF NOT EXISTS ix_cycle_times_cycle_time_record_id ON cycle_times (cycle_time_record_id)",
+        # fetch_get_layout_by_line_id
+        "CREATE INDEX IF NOT EXISTS ix_layouts_line_id ON layouts (line_id)",
+        # fetch_get_all_record_by_date(_range) and the work plan join on (line, date)
+        "CREATE INDEX IF NOT EXISTS ix_hour_by_hour_date_line ON hour_by_hour (date, line, hour)",
+    ]),
+    Migration(2, 'hbh_backfill_days', [
+        # HbhBackfillDaySchema: completed days of the range backfill (resume)
+        """
+        CREATE TABLE IF NOT EXISTS hbh_backfill_days (
+            factory VARCHAR(10) NOT NULL,
+            date VARCHAR(10) NOT NULL,
+            rows INTEGER NOT NULL,
+            completed_at DATETIME NOT NULL,
+            PRIMARY KEY (factory, date)
+        )
+        """,
+    ]),
+    Migration(3, 'factory_leading_indexes', [
+        # Every hot query filters on one factory: leading with it keeps A5 and A6 rows apart in the
+        # index, so a query of one factory never walks the other's entries
+        "CREATE INDEX IF NOT EXISTS ix_work_plans_factory_date_line ON work_plans (factory, date, line)",
+        "CREATE INDEX IF NOT EXISTS ix_work_plans_factory_week ON work_plans (factory, week)",
+        "CREATE INDEX IF NOT EXISTS ix_hour_by_hour_factory_date_line ON hour_by_hour (factory, date, line, hour)",
+        "DROP INDEX IF EXISTS ix_work_plans_date_line_factory",
+        "DROP INDEX IF EXISTS ix_work_plans_week",
+        "DROP INDEX IF EXISTS ix_hour_by_hour_date_line",
+    ]),
+    Migration(4, 'hbh_sync_watermarks', [
+        # HbhSyncWatermarkSchema: per factory/line start of the hours HbhService.sync_hours fetches
+        """
+        CREATE TABLE IF NOT EXISTS hbh_sync_watermarks (
+            factory VARCHAR(10) NOT NULL,
+            line VARCHAR(3) NOT NULL,
+            synced_until DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (factory, line)
+        )
+        """,
+    ]),
+    Migration(5, 'hbh_line_sources', [
+        # HbhLineSourceSchema: lines counted by ScanAggregator, left out of the MES writes
+        """
+        CREATE TABLE IF NOT EXISTS hbh_line_sources (
+            factory VARCHAR(10) NOT NULL,
+            line VARCHAR(3) NOT NULL,
+            source VARCHAR(10) NOT NULL,
+            since DATETIME NOT NULL,
+            PRIMARY KEY (factory, line)
+        )
+        """,
+    ]),
+    Migration(6, 'seed_natural_keys', [
+        # Seeds upsert on the natural keys. Duplicates left by earlier seeds are merged into the oldest
+        # row (the one the .first() lookups read and query_create_record updated), references included.
+        """
+        UPDATE work_plans SET platform_id = (
+            SELECT kept.id FROM platforms AS dup JOIN platforms AS kept ON kept.name = dup.name AND kept.sku = dup.sku
+            WHERE dup.id = work_plans.platform_id ORDER BY kept.rowid LIMIT 1
+        )
+        WHERE platform_id IN (SELECT id FROM platforms)
+        """,
+        """
+        UPDATE cycle_time_records SET platform_id = (
+            SELECT kept.id FROM platforms AS dup JOIN platforms AS kept ON kept.name = dup.name AND kept.sku = dup.sku
+            WHERE dup.id = cycle_time_records.platform_id ORDER BY kept.rowid LIMIT 1
+        )
+        WHERE platform_id IN (SELECT id FROM platforms)
+        """,
+        """
+        DELETE FROM platforms WHERE EXISTS (
+            SELECT 1 FROM platforms AS kept
+            WHERE kept.name = platforms.name AND kept.sku = platforms.sku AND kept.rowid < platforms.rowid
+        )
+        """,
+        """
+        DELETE FROM work_plans WHERE EXISTS (
+            SELECT 1 FROM work_plans AS kept
+            WHERE kept.factory = work_plans.factory AND kept.date = work_plans.date AND kept.line = work_plans.line
+              AND kept.rowid < work_plans.rowid
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_platforms_name_sku ON platforms (name, sku)",
+        "DROP INDEX IF EXISTS ix_work_plans_factory_date_line",
+        "CREATE UNIQUE INDEX ix_work_plans_factory_date_line ON work_plans (factory, date, line)",
+    ]),
+]
+
+# Latest schema version known by this code
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def apply_migrations(engine) -> list[Migration]:
+    """
+    Apply every migration newer than the database version, each in its own transaction.
+
+    :param engine: SQLAlchemy engine of the database to migrate.
+    :return: The migrations that were applied.
+    """
+    applied = []
+    with engine.connect() as connection:
+        current = get_schema_version(connection)
+
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        with engine.begin() as connection:
+            for statement in migration.statements:
+                connection.exec_driver_sql(statement)
+            # PRAGMA does not accept bound parameters; version is an int from MIGRATIONS
+            connection.exec_driver_sql(f"PRAGMA user_version = {int(migration.version)}")
+        applied.append(migration)
+
+    return applied
+
+
+def dao_query_statements() -> dict:
+    """
+    Representative statements for the hot DAO queries, used to print their query plans.
+    """
+    details = (
+        joinedload(CycleTimeRecordSchema.line),
+        joinedload(CycleTimeRecordSchema.platform),
+        joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout).joinedload(
+            LayoutSchema.station),
+        joinedload(CycleTimeRecordSchema.cycle_times).joinedload(CycleTimeSchema.layout).joinedload(
+            LayoutSchema.layout_section),
+    )
+    return {
+        "WorkPlanDAO.get_work_hour_by_week": (
+            select(WorkPlanSchema, PlatformSchema, HourByHourSchema)
+            .join(PlatformSchema, WorkPlanSchema.platform_id == PlatformSchema.id)
+            .join(HourByHourSchema, and_(WorkPlanSchema.factory == HourByHourSchema.factory,
+                                         WorkPlanSchema.line == HourByHourSchema.line,
+                                         WorkPlanSchema.date == HourByHourSchema.date))
+            .filter(WorkPlanSchema.factory == 'A6', WorkPlanSchema.week == 51)
+        ),
+        "WorkPlanDAO.query_create_record": (
+            select(WorkPlanSchema).filter(WorkPlanSchema.date == '2024-12-16', WorkPlanSchema.line == 'J01',
+                                          WorkPlanSchema.factory == 'A6').limit(1)
+        ),
+        "CycleTimeDAO.fetch_get_work_plan_by_str_date_and_line": (
+            select(WorkPlanSchema).options(joinedload(WorkPlanSchema.platform))
+            .filter_by(factory='A6', date='2024-12-16', line='J01').limit(1)
+        ),
+        "CycleTimeDAO.fetch_get_by_week": (
+            select(CycleTimeRecordSchema).options(*details).filter_by(week=51)
+        ),
+        "LayoutDAO.fetch_get_layout_by_line_id": (
+            select(LayoutSchema).options(joinedload(LayoutSchema.station), joinedload(LayoutSchema.layout_section))
+            .filter_by(line_id='line')
+        ),
+        "HbhDAO.fetch_get_all_record_by_date_range": (
+            select(HourByHourSchema).filter(HourByHourSchema.date.between('2024-12-16', '2024-12-22'),
+                                            HourByHourSchema.factory == 'A6')
+        ),
+    }
+
+
+def explain_query_plans(engine) -> dict[str, list[str]]:
+    """
+    Run EXPLAIN QUERY PLAN for every statement of `dao_query_statements`.
+
+    :return: Mapping of query name to plan lines (e.g. 'SCAN work_plans', 'SEARCH ... USING INDEX ...').
+    """
+    plans = {}
+    with engine.connect() as connection:
+        for name, statement in dao_query_statements().items():
+            compiled = statement.compile(dialect=engine.dialect)
+            # SQLite compiles to positional (qmark) parameters
+            params = tuple(compiled.params[key] for key in compiled.positiontup)
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+
+def print_query_plans(title: str, plans: dict[str, list[str]]):
+    print(f"--- {title} ---")
+    for name, lines in plans.items():
+        print(name)
+        for line in lines:
+            print(f"    {line}")
+
+
+def _epoch_ms(value: datetime) -> int:
+    return calendar.timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def _rebuild_table(connection, table, id_map: dict[str, str], fk_column: str = None, fk_map: dict = None):
+    """
+    Copy `table` into a new table in new-key order, swap it in and recreate its indexes.
+    Runs inside the caller's transaction with foreign keys disabled.
+    """
+    name = table.name
+    ddl = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(ddl.replace(f"CREATE TABLE {name} ", f"CREATE TABLE {name}__rekey ", 1))
+
+    columns = [column.name for column in table.columns]
+    old_rows = connection.exec_driver_sql(f"SELECT {', '.join(columns)} FROM {name}").fetchall()
+    id_index = columns.index("id")
+    fk_index = columns.index(fk_column) if fk_column else None
+
+    rows = []
+    for row in old_rows:
+        row = list(row)
+        row[id_index] = id_map.get(row[id_index], row[id_index])
+        if fk_index is not None:
+            row[fk_index] = fk_map.get(row[fk_index], row[fk_index])
+        rows.append(tuple(row))
+    # Insert in key order: the new B-tree is built by appends only
+    rows.sort(key=lambda r: r[id_index])
+
+    placeholders = ", ".join("?" for _ in columns)
+    connection.exec_driver_sql(f"INSERT INTO {name}__rekey ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    connection.exec_driver_sql(f"DROP TABLE {name}")
+    connection.exec_driver_sql(f"ALTER TABLE {name}__rekey RENAME TO {name}")
+    for index in table.indexes:
+        index.create(connection)
+
+
+def rekey_tables(engine) -> dict[str, int]:
+    """
+    Migration path to time-ordered primary keys (generate_sortable_id) for the high-insert tables.
+
+    Rows whose id is not sortable yet get a new id derived from their own time (cycle_time_records:
+    created_at, cycle_times: their record's created_at, hour_by_hour: date + hour), references in
+    cycle_times.cycle_time_record_id are rewritten, and each table is rebuilt in key order, which also
+    drops the redundant unique index of the old `unique=True` primary keys. Everything runs in one
+    transaction and the remapped reference is verified with `PRAGMA foreign_key_check`. Already re-keyed tables are skipped,
+    so the command can be re-run.
+
+    Note: re-keyed cycle_time_records get new ids; links that embed an old record id stop working.
+
+    :return: Number of re-keyed rows per table.
+    """
+    records = CycleTimeRecordSchema.__table__
+    cycle_times = CycleTimeSchema.__table__
+    hours = HourByHourSchema.__table__
+    counts = {}
+
+    with engine.connect() as connection:
+        # foreign_keys cannot change inside a transaction; the rebuild drops referenced tables
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            record_times = {}
+            record_map = {}
+            for record_id, created_at in connection.execute(select(records.c.id, records.c.created_at)):
+                record_times[record_id] = created_at
+                if not is_sortable_id(record_id):
+                    record_map[record_id] = generate_sortable_id(_epoch_ms(created_at))
+
+            cycle_map = {}
+            for cycle_id, record_id in connection.execute(select(cycle_times.c.id, cycle_times.c.cycle_time_record_id)):
+                if not is_sortable_id(cycle_id):
+                    created_at = record_times.get(record_id)
+                    cycle_map[cycle_id] = generate_sortable_id(_epoch_ms(created_at) if created_at else None)
+
+            hour_map = {}
+            for hour_id, date, hour in connection.execute(select(hours.c.id, hours.c.date, hours.c.hour)):
+                if not is_sortable_id(hour_id):
+                    started = datetime.strptime(date, "%Y-%m-%d").replace(hour=int(hour))
+                    hour_map[hour_id] = generate_sortable_id(_epoch_ms(started))
+
+            if record_map:
+                _rebuild_table(connection, records, record_map)
+            if record_map or cycle_map:
+                _rebuild_table(connection, cycle_times, cycle_map, "cycle_time_record_id", record_map)
+            if hour_map:
+                _rebuild_table(connection, hours, hour_map)
+
+            # Only the remapped reference is checked; other dangling references predate the migration
+            violations = [row for row in connection.exec_driver_sql(f"PRAGMA foreign_key_check({cycle_times.name})")
+                          if row[2] == records.name]
+            if violations:
+                raise RuntimeError(f"Foreign key violations after re-keying: {violations[:5]}")
+
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+
+    counts[records.name] = len(record_map)
+    counts[cycle_times.name] = len(cycle_map)
+    counts[hours.name] = len(hour_map)
+    return counts
@@ -0,0 +1,113 @@
+import configparser
+import os
+
+# Path of the server configuration shared with run_api.py
+CONFIG_PATH = 'config/api_config.ini'
+
+# Environment variable used to select the server profile (set by run_api.py)
+SERVER_ENV = 'SKY_API_SERVER'
+
+
+class DBProfile:
+    """
+    SQLite performance profile applied to every pooled connection.
+
+    Each attribute maps to one PRAGMA. A value of None leaves the SQLite default untouched,
+    so an empty profile behaves exactly like the original `foreign_keys=ON` only setup.
+
+    Profiles are read from `config/api_config.ini` sections named `db_<server>`:
+
+        [db_production]
+        journal_mode = WAL
+        synchronous = NORMAL
+        cache_size = -65536
+        mmap_size = 268435456
+        temp_store = MEMORY
+        busy_timeout = 5000
+        auth_database = ./sky_auth.db
+
+    `auth_database` is not a PRAGMA: when set, the users/roles/routes/permissions tables live in
+    that file with their own engine, so logins do not wait on ingestion write locks.
+    """
+
+    # Order matters: journal_mode must be set before synchronous is meaningful
+    PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+
+    def __init__(
+            self,
+            name: str = 'baseline',
+            journal_mode: str | None = None,
+            synchronous: str | None = None,
+            cache_size: int | None = None,
+            mmap_size: int | None = None,
+            temp_store: str | None = None,
+            busy_timeout: int | None = None,
+            auth_database: str | None = None,
+    ):
+        self.name = name
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.temp_store = temp_store
+        self.busy_timeout = busy_timeout
+        self.auth_database = auth_database
+
+    @classmethod
+    def from_config(cls, server: str = None, path: str = CONFIG_PATH) -> 'DBProfile':
+        """
+        Load the profile for a server from the config file.
+
+        :param server: Server name (house, production, ...). Defaults to $SKY_API_SERVER or 'default'.
+        :param path: Path to the ini file.
+        :return: The profile, or an empty (baseline) profile if the section does not exist.
+        """
+        server = server or os.environ.get(SERVER_ENV, 'default')
+        section = f'db_{server}'
+
+        configs = configparser.ConfigParser()
+        configs.read(path)
+
+        if not configs.has_section(section):
+            return cls(name='baseline')
+
+        return cls(
+            name=section,
+            journal_mode=configs.get(section, 'journal_mode', fallback=None),
+            synchronous=configs.get(section, 'synchronous', fallback=None),
+            cache_size=configs.getint(section, 'cache_size', fallback=None),
+            mmap_size=configs.getint(section, 'mmap_size', fallback=None),
+            temp_store=configs.get(section, 'temp_store', fallback=None),
+            busy_timeout=configs.getint(section, 'busy_timeout', fallback=None),
+            auth_database=configs.get(section, 'auth_database', fallback=None),
+        )
+
+    def pragmas(self, read_only: bool = False) -> list[str]:
+        """
+        Return the PRAGMA statements for this profile, foreign keys always first.
+
+        :param read_only: Append `query_only=ON` so the connection rejects any write (reader connections).
+        """
+        statements = ["PRAGMA foreign_keys=ON;"]
+        for pragma in self.PRAGMAS:
+            value = getattr(self, pragma)
+            if value is not None:
+                statements.append(f"PRAGMA {pragma}={value};")
+        if read_only:
+            statements.append("PRAGMA query_only=ON;")
+        return statements
+
+    def apply(self, dbapi_connection, read_only: bool = False):
+        """Execute the profile PRAGMAs on a raw DBAPI connection."""
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in self.pragmas(read_only=read_only):
+                cursor.execute(statement)
+                # journal_mode returns a row; drain it so the statement completes
+                cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def __str__(self):
+        values = ", ".join(f"{p}={getattr(self, p)}" for p in self.PRAGMAS if getattr(self, p) is not None)
+        return f"DBProfile({self.name}: {values or 'sqlite defaults'})"
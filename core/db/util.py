@@ -1,5 +1,7 @@
 import random
 import string
+import threading
+import time
 import uuid
 import base64
 from enum import Enum
@@ -24,6 +26,68 @@ def generate_16_uuid():
     return short_uuid
 
 
+# Crockford base32: ASCII order equals numeric order, no I, L, O, U
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_SORTABLE_RANDOM_BITS = 30
+_sortable_lock = threading.Lock()
+_last_sortable = (0, 0)  # (timestamp ms, random part) of the last generated id
+
+
+def generate_sortable_id(timestamp_ms: int | None = None) -> str:
+    """
+    Time-ordered 16 character id (ULID-like) that fits the existing String(16) keys.
+
+    10 characters of millisecond timestamp (48 bits) followed by 6 characters (30 bits) that are random
+    for a new millisecond and incremented within the same one. Ids generated by a process are strictly
+    increasing, so inserts append to the right edge of the primary key B-tree instead of splitting
+    random pages, and ids sort in creation order.
+
+    :param timestamp_ms: Use this timestamp instead of now (re-keying historical rows).
+    """
+    global _last_sortable
+
+    if timestamp_ms is None:
+        now = time.time_ns() // 1_000_000
+        with _sortable_lock:
+            last_ms, last_random = _last_sortable
+            if now <= last_ms:
+                # Same millisecond (or clock went back): keep ordering by incrementing
+                now, value = last_ms, last_random + 1
+                if value >= 1 << _SORTABLE_RANDOM_BITS:
+                    now, value = last_ms + 1, random.getrandbits(_SORTABLE_RANDOM_BITS - 1)
+            else:
+                value = random.getrandbits(_SORTABLE_RANDOM_BITS - 1)  # Headroom for increments
+            _last_sortable = (now, value)
+        timestamp_ms = now
+    else:
+        value = random.getrandbits(_SORTABLE_RANDOM_BITS)
+
+    number = (timestamp_ms << _SORTABLE_RANDOM_BITS) | value
+    chars = []
+    for _ in range(16):
+        chars.append(_CROCKFORD[number & 31])
+        number >>= 5
+    return ''.join(reversed(chars))
+
+
+def sortable_id_timestamp(value: str) -> int:
+    """Millisecond timestamp encoded in a generate_sortable_id value."""
+    number = 0
+    for char in value[:10]:
+        number = (number << 5) | _CROCKFORD.index(char)
+    return number  # The first 10 characters are exactly the timestamp bits
+
+
+def is_sortable_id(value: str) -> bool:
+    """
+    True if `value` looks like a generate_sortable_id value: Crockford characters only and a timestamp
+    between 2020 and tomorrow (a random base64 id passes both checks with negligible probability).
+    """
+    if len(value) != 16 or any(char not in _CROCKFORD for char in value):
+        return False
+    return 1_577_836_800_000 <= sortable_id_timestamp(value) <= time.time_ns() // 1_000_000 + 86_400_000
+
+
 def generate_custom_id(length=15):
     # Define the characters for the custom ID
     characters = string.ascii_letters + string.digits
@@ -67,6 +131,26 @@ class QueryResult:
         return f"QueryResult(data={self.data}, error={self.error})"
 
 
+class UpsertResult:
+    """
+    Row counts of a bulk upsert.
+    """
+    def __init__(self, inserted: int = 0, updated: int = 0, unchanged: int = 0):
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+
+    @property
+    def total(self):
+        return self.inserted + self.updated + self.unchanged
+
+    def to_dict(self):
+        return {"inserted": self.inserted, "updated": self.updated, "unchanged": self.unchanged}
+
+    def __str__(self):
+        return f"UpsertResult(inserted={self.inserted}, updated={self.updated}, unchanged={self.unchanged})"
+
+
 
 
 def safe_execute(session_factory, query_function, *args, on_complete=None, on_error=None, on_finally=None, **kwargs):
@@ -257,15 +341,18 @@ async def scoped_execute_async(
         return query_result  # Return result if no on_complete
 
     except SQLAlchemyError as e:
+        # Rollback first: handle_http_error raises an HTTPException
+        if isinstance(session, AsyncSession):
+            await session.rollback()
+        else:
+            session.rollback()
+
         # Invoke handle_error if provided
         if handle_http_error:
             handle_http_error(e)
         else:
             raise e  # Re-raise the exception if no error handler is specified
 
-        # Rollback transaction on error
-        session.rollback()
-
     finally:
         # Invoke on_finally if provided
         if on_finally:
@@ -274,5 +361,49 @@ async def scoped_execute_async(
         # Cleanup session (remove for ScopedSession, close otherwise)
         if hasattr(session, "remove"):  # ScopedSession
             session.remove()
-        else:  # AsyncSession
+        elif isinstance(session, AsyncSession):
+            await session.close()
+        else:  # Regular Session
             session.close()
+
+
+async def writer_execute_async(
+        query_function,
+        *args,
+        on_complete=None,
+        handle_error=None,
+        **kwargs
+):
+    """
+    Run a mutation as a DBWriter job and await its group commit.
+
+    Args:
+        query_function: Function that executes the mutation, taking the writer session as the first argument.
+            It must flush, not commit: the writer commits the whole batch.
+        on_complete: Callback for successful execution, receives the result.
+        handle_error: Callback for handling errors, receives the QueryResultError or the exception.
+        *args, **kwargs: Additional arguments passed to the query function.
+
+    Returns:
+        The result of the query function, if successful.
+    """
+    from core.db.writer import DBWriter  # The writer imports core.db.database
+
+    try:
+        query_result = await DBWriter().execute_async(query_function, *args, **kwargs)
+    except SQLAlchemyError as e:
+        if handle_error:
+            handle_error(e)
+            return None
+        raise e
+
+    # Check for query errors
+    if hasattr(query_result, 'data') and query_result.data is None:
+        if handle_error:
+            handle_error(query_result.error)
+        return None
+
+    if on_complete:
+        on_complete(query_result)
+
+    return query_result
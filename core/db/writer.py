@@ -0,0 +1,234 @@
+import asyncio
+import atexit
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from core.db.database import DATABASE_URL
+from core.db.instrumentation import install_query_instrumentation
+from core.db.profile import DBProfile
+from core.logger.logger import Logger
+
+# Upper bound of jobs committed together in one transaction
+GROUP_COMMIT_MAX_JOBS = 256
+
+# How long the writer keeps collecting jobs after the first one arrives (seconds)
+GROUP_COMMIT_WINDOW = 0.002
+
+# Retries of a whole batch when another process holds the write lock past busy_timeout
+LOCKED_RETRIES = 3
+
+_STOP = object()
+
+logger = Logger.get_logger(name="DBWriter")
+
+
+class _WriteJob:
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        # Statements run in the writer thread but are attributed to the submitting request
+        self.context = contextvars.copy_context()
+
+    def run(self, session):
+        return self.context.run(self.fn, session, *self.args, **self.kwargs)
+
+
+class DBWriter:
+    """
+    Singleton that serializes every mutation of the process through one connection.
+
+    Callers submit jobs, functions that receive a Session and must not commit. A dedicated thread
+    drains the queue and runs the jobs it finds (up to GROUP_COMMIT_MAX_JOBS) in one BEGIN IMMEDIATE
+    transaction, each job inside its own SAVEPOINT, and commits once (group commit). A failing job
+    only rolls back its savepoint; the rest of the batch is still committed.
+
+    Example:
+        def add_platform(session, platform):
+            session.add(platform)
+            session.flush()
+            return platform.id
+
+        platform_id = DBWriter().execute(add_platform, platform)          # blocking
+        platform_id = await DBWriter().execute_async(add_platform, platform)  # from async code
+    """
+    _instance = None  # Class-level attribute to hold the singleton instance
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(DBWriter, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self, url: str = DATABASE_URL, profile: DBProfile | None = None):
+        self.profile = profile or DBProfile.from_config()
+
+        # One connection owned by the writer thread
+        self.engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+            echo=False
+        )
+
+        @event.listens_for(self.engine, "connect")
+        def set_sqlite_pragma(dbapi_connection, connection_record):
+            self.profile.apply(dbapi_connection)
+            # Let SQLAlchemy emit BEGIN/SAVEPOINT instead of the pysqlite implicit transactions
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(self.engine, "begin")
+        def do_begin(connection):
+            # Take the write lock up front: waits on busy_timeout instead of failing on lock upgrade
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+        install_query_instrumentation(self.engine)
+
+        self.SessionFactory = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._jobs = 0
+        self._failed_jobs = 0
+        self._commits = 0
+        self._largest_batch = 0
+        # Time spent inside committed write transactions (BEGIN IMMEDIATE .. COMMIT), i.e. holding the lock
+        self._transaction_seconds = 0.0
+        self._longest_transaction = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Queue a job and return a Future resolved with its return value once the batch is committed.
+        """
+        self._ensure_started()
+        job = _WriteJob(fn, args, kwargs)
+        self._queue.put(job)
+        return job.future
+
+    def execute(self, fn, *args, timeout: float | None = None, **kwargs):
+        """Submit a job and block until it is committed. Re-raises the job exception."""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    async def execute_async(self, fn, *args, **kwargs):
+        """Submit a job and await its commit without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stop(self, timeout: float | None = 10):
+        """Commit what is queued and stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "jobs": self._jobs,
+                "failed_jobs": self._failed_jobs,
+                "commits": self._commits,
+                "jobs_per_commit": round(self._jobs / self._commits, 2) if self._commits else 0,
+                "largest_batch": self._largest_batch,
+                "transaction_ms_avg": round(self._transaction_seconds * 1000 / self._commits, 2) if self._commits else 0,
+                "transaction_ms_max": round(self._longest_transaction * 1000, 2),
+                "queued": self._queue.qsize(),
+            }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX_JOBS:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch: list[_WriteJob]):
+        for attempt in range(LOCKED_RETRIES + 1):
+            session = self.SessionFactory()
+            outcomes = []
+            started = time.perf_counter()
+            try:
+                for job in batch:
+                    try:
+                        with session.begin_nested():
+                            outcomes.append((job, job.run(session), None))
+                    except OperationalError as e:
+                        if "locked" in str(e):
+                            raise
+                        outcomes.append((job, None, e))
+                    except Exception as e:
+                        outcomes.append((job, None, e))
+                session.commit()
+                elapsed = time.perf_counter() - started
+            except OperationalError as e:
+                session.rollback()
+                if "locked" in str(e) and attempt < LOCKED_RETRIES:
+                    logger.warning(f"Write lock busy, retrying batch of {len(batch)} ({attempt + 1})")
+                    continue
+                self._fail(batch, e)
+                return
+            except Exception as e:
+                session.rollback()
+                self._fail(batch, e)
+                return
+            finally:
+                session.close()
+
+            with self._stats_lock:
+                self._jobs += len(batch)
+                self._failed_jobs += sum(1 for _, _, error in outcomes if error is not None)
+                self._commits += 1
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._transaction_seconds += elapsed
+                self._longest_transaction = max(self._longest_transaction, elapsed)
+
+            for job, result, error in outcomes:
+                if error is None:
+                    job.future.set_result(result)
+                else:
+                    job.future.set_exception(error)
+            return
+
+    def _fail(self, batch: list[_WriteJob], error: Exception):
+        logger.error(f"Group commit of {len(batch)} jobs failed: {error}")
+        with self._stats_lock:
+            self._jobs += len(batch)
+            self._failed_jobs += len(batch)
+        for job in batch:
+            job.future.set_exception(error)
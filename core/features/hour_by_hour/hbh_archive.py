@@ -0,0 +1,129 @@
+import gzip
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from core.data.dao.hbh_dao import HbhDAO
+from core.db.util import UpsertResult
+from core.db.writer import DBWriter
+from core.features.util.date_util import transform_date_to_mackenzie, transform_range_of_dates
+
+# Directory of the raw MES response archive; archiving is off when unset
+MES_ARCHIVE_ENV = 'SKY_MES_ARCHIVE'
+
+# Days parsed at the same time by replay_archive (one process each)
+REPLAY_WORKERS = os.cpu_count() or 2
+
+# {start_hour}-{end_hour}_{TRANSTYPE}.json.gz, or {start_hour}-{end_day}{end_hour}_... across days
+_ENTRY = re.compile(r"^(\d{2})-(\d{8})?(\d{2})_([A-Z]+)\.json\.gz$")
+
+# TransType value -> response key of get_transactions
+_FIELD_BY_TRANS_TYPE = {'INPUT': 'smt_in', 'OUTPUT': 'smt_out', 'PACKING': 'packing'}
+
+
+class MesArchive:
+    """
+    Raw MES responses stored gzip-compressed on local disk, one file per (day, hour range, transtype):
+
+        <root>/20241216/00-23_INPUT.json.gz
+        <root>/20241216/08-08_PACKING.json.gz
+
+    Factories other than A6 archive under <root>/<factory>/ (for_factory).
+    A later response for the same key replaces the file (written to a temp file, then renamed).
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    @classmethod
+    def for_factory(cls, root: str, factory: str = "A6") -> 'MesArchive':
+        return cls(root if factory == "A6" else os.path.join(root, factory))
+
+    @classmethod
+    def from_env(cls, factory: str = "A6") -> 'MesArchive | None':
+        root = os.environ.get(MES_ARCHIVE_ENV)
+        return cls.for_factory(root, factory) if root else None
+
+    def path(self, start_day: str, end_day: str, start_hour: str, end_hour: str, trans_type: str) -> str:
+        end = end_hour if end_day == start_day else f"{end_day}{end_hour}"
+        return os.path.join(self.root, start_day, f"{start_hour}-{end}_{trans_type}.json.gz")
+
+    def save(self, body: bytes, start_day: str, end_day: str, start_hour: str, end_hour: str, trans_type: str):
+        path = self.path(start_day, end_day, start_hour, end_hour, trans_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(gzip.compress(body, compresslevel=6))
+        os.replace(temp, path)
+
+    def day_entries(self, day: str) -> list[tuple[str, str]]:
+        """(path, field) of the archived responses of a day (Mackenzie format), oldest first."""
+        directory = os.path.join(self.root, day)
+        if not os.path.isdir(directory):
+            return []
+        entries = []
+        for name in os.listdir(directory):
+            match = _ENTRY.match(name)
+            if match and match.group(4) in _FIELD_BY_TRANS_TYPE:
+                path = os.path.join(directory, name)
+                entries.append((os.path.getmtime(path), path, _FIELD_BY_TRANS_TYPE[match.group(4)]))
+        return [(path, field) for _, path, field in sorted(entries)]
+
+
+def archived_day_rows(root: str, date: str, factory: str = "A6") -> tuple[str, list[dict]]:
+    """
+    hour_by_hour rows of a day rebuilt from every archived response of that day.
+
+    Responses are applied oldest first, so for each line-hour the most recent archived count wins
+    (a full-day report fetched the next morning overrides the current-hour polls of the day).
+    Runs in the replay worker processes.
+    """
+    # hbh_mackenzie_api imports this module to archive its responses
+    from core.features.hour_by_hour.hbh_mackenzie_api import HourAccumulator
+
+    accumulator = HourAccumulator()
+    for path, field in MesArchive.for_factory(root, factory).day_entries(transform_date_to_mackenzie(date)):
+        with gzip.open(path, 'rb') as f:
+            accumulator.add(field, json.loads(f.read()))
+    return date, accumulator.rows(factory, date)
+
+
+def replay_archive(root: str, start_date: str, end_date: str, factory: str = "A6",
+                   workers: int = REPLAY_WORKERS) -> dict:
+    """
+    Rebuild hour_by_hour for a date range from the archive, without network.
+
+    Days are parsed in `workers` processes and each day is upserted through the DBWriter as soon as
+    it is parsed (the writer group-commits them). Days with nothing archived are left untouched.
+
+    :return: Days replayed, days missing from the archive, upsert counts and throughput.
+    """
+    started = time.perf_counter()
+    dates = transform_range_of_dates(form=start_date, at=end_date)
+    result = UpsertResult()
+    missing = []
+    pending = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for date, rows in executor.map(archived_day_rows, [root] * len(dates), dates, [factory] * len(dates),
+                                       chunksize=8):
+            if not rows:
+                missing.append(date)
+                continue
+            pending.append(DBWriter().submit(lambda session, rows=rows: HbhDAO(session).query_upsert_hours(rows)))
+
+    for future in pending:
+        day = future.result()
+        result.inserted += day.inserted
+        result.updated += day.updated
+        result.unchanged += day.unchanged
+
+    elapsed = time.perf_counter() - started
+    return {
+        "days": len(dates) - len(missing),
+        "missing_days": missing,
+        "rows": result.to_dict(),
+        "elapsed": round(elapsed, 2),
+        "rows_per_sec": round(result.total / elapsed, 1) if elapsed else 0,
+    }
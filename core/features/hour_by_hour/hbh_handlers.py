@@ -1,62 +1,103 @@
 import json
+import os
+import re
+import time
+from collections import deque
+from itertools import islice
+
+from colorama import Fore, Style
 
 from core.data.dao.hbh_dao import HbhDAO, PlatformDAO, WorkPlanDAO
 
 import requests
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Iterator
 from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-from core.data.schemas.hour_by_hour_schema import HourByHourSchema, PlatformSchema, WorkPlanSchema
-from core.db.database import DBConnection
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema
+from core.db.util import UpsertResult, generate_16_uuid
+from core.db.writer import DBWriter
 
+# PocketBase of the previous hour by hour app; $SKY_POCKETBASE_URL overrides it (e.g. benchmarks/fake_upstream.py)
+POCKETBASE_URL_ENV = 'SKY_POCKETBASE_URL'
+POCKETBASE_URL = 'http://10.13.33.46:3030'
 
-def get_outputs_from_pocket_base_by_date(date: str) -> List[dict]:
-    """
-    Fetches output records from PocketBase for a given date.
+# Days fetched from PocketBase at the same time (and pooled connections)
+PB_IMPORT_WORKERS = 8
 
-    :param date: Date in the format "YYYY-MM-DD" (e.g., "2024-11-23").
-    :return: List of records for the given date.
-    """
-    url = f"http://10.13.33.46:3030/api/collections/day/records?filter=(work_date%20~%20%27{date}%27)&expand=hours"
+# Records per PocketBase page
+PB_PAGE_SIZE = 200
 
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json().get("items", [])
-        else:
-            print(f"Failed to fetch data for {date}: HTTP {response.status_code}")
-            return []
-    except requests.RequestException as e:
-        print(f"Request failed for {date}: {e}")
-        return []
-
-
-def process_records_for_date(date: str) -> List:
-    """
-    Fetch and process work hour data for a single date.
+# Deadline of each PocketBase request (seconds)
+PB_TIMEOUT = 30
 
-    :param date: Date for which to fetch and process data.
-    :return: List of HourByHourModel objects.
-    """
-    records = get_outputs_from_pocket_base_by_date(date)
-    work_hour_schema: List[HourByHourSchema] = []
+# Rows per upsert transaction of import_pb_days
+PB_IMPORT_CHUNK = 2000
 
-    if records:
-        for record in records:
-            hours = record.get("expand", {}).get("hours", [])
-            for hour in hours:
-                work_hour_schema.append(HourByHourSchema(
-                    factory="A6",
-                    line=record.get("line"),
-                    date=str(record.get("work_date"))[:10],
-                    hour=hour.get("place"),
-                    smt_in=hour.get("smtIn"),
-                    smt_out=hour.get("smtOut"),
-                    packing=hour.get("packing")
-                ))
+# Rows per upsert transaction of the JSON seed loaders (platforms, work_plans, hour_by_hour)
+SEED_CHUNK_SIZE = 2000
 
-    return work_hour_schema
+# Characters read from a seed file at a time
+SEED_READ_SIZE = 64 * 1024
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def pocket_base_session(workers: int = PB_IMPORT_WORKERS) -> requests.Session:
+    """HTTP session keeping up to `workers` connections to PocketBase open."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    return session
+
+
+def get_outputs_from_pocket_base_by_date(date: str, session: requests.Session | None = None) -> List[dict] | None:
+    """
+    Fetches output records from PocketBase for a given date, following the pages of the collection.
+
+    :param date: Date in the format "YYYY-MM-DD" (e.g., "2024-11-23").
+    :param session: Pooled session (pocket_base_session); a plain request per page when None.
+    :return: List of records for the given date, or None if a page could not be fetched.
+    """
+    base_url = os.environ.get(POCKETBASE_URL_ENV, POCKETBASE_URL)
+    url = f"{base_url}/api/collections/day/records?filter=(work_date%20~%20%27{date}%27)&expand=hours"
+    http = session or requests
+
+    records = []
+    page = 1
+    while True:
+        try:
+            response = http.get(url, params={"page": page, "perPage": PB_PAGE_SIZE}, timeout=PB_TIMEOUT)
+            if response.status_code != 200:
+                print(f"Failed to fetch data for {date}: HTTP {response.status_code}")
+                return None
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Request failed for {date}: {e}")
+            return None
+
+        items = body.get("items", [])
+        records.extend(items)
+        if not items or page >= body.get("totalPages", 1):
+            return records
+        page += 1
+
+
+def pocket_base_rows(records: List[dict], factory: str = "A6") -> List[dict]:
+    """hour_by_hour row dicts (HbhDAO.query_upsert_hours) of the PocketBase day records."""
+    rows = []
+    for record in records:
+        for hour in record.get("expand", {}).get("hours", []):
+            rows.append({
+                "factory": factory,
+                "line": record.get("line"),
+                "date": str(record.get("work_date"))[:10],
+                "hour": hour.get("place"),
+                "smt_in": hour.get("smtIn"),
+                "smt_out": hour.get("smtOut"),
+                "packing": hour.get("packing"),
+            })
+    return rows
 
 
 def get_all_dates(days: int) -> List[str]:
@@ -69,45 +110,84 @@ def get_all_dates(days: int) -> List[str]:
     return [(datetime.now() - timedelta(days=i + 1)).strftime("%Y-%m-%d") for i in range(days)]
 
 
+def iter_pocket_base_days(dates: List[str], workers: int = PB_IMPORT_WORKERS) -> Iterator[tuple[str, List[dict] | None]]:
+    """
+    Yield (date, records) as the days are fetched, `workers` at a time over one pooled session.
+
+    At most 2 x `workers` days are submitted ahead of the consumer, so memory does not grow with
+    the number of days. Records are None for a day that could not be fetched.
+    """
+    session = pocket_base_session(workers)
+    pending = deque()
+    dates = iter(dates)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for date in islice(dates, 2 * workers):
+                pending.append((date, executor.submit(get_outputs_from_pocket_base_by_date, date, session)))
+            while pending:
+                date, future = pending.popleft()
+                for next_date in islice(dates, 1):
+                    pending.append((next_date, executor.submit(get_outputs_from_pocket_base_by_date, next_date, session)))
+                yield date, future.result()
+    finally:
+        session.close()
+
+
 def get_out_form_pb_by_days(days: int) -> List[HourByHourSchema]:
     """
     Fetches and processes work hour data from PocketBase for the last `days` days in parallel.
+    Holds every day in memory; use import_pb_days to store them.
 
     :param days: Number of days to fetch data for.
-    :return: List of HourByHourModel objects.
+    :return: List of HourByHourSchema objects.
     """
-    dates = get_all_dates(days)
     work_hour_schema: List[HourByHourSchema] = []
-
-    # Use ThreadPoolExecutor for multi-threading
-    with ThreadPoolExecutor() as executor:
-        # Map each date to a thread and collect results
-        results = list(executor.map(process_records_for_date, dates))
-
-    # Flatten the results
-    for result in results:
-        work_hour_schema.extend(result)
-
-    # Print each record (for debugging or logging)
-    # for item in work_hour_schema:
-    #     print(item.to_dict())
-
+    for _, records in iter_pocket_base_days(get_all_dates(days)):
+        work_hour_schema.extend(HourByHourSchema(**row) for row in pocket_base_rows(records or []))
     return work_hour_schema
 
 
-def save_to_db(data: List[HourByHourSchema]):
-    dao = HbhDAO(connection=DBConnection().get_session())
+def import_pb_days(days: int, workers: int = PB_IMPORT_WORKERS, chunk_size: int = PB_IMPORT_CHUNK) -> dict:
+    """
+    Import the last `days` days from PocketBase into hour_by_hour.
 
-    dao.query_add_records(data)
+    Days stream from iter_pocket_base_days into upserts of about `chunk_size` rows, each committed by
+    the DBWriter, so memory holds the days in flight plus one chunk whatever the number of days.
 
-    # for record in data:
-    #     print(f"Saving record: {record}")
-    # Save the record to the database
+    :return: Days imported, failed days and upsert counts.
+    """
+    result = UpsertResult()
+    failed = []
+    imported = 0
+    chunk: List[dict] = []
+
+    def flush():
+        rows = list(chunk)
+        chunk.clear()
+        upserted = DBWriter().execute(lambda session: HbhDAO(session).query_upsert_hours(rows))
+        result.inserted += upserted.inserted
+        result.updated += upserted.updated
+        result.unchanged += upserted.unchanged
+
+    for date, records in iter_pocket_base_days(get_all_dates(days), workers):
+        if records is None:
+            failed.append(date)
+            continue
+        imported += 1
+        chunk.extend(pocket_base_rows(records))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    print(f"{Fore.GREEN}PocketBase import: {imported} days, {result}{Style.RESET_ALL}")
+    if failed:
+        print(f"{Fore.RED}Failed days: {', '.join(sorted(failed))}{Style.RESET_ALL}")
+    return {"days": imported, "failed_days": sorted(failed), "rows": result.to_dict()}
 
 
 def pb_to_db(days: int):
-    data = get_out_form_pb_by_days(days)
-    save_to_db(data)
+    import_pb_days(days)
 
 
 def pb_to_json(days: int, dir: str):
@@ -120,71 +200,139 @@ def pb_to_json(days: int, dir: str):
         f.write(json.dumps(data, indent=4))
 
 
-def platform_to_db_from_json(file_path: str):
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-
-    data = [PlatformSchema(
-        id= record.get('id'),
-        name=record.get('platform'),
-        sku=record.get('sku'),
-        uph=record.get('uph'),
-        f_n=record.get('f_n')
-    ) for record in data]
-
-    if not data:
-        print("No data to save")
-        return
-
-    dao = PlatformDAO(connection=DBConnection().get_session())
-    dao.query_add_records(data)
-
-
-def work_plan_to_db_from_json(file_path: str):
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-
-    data = [WorkPlanSchema(
-        id = record.get('id'),
-        date=record.get('date'),
-        factory="A6",
-        line=record.get('line'),
-        planned_hours=record.get('planned_hours'),
-        platform_id=record.get('platform_id'),
-        state=record.get('state'),
-        target_oee=record.get('target_oee'),
-        uph_i=record.get('uph_i'),
-        week=record.get('week')
-    ) for record in data]
-
-    if not data:
-        print("No data to save")
-        return
-
-    dao = WorkPlanDAO(connection=DBConnection().get_session())
-    dao.query_add_records(data)
-
+def iter_json_array(file_path: str, read_size: int = SEED_READ_SIZE) -> Iterator:
+    """
+    Yield the items of the top-level JSON array of `file_path` one at a time, reading `read_size`
+    characters at a time, so memory holds one read plus the item being decoded whatever the file size.
 
-def hour_by_hour_to_db_from_json(file_path: str):
-    with open(file_path, 'r') as f:
-        data = json.load(f)
+    :raises ValueError: The file is not a JSON array (json.JSONDecodeError for a malformed item).
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer, position, eof = '', 0, False
+        expect = '['  # '[', then the first item or ']', then ',' or ']' after each item
+
+        while True:
+            position = _JSON_WHITESPACE.match(buffer, position).end()
+            if position == len(buffer) and not eof:
+                chunk = f.read(read_size)
+                buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+                continue
+            if position == len(buffer):
+                raise ValueError(f"{file_path}: unexpected end of the JSON array")
+
+            char = buffer[position]
+            if expect == '[':
+                if char != '[':
+                    raise ValueError(f"{file_path}: expected a JSON array")
+                position += 1
+                expect = 'first'
+            elif expect == 'sep' and char == ',':
+                position += 1
+                expect = 'item'
+            elif char == ']' and expect in ('first', 'sep'):
+                return
+            elif expect in ('first', 'item'):
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                    after = _JSON_WHITESPACE.match(buffer, end).end()
+                    complete = eof or (after < len(buffer) and buffer[after] in ',]')
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    complete = False
+                if not complete:
+                    # The item (or a number like "12." of "12.5") may continue in the next read
+                    chunk = f.read(read_size)
+                    buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+                    continue
+                yield item
+                position = end
+                expect = 'sep'
+            else:
+                raise ValueError(f"{file_path}: expected ',' or ']' at character {position}")
+
+
+def load_json_seed(file_path: str, to_row, upsert, chunk_size: int = SEED_CHUNK_SIZE) -> dict:
+    """
+    Stream the JSON array of `file_path` into a table.
 
-    data = [HourByHourSchema(
-        factory=record.get('factory'),
-        line=record.get('line'),
-        date=record.get('date'),
-        hour=record.get('hour'),
-        smt_in=record.get('smt_in'),
-        smt_out=record.get('smt_out'),
-        packing=record.get('packing')
-    ) for record in data]
+    Items are mapped to row dicts by `to_row` and written `chunk_size` at a time by
+    `upsert(session, rows) -> UpsertResult`, one DBWriter transaction per chunk. The upserts are
+    idempotent, so a load that stopped half-way can simply be run again.
 
-    if not data:
+    :return: Upsert counts, elapsed seconds and rows/sec.
+    """
+    started = time.perf_counter()
+    result = UpsertResult()
+    rows_iter = map(to_row, iter_json_array(file_path))
+
+    while rows := list(islice(rows_iter, chunk_size)):
+        upserted = DBWriter().execute(lambda session, rows=rows: upsert(session, rows))
+        result.inserted += upserted.inserted
+        result.updated += upserted.updated
+        result.unchanged += upserted.unchanged
+
+    elapsed = time.perf_counter() - started
+    rows_per_sec = round(result.total / elapsed, 1) if elapsed else 0
+    if result.total:
+        print(f"{Fore.GREEN}{file_path}: {result} in {elapsed:.2f}s ({rows_per_sec} rows/s){Style.RESET_ALL}")
+    else:
         print("No data to save")
-        return
-
-
-    dao = HbhDAO(connection=DBConnection().get_session())
-    dao.query_add_records(data)
-
-
+    return {"file": file_path, "rows": result.to_dict(), "elapsed": round(elapsed, 2), "rows_per_sec": rows_per_sec}
+
+
+def platform_row(record: dict) -> dict:
+    """The upsert matches on (name, sku); the id, generated when missing, only names a new row."""
+    return {
+        "id": record.get('id') or generate_16_uuid(),
+        "name": record.get('platform'),
+        "sku": record.get('sku'),
+        "uph": record.get('uph'),
+        "f_n": record.get('f_n', 0.0),
+    }
+
+
+def work_plan_row(record: dict, factory: str = "A6") -> dict:
+    """The upsert matches on (factory, date, line); the id, generated when missing, only names a new row."""
+    return {
+        "id": record.get('id') or generate_16_uuid(),
+        "date": record.get('date'),
+        "factory": record.get('factory') or factory,
+        "line": record.get('line'),
+        "planned_hours": record.get('planned_hours'),
+        "platform_id": record.get('platform_id'),
+        "state": record.get('state'),
+        "target_oee": record.get('target_oee'),
+        "uph_i": record.get('uph_i'),
+        "week": record.get('week'),
+    }
+
+
+def hour_by_hour_row(record: dict) -> dict:
+    """Keeps the id of files written by pb_to_json; query_upsert_hours matches on factory, line, date and hour."""
+    return {
+        "id": record.get('id'),
+        "factory": record.get('factory'),
+        "line": record.get('line'),
+        "date": record.get('date'),
+        "hour": record.get('hour'),
+        "smt_in": record.get('smt_in'),
+        "smt_out": record.get('smt_out'),
+        "packing": record.get('packing'),
+    }
+
+
+def platform_to_db_from_json(file_path: str, chunk_size: int = SEED_CHUNK_SIZE) -> dict:
+    return load_json_seed(file_path, platform_row,
+                          lambda session, rows: PlatformDAO(session).query_upsert_records(rows), chunk_size)
+
+
+def work_plan_to_db_from_json(file_path: str, chunk_size: int = SEED_CHUNK_SIZE) -> dict:
+    return load_json_seed(file_path, work_plan_row,
+                          lambda session, rows: WorkPlanDAO(session).query_upsert_records(rows), chunk_size)
+
+
+def hour_by_hour_to_db_from_json(file_path: str, chunk_size: int = SEED_CHUNK_SIZE) -> dict:
+    return load_json_seed(file_path, hour_by_hour_row,
+                          lambda session, rows: HbhDAO(session).query_upsert_hours(rows), chunk_size)
@@ -0,0 +1,122 @@
+import json
+import re
+from datetime import date as date_type
+
+# Rows accepted by one POST /hbh/ingest
+INGEST_MAX_ROWS = 50_000
+
+# Validation errors returned with a rejected batch (the count is always complete)
+INGEST_MAX_ERRORS = 50
+
+# Counters of a line-hour, all required
+_COUNTERS = ('smt_in', 'smt_out', 'packing')
+
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class IngestError(ValueError):
+    """
+    A batch rejected as a whole: `errors` holds up to INGEST_MAX_ERRORS {"index", "error"} items and
+    `status_code` the HTTP status (400 unreadable body, 413 too many rows, 422 invalid rows).
+    """
+    def __init__(self, message: str, status_code: int = 422, errors: list[dict] | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.errors = errors or []
+
+
+def parse_ingest_body(body: bytes, content_type: str | None = None) -> list:
+    """
+    Items of a JSON array or of NDJSON (one object per line, blank lines ignored).
+
+    The format follows the content type (application/json or application/x-ndjson); without one,
+    a body starting with '[' is an array.
+    """
+    text = body.decode('utf-8-sig').strip() if body else ''
+    if not text:
+        return []
+
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    is_array = content_type == 'application/json' or (not content_type.endswith('ndjson') and text[0] == '[')
+    if is_array:
+        try:
+            items = json.loads(text)
+        except ValueError as e:
+            raise IngestError(f"Invalid JSON: {e}", status_code=400)
+        if not isinstance(items, list):
+            raise IngestError("Expected a JSON array", status_code=400)
+        return items
+
+    items = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            raise IngestError(f"Invalid JSON on line {number}: {e}", status_code=400)
+    return items
+
+
+def _count(value) -> bool:
+    return type(value) is int and value >= 0
+
+
+def validate_ingest_rows(items: list, factory: str = "A6") -> list[dict]:
+    """
+    hour_by_hour rows (HbhDAO.query_upsert_hours) of the pushed items, checked in a single pass.
+
+    Each item needs line, date (YYYY-MM-DD), hour (0-23) and non-negative integer smt_in, smt_out and
+    packing; factory defaults to `factory`. A line-hour repeated in the batch keeps its last item.
+
+    :raises IngestError: Too many items, or any invalid item (the batch is not written).
+    """
+    if len(items) > INGEST_MAX_ROWS:
+        raise IngestError(f"{len(items)} rows, at most {INGEST_MAX_ROWS} per request", status_code=413)
+
+    rows: dict[tuple, dict] = {}
+    errors = []
+    invalid = 0
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            error = "not an object"
+        else:
+            row_factory = item.get('factory', factory)
+            line, date, hour = item.get('line'), item.get('date'), item.get('hour')
+            if not isinstance(row_factory, str) or not 0 < len(row_factory) <= 10:
+                error = "factory must be a string of 1 to 10 characters"
+            elif not isinstance(line, str) or not 0 < len(line) <= 3:
+                error = "line must be a string of 1 to 3 characters"
+            elif not isinstance(date, str) or not _DATE.fullmatch(date) or not _is_date(date):
+                error = "date must be YYYY-MM-DD"
+            elif type(hour) is not int or not 0 <= hour <= 23:
+                error = "hour must be an integer from 0 to 23"
+            elif not all(_count(item.get(counter)) for counter in _COUNTERS):
+                error = "smt_in, smt_out and packing must be non-negative integers"
+            else:
+                rows[(row_factory, line, date, hour)] = {
+                    "factory": row_factory,
+                    "line": line,
+                    "date": date,
+                    "hour": hour,
+                    "smt_in": item['smt_in'],
+                    "smt_out": item['smt_out'],
+                    "packing": item['packing'],
+                }
+                continue
+
+        invalid += 1
+        if len(errors) < INGEST_MAX_ERRORS:
+            errors.append({"index": index, "error": error})
+
+    if invalid:
+        raise IngestError(f"{invalid} of {len(items)} rows are invalid", errors=errors)
+    return list(rows.values())
+
+
+def _is_date(value: str) -> bool:
+    try:
+        date_type.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
@@ -1,18 +1,83 @@
+import asyncio
+import configparser
+import json
 import logging
+import os
 import re
-from collections import OrderedDict, defaultdict
 from datetime import datetime
 from enum import Enum
 from typing import Dict, Any
 
-import requests
-from watchfiles import awatch
+import aiohttp
 
-from core.data.models.hour_by_hour_model import HourByHourModel
+from core.data.types import FactoryType
+from core.db.profile import CONFIG_PATH
+from core.features.hour_by_hour.hbh_archive import MesArchive
 from core.features.util.date_util import transform_date_to_mackenzie
 
 logger = logging.getLogger(__name__)
 
+# Mackenzie reporter of A6; $SKY_MES_URL points ingestion somewhere else (e.g. benchmarks/fake_upstream.py)
+MES_URL_ENV = 'SKY_MES_URL'
+MES_URL = 'http://10.13.89.96:83'
+
+# Factory whose MES is MES_URL when config/api_config.ini has no [mes_<factory>] url
+DEFAULT_MES_FACTORY = 'A6'
+
+# Default deadline of each MES request (seconds), sized for the full-day reports
+MACKENZIE_TIMEOUT = 60
+
+# Connections kept open to the MES host (the three TransTypes of a poll go out together)
+MACKENZIE_POOL_SIZE = 10
+
+
+class MesConfig:
+    """
+    MES endpoint of a factory, read from `config/api_config.ini` sections named `mes_<factory>`:
+
+        [mes_A5]
+        url = http://10.13.89.97:83
+        timeout = 60
+        pool_size = 10
+
+    A6 falls back to MES_URL; any other factory without a section url has no MES and is not ingested.
+    $SKY_MES_URL_<FACTORY> sets the url of one factory (configuring it) and $SKY_MES_URL overrides
+    the url of every configured factory.
+    """
+    def __init__(self, factory: str, url: str, timeout: float = None, pool_size: int = None):
+        self.factory = factory
+        self.url = url
+        self.timeout = timeout or MACKENZIE_TIMEOUT
+        self.pool_size = pool_size or MACKENZIE_POOL_SIZE
+
+    @classmethod
+    def from_config(cls, factory: str, path: str = CONFIG_PATH) -> 'MesConfig | None':
+        configs = configparser.ConfigParser()
+        configs.read(path)
+        section = configs[f'mes_{factory}'] if configs.has_section(f'mes_{factory}') else {}
+
+        base_url = os.environ.get(f'{MES_URL_ENV}_{factory}')
+        if not base_url:
+            base_url = section.get('url') or (MES_URL if factory == DEFAULT_MES_FACTORY else None)
+            if not base_url:
+                return None
+            base_url = os.environ.get(MES_URL_ENV) or base_url
+        return cls(
+            factory,
+            base_url.rstrip('/'),
+            timeout=float(section['timeout']) if 'timeout' in section else None,
+            pool_size=int(section['pool_size']) if 'pool_size' in section else None,
+        )
+
+    def __str__(self):
+        return f"MesConfig({self.factory}: {self.url}, timeout={self.timeout}s, pool_size={self.pool_size})"
+
+
+def configured_factories(path: str = CONFIG_PATH) -> list[str]:
+    """Factories of FactoryType with a MES endpoint, in declaration order."""
+    return [factory.value for factory in FactoryType if MesConfig.from_config(factory.value, path)]
+
+
 class TransType(Enum):
     SMT_IN = "INPUT",
     SMT_OUT = "OUTPUT",
@@ -27,44 +92,117 @@ def url(
         end_day: str,
         start_hour: str,
         end_hour: str,
-        trans_type: TransType
+        trans_type: TransType,
+        base_url: str | None = None
 ) -> str:
     return (
-        f"http://10.13.89.96:83/home/reporte?"
+        f"{base_url or os.environ.get(MES_URL_ENV, MES_URL)}/home/reporte?"
         f"entrada={start_day}{start_hour}"
         f"&salida={end_day}{end_hour}00"
         f"&transtype={trans_type.value[0]}"
     )
 
-def fetch_data(
+
+class MackenzieClient:
+    """
+    Singleton holding the pooled aiohttp sessions used for every MES request of the process, one per
+    factory, sized and timed by its MesConfig.
+
+    The sessions are bound to the event loop they were created on; new ones are opened when called from
+    another loop (e.g. successive asyncio.run calls). Call close() on shutdown.
+    """
+    _instance = None  # Class-level attribute to hold the singleton instance
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MackenzieClient, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+        self._configs: dict[str, MesConfig | None] = {}
+        self._loop = None
+
+    def config(self, factory: str = DEFAULT_MES_FACTORY) -> MesConfig | None:
+        """MesConfig of the factory, read once per process."""
+        if factory not in self._configs:
+            self._configs[factory] = MesConfig.from_config(factory)
+        return self._configs[factory]
+
+    def get_session(self, factory: str = DEFAULT_MES_FACTORY) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._sessions = {}  # Bound to a previous loop: dropped, not closed
+            self._loop = loop
+        session = self._sessions.get(factory)
+        if session is None or session.closed:
+            config = self.config(factory)
+            session = self._sessions[factory] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=config.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=config.timeout),
+            )
+        return session
+
+    async def close(self):
+        if self._loop is asyncio.get_running_loop():
+            for session in self._sessions.values():
+                if not session.closed:
+                    await session.close()
+        self._sessions = {}
+        self._loop = None
+
+
+async def fetch_data(
         start_day: str,
         end_day: str,
         start_hour: str,
         end_hour: str,
-        trans_type: TransType
+        trans_type: TransType,
+        timeout: float | None = None,
+        factory: str = DEFAULT_MES_FACTORY
 ) -> Any:
+    config = MackenzieClient().config(factory)
+    if config is None:
+        logger.error(f"No MES configured for factory {factory} ([mes_{factory}] url)")
+        return None
+    timeout = timeout or config.timeout
+
     _url = url(
         start_day=start_day,
         end_day=end_day,
         start_hour=start_hour,
         end_hour=end_hour,
-        trans_type=trans_type
+        trans_type=trans_type,
+        base_url=config.url
     )
     logger.debug(f"Fetching data from URL: {_url}")
-    # print(f"Fetching data from URL: {_url}")
     try:
-        response = requests.get(_url)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        logger.error(f"Error fetching data for {trans_type.name}: {e}")
+        session = MackenzieClient().get_session(factory)
+        async with session.get(_url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            body = await response.read()
+        # Parse the body as JSON whatever content type the MES sends
+        data = json.loads(body)
+        archive = MesArchive.from_env(factory)
+        if archive is not None:
+            await asyncio.to_thread(archive.save, body, start_day, end_day, start_hour, end_hour, trans_type.value[0])
+        return data
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out after {timeout}s fetching data for {factory} {trans_type.name}")
+        return None
+    except (aiohttp.ClientError, ValueError) as e:
+        logger.error(f"Error fetching data for {factory} {trans_type.name}: {e}")
         return None  # You might choose to handle this differently
 
-def get_transactions(
+async def get_transactions(
         day: str,
         start_hour: str,
-        end_hour: str
+        end_hour: str,
+        timeout: float | None = None,
+        factory: str = DEFAULT_MES_FACTORY
 ) -> Dict[str, Any]:
+    """Fetch the three TransTypes from the MES of `factory` concurrently; a failed one is left out of the result."""
     data = {}
     transaction_types = [
         ('smt_in', TransType.SMT_IN),
@@ -72,104 +210,153 @@ def get_transactions(
         ('packing', TransType.PACKING)
     ]
 
-    for key, trans_type in transaction_types:
-        result = fetch_data(
+    results = await asyncio.gather(*(
+        fetch_data(
             start_day=day,
             end_day=day,
             start_hour=start_hour,
             end_hour=end_hour,
-            trans_type=trans_type
+            trans_type=trans_type,
+            timeout=timeout,
+            factory=factory
         )
+        for _, trans_type in transaction_types
+    ))
+
+    for (key, _), result in zip(transaction_types, results):
         if result is not None:
             data[key] = result
         else:
-            logger.warning(f"No data returned for {key} on {day} between {start_hour} and {end_hour}")
+            logger.warning(f"No data returned for {factory} {key} on {day} between {start_hour} and {end_hour}")
 
     return data
 
-def get_hour_by_hour(day: str, hour: str) -> Dict[str, Any]:
-    return get_transactions(day=day, start_hour=hour, end_hour=hour)
-
-def get_all_day(day: str) -> Dict[str, Any]:
-    return get_transactions(day=day, start_hour="00", end_hour="23")
+async def get_hour_by_hour(day: str, hour: str, timeout: float | None = None,
+                           factory: str = DEFAULT_MES_FACTORY) -> Dict[str, Any]:
+    return await get_transactions(day=day, start_hour=hour, end_hour=hour, timeout=timeout, factory=factory)
 
+async def get_all_day(day: str, timeout: float | None = None, factory: str = DEFAULT_MES_FACTORY) -> Dict[str, Any]:
+    return await get_transactions(day=day, start_hour="00", end_hour="23", timeout=timeout, factory=factory)
 
-async def api_respond_to_model(data, date: str):
-    if not data:
-        return None
-    # Dictionary to store unique records with keys as "line-hour"
-    unique_records = {}
 
-    data_fields = ['smt_in', 'smt_out', 'packing']
+# Line id inside the MES LINE value (e.g. 'SMT J01' -> 'J01')
+LINE_PATTERN = re.compile(r"J\d{2}")
 
-    for field in data_fields:
-        for item in data.get(field, []):
-            # Extract the line identifier (e.g., 'J01')
-            match = re.search(r"J\d{2}", item.get('LINE', ''))
-            if not match:
-                continue
-            line = match.group()
-            hour = item.get('HOURS', '')[:2]
-            qty = item.get('QTY', 0)
+# Response keys of get_transactions, in the order of the counters of a line-hour
+HOUR_FIELDS = ('smt_in', 'smt_out', 'packing')
 
-            # Create a unique key for each "line-hour" combination
-            key = f"{line}-{hour}"
+_NO_LINE = object()
 
-            # Check if the record already exists
-            if key in unique_records:
-                # Update the existing record
-                setattr(unique_records[key], field, qty)
-            else:
-                # Create a new record with default values
-                unique_records[key] = HourByHourModel(
-                    date=date,
-                    line=line,
-                    hour=hour,
-                    smt_in=0,
-                    smt_out=0,
-                    packing=0
-                )
-                # Set the appropriate field
-                setattr(unique_records[key], field, qty)
 
-    # Sort records by line and hour
-
-    sorted_records = OrderedDict(sorted(unique_records.items()))
+class HourAccumulator:
+    """
+    (line, hour) -> (smt_in, smt_out, packing) counters of MES responses, filled item by item.
 
-    # Print the result with formatting
-    #print_records(sorted_records.values())
+    Each line gets a preallocated block of 24 x 3 counters plus a flag per hour, so an item costs two
+    dict lookups and an index store; no object or string key is built per item. The LINE regex runs
+    once per distinct LINE value. As before, a repeated (line, hour) of the same TransType keeps the
+    last QTY, and only line-hours present in a response are returned.
+    """
+    __slots__ = ('_counts', '_seen', '_lines')
+
+    def __init__(self):
+        self._counts: dict[str, list[int]] = {}
+        self._seen: dict[str, bytearray] = {}
+        self._lines: dict[str, object] = {}
+
+    def add(self, field: str, items) -> int:
+        """Consume an iterable of MES items of one TransType. Returns the number of items used."""
+        offset = HOUR_FIELDS.index(field)
+        lines, counts_by_line = self._lines, self._counts
+        used = 0
+        for item in items:
+            raw_line = item.get('LINE', '')
+            line = lines.get(raw_line)
+            if line is None:
+                match = LINE_PATTERN.search(raw_line)
+                line = lines[raw_line] = match.group() if match else _NO_LINE
+            if line is _NO_LINE:
+                continue
+            try:
+                hour = int(item.get('HOURS', '')[:2])
+            except ValueError:
+                continue
+            if not 0 <= hour < 24:
+                continue
 
-    return sorted_records
+            counts = counts_by_line.get(line)
+            if counts is None:
+                counts = counts_by_line[line] = [0] * 72
+                self._seen[line] = bytearray(24)
+            counts[hour * 3 + offset] = int(item.get('QTY', 0) or 0)
+            self._seen[line][hour] = 1
+            used += 1
+        return used
+
+    def rows(self, factory: str, date: str) -> list[dict]:
+        """Row dicts for HbhDAO.query_upsert_hours, sorted by line and hour."""
+        rows = []
+        for line in sorted(self._counts):
+            counts, seen = self._counts[line], self._seen[line]
+            for hour in range(24):
+                if seen[hour]:
+                    base = hour * 3
+                    rows.append({
+                        "factory": factory,
+                        "line": line,
+                        "date": date,
+                        "hour": hour,
+                        "smt_in": counts[base],
+                        "smt_out": counts[base + 1],
+                        "packing": counts[base + 2],
+                    })
+        return rows
+
+
+def hour_rows(data: Dict[str, Any], date: str, factory: str = "A6") -> list[dict] | None:
+    """
+    Line-hour rows of a get_transactions response, ready for HbhDAO.query_upsert_hours.
 
+    :return: The rows sorted by line and hour, or None when there is no data.
+    """
+    if not data:
+        return None
+    accumulator = HourAccumulator()
+    for field in HOUR_FIELDS:
+        accumulator.add(field, data.get(field) or ())
+    return accumulator.rows(factory, date)
 
 
-def print_records(records):
+def print_records(rows: list[dict]):
     """
-    Utility function to print formatted records.
+    Utility function to print formatted rows.
     """
     current_line = None
-    for record in records:
-        if record.line != current_line:
+    for row in rows:
+        if row["line"] != current_line:
             if current_line is not None:
                 print()  # New line between lines
-            current_line = record.line
-            print(f"Line: {record.line}")
+            current_line = row["line"]
+            print(f"Line: {row['line']}")
             print(f"{'Date':<12} {'Hour':<6} {'SMT In':<8} {'SMT Out':<8} {'Packing':<8}")
             print("-" * 50)
 
-        print(f"{record.date:<12} {record.hour:<6} {record.smt_in:<8} {record.smt_out:<8} {record.packing:<8}")
+        print(f"{row['date']:<12} {row['hour']:<6} {row['smt_in']:<8} {row['smt_out']:<8} {row['packing']:<8}")
 
 
 
 if __name__ == "__main__":
-    get_current_day = datetime.now().strftime("%Y-%m-%d")
-    get_current_hour_in_string = datetime.now().strftime("%H")
-    responds =  api_respond_to_model(
-        get_hour_by_hour(transform_date_to_mackenzie(get_current_day), get_current_hour_in_string),
-        get_current_day,
-    )
-
-    for keys, records in responds.items():
-        print(records)
+    async def main():
+        get_current_day = datetime.now().strftime("%Y-%m-%d")
+        get_current_hour_in_string = datetime.now().strftime("%H")
+        try:
+            return hour_rows(
+                await get_hour_by_hour(transform_date_to_mackenzie(get_current_day), get_current_hour_in_string),
+                get_current_day,
+            )
+        finally:
+            await MackenzieClient().close()
+
+    print_records(asyncio.run(main()) or [])
 
     pass
@@ -0,0 +1,107 @@
+import logging
+import time
+from datetime import datetime
+
+from core.data.dao.hbh_dao import WorkPlanDAO
+from core.data.handlers.handler_hour_by_hour import planned_hours_of_day
+
+# Interval of the current-hour poll near the top of the hour, when the last counts of the hour land (seconds)
+POLL_FAST = 15
+
+# Interval while planned lines are producing and their counts change (seconds)
+POLL_BASE = 30
+
+# Longest interval while planned lines are producing but their counts stop changing (seconds)
+POLL_SLOW = 90
+
+# Interval when no line is planned at this hour (between shifts, days off) (seconds)
+POLL_IDLE = 300
+
+# Polls without a changed count tolerated before backing off (a slow line skips a poll now and then)
+POLL_QUIET_TOLERANCE = 2
+
+# Each further poll without a changed count multiplies the interval by this, up to POLL_SLOW
+POLL_BACKOFF = 1.5
+
+# From this minute of the hour on, polls run every POLL_FAST
+TOP_OF_HOUR_MINUTE = 55
+
+# Seconds the active lines of the work plans are cached
+PLAN_REFRESH = 300
+
+
+class AdaptivePoller:
+    """
+    Runs HbhService.update_currently_hour on an interval chosen from the work plans and the changes
+    the last polls observed, in place of a fixed 30 seconds:
+
+    - no line planned at this hour: POLL_IDLE, cut at the next hour (a shift may start)
+    - from TOP_OF_HOUR_MINUTE: POLL_FAST
+    - otherwise POLL_BASE, growing by POLL_BACKOFF per poll that changed nothing (after
+      POLL_QUIET_TOLERANCE of them) up to POLL_SLOW, and back to POLL_BASE as soon as a count
+      changes; never past TOP_OF_HOUR_MINUTE
+
+    Schedule it with AsyncPeriodicExecutor.schedule_task(poller.poll, adaptive=poller.next_interval).
+    """
+    def __init__(self, service, plan_dao: WorkPlanDAO, factory: str = "A6"):
+        self.service = service
+        self.plan_dao = plan_dao
+        self.factory = factory
+        self.quiet_polls = 0
+        self.polls = 0
+        self.last_interval = 0.0
+        self._plans: list[tuple[str, str, float]] = []
+        self._plans_loaded_at: float | None = None
+
+    def active_lines(self, now: datetime | None = None) -> set[str]:
+        """Lines with a work plan covering the current hour."""
+        now = now or datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        if self._plans_loaded_at is None or time.monotonic() - self._plans_loaded_at > PLAN_REFRESH:
+            try:
+                self._plans = self.plan_dao.query_active_plans(self.factory, [today])
+                self._plans_loaded_at = time.monotonic()
+            except Exception as e:
+                logging.error(f"Adaptive poll: work plans not read, keeping the last ones: {e}")
+
+        return {
+            line for date, line, planned_hours in self._plans
+            if date == today and now.hour in planned_hours_of_day(planned_hours or 0)
+        }
+
+    async def poll(self):
+        written_before, polls_before = self.service.rows_written, self.service.polls
+        await self.service.update_currently_hour()
+        self.polls += 1
+
+        if self.service.polls == polls_before:
+            return  # MES or DB failure: no observation, keep the interval
+        if self.service.rows_written > written_before:
+            self.quiet_polls = 0
+        else:
+            self.quiet_polls += 1
+
+    def next_interval(self, now: datetime | None = None) -> float:
+        now = now or datetime.now()
+        seconds_into_hour = now.minute * 60 + now.second
+        until_next_hour = 3600 - seconds_into_hour
+
+        if not self.active_lines(now):
+            interval = min(POLL_IDLE, until_next_hour)
+        elif now.minute >= TOP_OF_HOUR_MINUTE:
+            interval = POLL_FAST
+        else:
+            backoff = max(self.quiet_polls - POLL_QUIET_TOLERANCE, 0)
+            interval = min(POLL_BASE * POLL_BACKOFF ** backoff, POLL_SLOW)
+            interval = min(interval, TOP_OF_HOUR_MINUTE * 60 - seconds_into_hour)
+
+        self.last_interval = max(interval, 1)
+        return self.last_interval
+
+    def stats(self) -> dict:
+        return {
+            "polls": self.polls,
+            "quiet_polls": self.quiet_polls,
+            "last_interval": round(self.last_interval, 1),
+            "active_lines": len(self.active_lines()),
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from datetime import datetime
+
+from core.data.dao.hbh_dao import HbhDAO, LINE_SOURCE_SCAN
+from core.db.util import UpsertResult
+from core.db.writer import DBWriter
+from core.features.hour_by_hour.hbh_ingest import INGEST_MAX_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two flushes of the scan counters to hour_by_hour (a handful of writes per minute)
+SCAN_FLUSH_INTERVAL = 10
+
+# Scan event type -> index of the counter in (smt_in, smt_out, packing); MES TransType names accepted too
+SCAN_TYPES = {'SMT_IN': 0, 'INPUT': 0, 'SMT_OUT': 1, 'OUTPUT': 1, 'PACKING': 2}
+
+# Units a single event may count (guards against a typo in qty)
+SCAN_MAX_QTY = 1000
+
+
+def scan_slot(event, factory: str = "A6") -> tuple[tuple, int, int]:
+    """
+    ((factory, line, date, hour), counter index, qty) of a scan event:
+    {"line": "J01", "type": "SMT_IN", "ts": "2024-12-16T08:15:03" or epoch seconds, "qty": 1, "factory": "A6"}.
+    "ts" defaults to now and "qty" to 1; an ISO time with an offset is converted to local time.
+
+    :raises ValueError: Invalid event, with the reason.
+    """
+    if not isinstance(event, dict):
+        raise ValueError("not an object")
+
+    row_factory, line = event.get('factory', factory), event.get('line')
+    if not isinstance(row_factory, str) or not 0 < len(row_factory) <= 10:
+        raise ValueError("factory must be a string of 1 to 10 characters")
+    if not isinstance(line, str) or not 0 < len(line) <= 3:
+        raise ValueError("line must be a string of 1 to 3 characters")
+
+    index = SCAN_TYPES.get(event.get('type'))
+    if index is None:
+        raise ValueError(f"type must be one of {', '.join(SCAN_TYPES)}")
+
+    qty = event.get('qty', 1)
+    if type(qty) is not int or not 0 < qty <= SCAN_MAX_QTY:
+        raise ValueError(f"qty must be an integer from 1 to {SCAN_MAX_QTY}")
+
+    ts = event.get('ts')
+    if ts is None:
+        moment = datetime.now()
+    elif isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        try:
+            moment = datetime.fromtimestamp(ts)
+        except (OverflowError, OSError):
+            raise ValueError("ts out of range")
+    elif isinstance(ts, str):
+        moment = datetime.fromisoformat(ts)  # ValueError on a bad time
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)
+    else:
+        raise ValueError("ts must be an ISO time or epoch seconds")
+
+    return (row_factory, line, moment.strftime("%Y-%m-%d"), moment.hour), index, qty
+
+
+class ScanAggregator:
+    """
+    Singleton counting per-unit scan events in memory by (factory, line, date, hour) and flushing the
+    deltas to hour_by_hour every SCAN_FLUSH_INTERVAL seconds in one DBWriter job, whatever the event
+    rate (HbhDAO.query_increment_hours adds them to the stored counters).
+
+    A failed flush puts its deltas back, so they go with the next one; deltas not flushed when the
+    process dies are lost (at most one interval). A flush also records its lines as scan-fed in
+    hbh_line_sources (same transaction), and HbhService stops writing the MES counts of those lines,
+    whose absolute values would replace the scanned ones.
+
+    Example:
+        ScanAggregator().add([{"line": "J01", "type": "PACKING"}])
+        await ScanAggregator().stop()  # Flushes what is left
+    """
+    _instance = None  # Class-level attribute to hold the singleton instance
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(ScanAggregator, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self, flush_interval: float = SCAN_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # (factory, line, date, hour) -> [smt_in, smt_out, packing] not flushed yet
+        self._pending: dict[tuple, list[int]] = {}
+        self._task: asyncio.Task | None = None
+        self._events = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._rows_flushed = 0
+        self._last_flush_ms = 0.0
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        # Fresh context: the flusher must not inherit the request scope of the first event
+        self._task = asyncio.get_running_loop().create_task(
+            self._flush_loop(), name="scan-flusher", context=contextvars.Context())
+
+    def add(self, events: list, factory: str = "A6") -> dict:
+        """
+        Count a batch of scan events; invalid ones are skipped and reported. Must be called from the
+        event loop (it starts the flusher).
+        """
+        self._ensure_started()
+        slots = []
+        errors = []
+        for position, event in enumerate(events):
+            try:
+                slots.append(scan_slot(event, factory))
+            except ValueError as e:
+                if len(errors) < INGEST_MAX_ERRORS:
+                    errors.append({"index": position, "error": str(e)})
+
+        with self._lock:
+            for key, index, qty in slots:
+                counters = self._pending.get(key)
+                if counters is None:
+                    counters = self._pending[key] = [0, 0, 0]
+                counters[index] += qty
+            self._events += len(slots)
+            self._rejected += len(events) - len(slots)
+
+        return {"accepted": len(slots), "rejected": len(events) - len(slots), "errors": errors}
+
+    async def flush(self) -> UpsertResult | None:
+        """Write the pending deltas in one transaction now. Returns None when there was nothing to write."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return None
+
+        rows = [
+            {"factory": factory, "line": line, "date": date, "hour": hour,
+             "smt_in": counters[0], "smt_out": counters[1], "packing": counters[2]}
+            for (factory, line, date, hour), counters in pending.items()
+        ]
+        started = time.perf_counter()
+        try:
+            result = await DBWriter().execute_async(lambda session: self._write(session, rows))
+        except Exception as e:
+            logger.error(f"Scan flush of {len(rows)} line-hours failed, kept for the next one: {e}")
+            with self._lock:
+                for key, counters in pending.items():
+                    merged = self._pending.setdefault(key, [0, 0, 0])
+                    for index in range(3):
+                        merged[index] += counters[index]
+                self._failed_flushes += 1
+            return None
+
+        self._flushes += 1
+        self._rows_flushed += len(rows)
+        self._last_flush_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    @staticmethod
+    def _write(session, rows: list[dict]) -> UpsertResult:
+        dao = HbhDAO(session)
+        dao.query_mark_line_sources({(row["factory"], row["line"]) for row in rows}, LINE_SOURCE_SCAN)
+        return dao.query_increment_hours(rows)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        """Stop the flusher and flush what is pending."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "events": self._events,
+            "rejected": self._rejected,
+            "pending_line_hours": pending,
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+            "rows_flushed": self._rows_flushed,
+            "last_flush_ms": round(self._last_flush_ms, 1),
+            "flush_interval": self.flush_interval,
+        }
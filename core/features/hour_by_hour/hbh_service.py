@@ -1,42 +1,331 @@
+import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 
-from core.data.schemas.hour_by_hour_schema import HourByHourSchema
-from core.features.hour_by_hour.hbh_mackenzie_api import api_respond_to_model, get_hour_by_hour, get_all_day
+from core.db.util import UpsertResult
+from core.features.hour_by_hour.hbh_mackenzie_api import hour_rows, get_all_day, get_transactions, HOUR_FIELDS
 from core.features.util.date_util import transform_date_to_mackenzie, transform_range_of_dates
 
+# Deadline of the MES requests of the current-hour poll, below its 30 second interval
+CURRENT_HOUR_TIMEOUT = 20
+
+# Days fetched from the MES at the same time by a range backfill (three requests each)
+BACKFILL_CONCURRENCY = 3
+
+# Seconds between two runs of heal_gaps in run_feature.py
+HEAL_INTERVAL = 15 * 60
+
+# Days before today searched for missing hours by heal_gaps
+HEAL_LOOKBACK_DAYS = 7
+
+# Minutes after the end of an hour before heal_gaps considers it missing (the polls still write it)
+HEAL_SETTLE_MINUTES = 15
+
+# MES hour ranges fetched per heal_gaps run; a larger gap continues on the next run
+HEAL_MAX_FETCHES = 24
+
+# Seconds between two logs of the ingestion counters (HbhService.log_stats) in run_feature.py
+STATS_LOG_INTERVAL = 15 * 60
+
+# Days of a watermark catch-up fetched per sync_hours run; a longer outage continues on the next run
+SYNC_MAX_DAYS = 3
+
+
+def gap_ranges(slots: list[tuple[str, str, int]]) -> list[tuple[str, int, int, list[tuple[str, int]]]]:
+    """
+    Group missing (date, line, hour) slots into MES requests: one per date and run of consecutive
+    hours, whatever the number of lines. Returns (date, start_hour, end_hour, [(line, hour), ...]).
+    """
+    by_date: dict[str, dict[int, list[str]]] = {}
+    for date, line, hour in slots:
+        by_date.setdefault(date, {}).setdefault(hour, []).append(line)
+
+    ranges = []
+    for date in sorted(by_date):
+        hours = by_date[date]
+        start = previous = None
+        for hour in sorted(hours):
+            if start is not None and hour == previous + 1:
+                previous = hour
+                continue
+            if start is not None:
+                ranges.append((date, start, previous))
+            start = previous = hour
+        ranges.append((date, start, previous))
+
+    return [
+        (date, start, end, [(line, hour) for hour in range(start, end + 1) for line in by_date[date][hour]])
+        for date, start, end in ranges
+    ]
+
+
+def sync_ranges(start: datetime, stop: datetime) -> list[tuple[str, int, int]]:
+    """
+    Split the hours of [start, stop) (whole hours) into one MES request per day, the fewest possible:
+    MES items carry the hour but not the date. Returns (date, first_hour, last_hour).
+    """
+    ranges = []
+    cursor = start
+    while cursor < stop:
+        day_end = min(stop, cursor.replace(hour=0) + timedelta(days=1))
+        ranges.append((cursor.strftime("%Y-%m-%d"), cursor.hour, (day_end - timedelta(hours=1)).hour))
+        cursor = day_end
+    return ranges
+
+
+def _hour_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class BackfillReport:
+    """
+    Outcome and throughput of a range backfill.
+    """
+    def __init__(self, factory: str, start_date: str, end_date: str):
+        self.factory = factory
+        self.start_date = start_date
+        self.end_date = end_date
+        self.total_days = 0
+        self.days = 0
+        self.skipped_days = 0
+        self.failed_days: list[str] = []
+        # date -> reason of the failure
+        self.errors: dict[str, str] = {}
+        self.rows = UpsertResult()
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the backfill started; live while it runs."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def days_per_min(self) -> float:
+        return self.days / (self.elapsed / 60) if self.elapsed else 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows.total / self.elapsed if self.elapsed else 0.0
+
+    def fail(self, date: str, reason: str):
+        self.failed_days.append(date)
+        self.errors[date] = reason
+
+    def add(self, result: UpsertResult):
+        self.days += 1
+        self.rows.inserted += result.inserted
+        self.rows.updated += result.updated
+        self.rows.unchanged += result.unchanged
+
+    def to_dict(self):
+        return {
+            "factory": self.factory,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "total_days": self.total_days,
+            "days": self.days,
+            "skipped_days": self.skipped_days,
+            "failed_days": self.failed_days,
+            "errors": self.errors,
+            "rows": self.rows.to_dict(),
+            "elapsed": round(self.elapsed, 2),
+            "days_per_min": round(self.days_per_min, 1),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+        }
+
+    def __str__(self):
+        return (f"Backfill {self.factory} {self.start_date}..{self.end_date}: {self.days} days written, "
+                f"{self.skipped_days} skipped, {len(self.failed_days)} failed, {self.rows} in {self.elapsed:.1f}s "
+                f"({self.days_per_min:.1f} days/min, {self.rows_per_sec:.0f} rows/s)")
+
 
 class HbhService:
-    def __init__(self, dao):
+    """
+    MES ingestion of one factory into hour_by_hour, from the MES configured for it (MesConfig).
+    run_feature.py runs one per factory of configured_factories().
+    """
+    def __init__(self, dao, factory: str = "A6"):
         self.hbh_dto = dao
+        self.factory = factory
+        # Last stored counters of the polled days: (factory, line, date, hour) -> (smt_in, smt_out, packing)
+        self._fingerprint: dict[tuple, tuple] = {}
+        self.polls = 0
+        self.zero_write_polls = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
 
-    async def update_currently_hour(self):
-        try:
-            get_current_day = datetime.now().strftime("%Y-%m-%d")
-            get_current_hour_in_string = datetime.now().strftime("%H")
-            responds = await api_respond_to_model(
-                get_hour_by_hour(transform_date_to_mackenzie(get_current_day), get_current_hour_in_string),
-                get_current_day,
-            )
+    def stats(self) -> dict:
+        """Counters of the change-only ingestion (update_currently_hour and update_day_hours)."""
+        return {
+            "factory": self.factory,
+            "polls": self.polls,
+            "zero_write_polls": self.zero_write_polls,
+            "rows_written": self.rows_written,
+            "rows_skipped": self.rows_skipped,
+            "fingerprint_size": len(self._fingerprint),
+        }
 
-            if responds is None:
-                logging.error("No response from the API")
-                return
+    def _changed_rows(self, rows: list[dict]) -> list[dict]:
+        """Rows whose counters differ from the last ones this service stored (counted as a poll)."""
+        self.polls += 1
+        changed = []
+        for row in rows:
+            key = (row["factory"], row["line"], row["date"], row["hour"])
+            if self._fingerprint.get(key) != (row["smt_in"], row["smt_out"], row["packing"]):
+                changed.append(row)
+        self.rows_skipped += len(rows) - len(changed)
+        logging.debug(f"Hour by hour poll: {len(changed)} changed, {len(rows) - len(changed)} unchanged")
+        if not changed:
+            self.zero_write_polls += 1
+        return changed
+
+    def _remember(self, rows: list[dict]):
+        """Record committed rows in the fingerprint, which only keeps today and yesterday."""
+        self.rows_written += len(rows)
+        for row in rows:
+            key = (row["factory"], row["line"], row["date"], row["hour"])
+            self._fingerprint[key] = (row["smt_in"], row["smt_out"], row["packing"])
+
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        for key in [key for key in self._fingerprint if key[2] < yesterday]:
+            del self._fingerprint[key]
+
+    def _without_scan_lines(self, rows: list[dict], scan_lines: set[str] | None = None) -> list[dict]:
+        """
+        MES rows minus those of the lines counted by scans (hbh_line_sources): ScanAggregator adds its
+        deltas to their counters, so an absolute MES count must not replace them.
+        """
+        if not rows:
+            return rows
+        if scan_lines is None:
+            scan_lines = self.hbh_dto.query_get_scan_lines(self.factory)
+        return [row for row in rows if row["line"] not in scan_lines] if scan_lines else rows
+
+    async def log_stats(self):
+        """Log the counters of stats(); scheduled every STATS_LOG_INTERVAL by run_feature.py."""
+        logging.info(f"Hour by hour ingestion {self.factory}: {self.stats()}")
 
-            self.hbh_dto.query_update_hours([record.to_schema("A6") for record in responds.values()])
+    async def _write_changed_hours(self, rows: list[dict]):
+        """
+        Upsert only the rows whose counters differ from the last ones this service stored, so an
+        unchanged poll takes no write lock. The fingerprint is updated after a successful commit.
+        """
+        changed = self._changed_rows(rows)
+        if not changed:
+            return
+
+        if await self.hbh_dto.query_update_hours_async(changed) is None:
+            return  # Not stored: the next poll retries these rows
+        self._remember(changed)
+
+    async def update_currently_hour(self):
+        """Current-hour poll: sync_hours, whose window is the current hour once the watermark caught up."""
+        try:
+            await self.sync_hours()
 
         except Exception as e:
             logging.error(f"Error occurred during update: {e}")
 
+    async def sync_hours(self, now: datetime | None = None) -> dict | None:
+        """
+        Fetch the window [watermark, now] of the factory from the MES and advance the watermark of its
+        lines (hbh_sync_watermarks) in the same transaction as the rows.
+
+        The watermark of a line is the start of its first hour that may still change: every hour
+        before it was fetched after it closed and HEAL_SETTLE_MINUTES passed. The window starts at the
+        lowest watermark of the factory (start of today for lines never synced), so a restart or an
+        outage is caught up by the next runs, SYNC_MAX_DAYS days at a time. Once caught up the window
+        is the current hour, plus the previous one during its first HEAL_SETTLE_MINUTES. It takes one
+        get_transactions per day it covers (sync_ranges), sent together.
+
+        Only rows whose counters changed are written. A day missing a TransType stops the watermark at
+        its start; it and the days after are not written and the next run fetches them again.
+
+        :return: The window and outcome of the run, or None when the first day of the window was
+            incomplete or the database failed.
+        """
+        now = now or datetime.now()
+        factory = self.factory
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        watermarks = self.hbh_dto.query_get_watermarks(factory)
+        start = min((mark or today for mark in watermarks.values()), default=today)
+        start = _hour_start(min(start, now))
+
+        stop = _hour_start(now) + timedelta(hours=1)
+        catch_up_limit = start.replace(hour=0) + timedelta(days=SYNC_MAX_DAYS)
+        if stop > catch_up_limit:
+            stop = synced_until = catch_up_limit
+        else:
+            synced_until = max(_hour_start(now - timedelta(minutes=HEAL_SETTLE_MINUTES)), start)
+
+        ranges = sync_ranges(start, stop)
+        # Steady state (the current hour) keeps the deadline below the poll interval
+        timeout = CURRENT_HOUR_TIMEOUT if len(ranges) == 1 else None
+        semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        async def fetch_range(date: str, first_hour: int, last_hour: int) -> dict:
+            async with semaphore:
+                return await get_transactions(day=transform_date_to_mackenzie(date), start_hour=f"{first_hour:02d}",
+                                              end_hour=f"{last_hour:02d}", timeout=timeout, factory=factory)
+
+        rows = []
+        incomplete = False
+        for (date, first_hour, _), data in zip(ranges, await asyncio.gather(*(fetch_range(*r) for r in ranges))):
+            if any(field not in data for field in HOUR_FIELDS):
+                synced_until = min(synced_until, datetime.strptime(date, "%Y-%m-%d").replace(hour=first_hour))
+                incomplete = True
+                break
+            rows.extend(hour_rows(data, date, factory) or [])
+        rows = self._without_scan_lines(rows)
+
+        # Only a failed first range leaves nothing to store; an empty complete response is a quiet hour
+        if incomplete and synced_until <= start:
+            logging.error(f"Sync {factory}: no complete response from the MES since {start}")
+            return None
+
+        changed = self._changed_rows(rows)
+        lines = {**watermarks, **{row["line"]: watermarks.get(row["line"]) for row in rows}}
+        advanced = sorted(line for line, mark in lines.items() if mark is None or mark < synced_until)
+        result = UpsertResult()
+        if changed or advanced:
+            try:
+                result = await self.hbh_dto.query_sync_async(changed, factory, advanced, synced_until)
+            except Exception as e:
+                logging.error(f"Sync {factory} not stored, the next run fetches it again: {e}")
+                return None
+            self._remember(changed)
+
+        report = {
+            "factory": factory,
+            "start": start.isoformat(),
+            "synced_until": synced_until.isoformat(),
+            "requests": 3 * len(ranges),
+            "lines_advanced": len(advanced),
+            "rows": result.to_dict(),
+        }
+        if len(ranges) > 1 or start < _hour_start(now) - timedelta(hours=1):
+            logging.info(f"Sync caught up: {report}")
+        return report
+
     async def update_day_hours(self):
         try:
             get_current_day = datetime.now().strftime("%Y-%m-%d")
-            responds = await api_respond_to_model(
-                get_all_day(transform_date_to_mackenzie(get_current_day)),
+            rows = hour_rows(
+                await get_all_day(transform_date_to_mackenzie(get_current_day), factory=self.factory),
                 get_current_day,
+                self.factory,
             )
 
-            self.hbh_dto.query_update_hours([record.to_schema("A6") for record in responds.values()])
+            if rows is None:
+                logging.error(f"No response from the {self.factory} API")
+                return
+
+            await self._write_changed_hours(self._without_scan_lines(rows))
 
         except Exception as e:
             logging.error(f"Error occurred during update: {e}")
@@ -47,45 +336,164 @@ class HbhService:
 
         try:
             get_current_day = datetime.now().strftime("%Y-%m-%d")
-            responds =  await api_respond_to_model(
-                get_all_day(transform_date_to_mackenzie(get_current_day)),
+            rows = hour_rows(
+                await get_all_day(transform_date_to_mackenzie(get_current_day), factory=self.factory),
                 get_current_day,
+                self.factory,
             )
 
-            if responds is None:
-                logging.error("No response from the API")
+            if rows is None:
+                logging.error(f"No response from the {self.factory} API")
                 return
 
-            self.hbh_dto.query_update_hours([record.to_schema("A6") for record in responds.values()])
+            await self.hbh_dto.query_update_hours_async(self._without_scan_lines(rows))
 
             return True
 
         except Exception as e:
             logging.error(f"Error occurred during update: {e}")
 
-    async def update_hours_form_range_of_dates(self, start_date: str, end_date: str):
+    async def update_hours_form_range_of_dates(self, start_date: str, end_date: str) -> BackfillReport | None:
         try:
-            _responds: list[HourByHourSchema] = []
-            dates = transform_range_of_dates(form=start_date, at=end_date)
-            for date in dates:
-                responds = await api_respond_to_model(
-                    data=get_all_day(day=transform_date_to_mackenzie(date)),
-                    date=date
-                )
-                _responds.extend([record.to_schema("A6") for record in responds.values()])
-
-            self.hbh_dto.query_update_hours(_responds)
+            return await self.backfill_range_of_dates(start_date, end_date)
 
         except Exception as e:
             logging.error(f"Error occurred during update: {e}")
 
+    async def backfill_range_of_dates(
+            self,
+            start_date: str,
+            end_date: str,
+            concurrency: int = BACKFILL_CONCURRENCY,
+            resume: bool = False,
+            report: BackfillReport | None = None
+    ) -> BackfillReport:
+        """
+        Fetch and store every day of the range, `concurrency` days at a time.
+
+        Each day is committed on its own as soon as it is fetched, so a crash only loses the days in
+        flight. Past days are recorded in hbh_backfill_days with their rows; with `resume` those are
+        skipped, so re-running an interrupted backfill continues where it stopped. Without it every day
+        is fetched again (e.g. after an MES correction). A day missing one
+        of its TransTypes is not written and is reported in `failed_days` (retried on the next run).
+        Pass a `report` to follow the progress while it runs.
+        """
+        factory = self.factory
+        report = report or BackfillReport(factory, start_date, end_date)
+        report.started = time.perf_counter()
+
+        dates = transform_range_of_dates(form=start_date, at=end_date)
+        if resume:
+            done = self.hbh_dto.query_get_backfilled_dates(factory, start_date, end_date)
+            report.skipped_days = sum(1 for date in dates if date in done)
+            dates = [date for date in dates if date not in done]
+        report.total_days = len(dates)
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        semaphore = asyncio.Semaphore(concurrency)
+        scan_lines = self.hbh_dto.query_get_scan_lines(factory)
+
+        async def backfill_day(date: str):
+            try:
+                async with semaphore:
+                    data = await get_all_day(day=transform_date_to_mackenzie(date), factory=factory)
+                missing = [field for field in HOUR_FIELDS if field not in data]
+                if missing:
+                    logging.error(f"Backfill {factory} {date}: no {', '.join(missing)} from the MES")
+                    report.fail(date, f"No {', '.join(missing)} from the MES")
+                    return
+
+                rows = self._without_scan_lines(hour_rows(data, date, factory) or [], scan_lines)
+                # Today is still being produced: written but not recorded as complete
+                result = await self.hbh_dto.query_backfill_day_async(rows, factory, date, complete=date < today)
+                report.add(result)
+            except Exception as e:
+                logging.error(f"Backfill {factory} {date} failed: {e}")
+                report.fail(date, str(e))
+
+        await asyncio.gather(*(backfill_day(date) for date in dates))
+
+        report.failed_days.sort()
+        report.finished = time.perf_counter()
+        logging.info(str(report))
+        return report
+
+    def find_gaps(self, start_date: str, end_date: str) -> list[tuple[str, str, int]]:
+        """Missing (date, line, hour) slots of the range, up to HEAL_SETTLE_MINUTES ago."""
+        until = datetime.now() - timedelta(minutes=HEAL_SETTLE_MINUTES)
+        return self.hbh_dto.query_missing_hours(self.factory, start_date, end_date, until=until)
+
+    async def heal_gaps(
+            self,
+            lookback_days: int = HEAL_LOOKBACK_DAYS,
+            max_fetches: int = HEAL_MAX_FETCHES,
+            concurrency: int = BACKFILL_CONCURRENCY
+    ) -> dict:
+        """
+        Fetch from the MES only the hours missing from hour_by_hour over the last `lookback_days` days.
+
+        Missing slots (find_gaps) are grouped by gap_ranges into one request per date and run of hours,
+        so the MES traffic follows the size of the gap, not the length of the range. Only the missing
+        slots (hours of the planned shifts) are written; a slot the complete MES answer has no count for
+        is stored as zeros, so it is not fetched again. Ranges with a TransType missing are left for the next run.
+        """
+        started = time.perf_counter()
+        factory = self.factory
+        end_date = datetime.now().strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+
+        slots = self.find_gaps(start_date, end_date)
+        ranges = gap_ranges(slots)
+        semaphore = asyncio.Semaphore(concurrency)
+        failed: list[str] = []
+
+        async def heal_range(date: str, start_hour: int, end_hour: int, missing: list[tuple[str, int]]) -> list[dict]:
+            async with semaphore:
+                data = await get_transactions(day=transform_date_to_mackenzie(date),
+                                              start_hour=f"{start_hour:02d}", end_hour=f"{end_hour:02d}",
+                                              factory=factory)
+            if any(field not in data for field in HOUR_FIELDS):
+                failed.append(f"{date} {start_hour:02d}-{end_hour:02d}")
+                return []
+
+            fetched = {(row["line"], row["hour"]): row for row in hour_rows(data, date, factory) or []}
+            return [
+                fetched.get((line, hour)) or {"factory": factory, "line": line, "date": date, "hour": hour,
+                                              "smt_in": 0, "smt_out": 0, "packing": 0}
+                for line, hour in missing
+            ]
+
+        rows = []
+        for healed in await asyncio.gather(*(heal_range(*gap) for gap in ranges[:max_fetches])):
+            rows.extend(healed)
+
+        result = UpsertResult()
+        if rows:
+            result = await self.hbh_dto.query_update_hours_async(rows) or result
+
+        report = {
+            "factory": factory,
+            "start_date": start_date,
+            "end_date": end_date,
+            "missing_slots": len(slots),
+            "fetched_ranges": min(len(ranges), max_fetches),
+            "pending_ranges": max(len(ranges) - max_fetches, 0),
+            "failed_ranges": sorted(failed),
+            "rows": result.to_dict(),
+            "elapsed": round(time.perf_counter() - started, 2),
+        }
+        if slots:
+            logging.info(f"Heal gaps: {report}")
+        return report
+
     async def update_hours_at_day(self, date: str):
         try:
-            responds = await api_respond_to_model(
-                data=get_all_day(day=transform_date_to_mackenzie(date)),
-                date=date
+            rows = hour_rows(
+                data=await get_all_day(day=transform_date_to_mackenzie(date), factory=self.factory),
+                date=date,
+                factory=self.factory
             )
-            self.hbh_dto.query_update_hours([record.to_schema("A6") for record in responds.values()])
+            await self.hbh_dto.query_update_hours_async(self._without_scan_lines(rows or []))
 
         except Exception as e:
             logging.error(f"Error occurred during update: {e}")
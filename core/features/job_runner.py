@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from datetime import datetime
+
+from core.db.util import generate_sortable_id
+
+logger = logging.getLogger(__name__)
+
+# Jobs running at the same time; the others wait in the queue
+JOB_WORKERS = 2
+
+# Finished jobs kept for the status endpoint (oldest dropped first)
+JOB_HISTORY = 100
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job:
+    """
+    A background job. `fn` is an async function called as `fn(job, **kwargs)`; it may set `job.progress`
+    to an object with a `to_dict()` method that it keeps updating while it runs.
+    """
+    def __init__(self, name: str, fn, kwargs: dict):
+        self.id = generate_sortable_id()
+        self.name = name
+        self.fn = fn
+        self.kwargs = kwargs
+        self.status = JobStatus.QUEUED
+        self.created_at = datetime.now()
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self.progress = None
+        self.result = None
+        self.error: str | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "params": self.kwargs,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.to_dict() if self.progress is not None else None,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    """
+    Singleton running background jobs of the process on a bounded pool of JOB_WORKERS asyncio workers.
+
+    Jobs run on the event loop of the first submit (the API loop), detached from the request that
+    submitted them, so they keep running when the client disconnects. Job state lives in memory:
+    jobs queued or running when the process stops are lost.
+
+    Example:
+        async def rebuild(job, day):
+            ...
+
+        job = JobRunner().submit("rebuild", rebuild, day="2024-12-16")
+        JobRunner().get(job.id).to_dict()
+    """
+    _instance = None  # Class-level attribute to hold the singleton instance
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(JobRunner, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._jobs: dict[str, Job] = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        # Fresh context: the workers must not inherit the request scope of the first submit
+        self._tasks = [
+            asyncio.get_running_loop().create_task(self._work(), name=f"job-worker-{i}", context=contextvars.Context())
+            for i in range(self.workers)
+        ]
+
+    def submit(self, name: str, fn, **kwargs) -> Job:
+        """Queue a job and return it right away. Must be called from the event loop."""
+        self._ensure_started()
+        job = Job(name, fn, kwargs)
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        return sorted(self._jobs.values(), key=lambda job: job.id, reverse=True)
+
+    async def stop(self):
+        """Cancel the workers (and the running jobs)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def _prune(self):
+        finished = [job for job in sorted(self._jobs.values(), key=lambda job: job.id) if job.finished]
+        for job in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self._jobs[job.id]
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now()
+            logger.info(f"Job {job.name} {job.id} started")
+            try:
+                job.result = await job.fn(job, **job.kwargs)
+                job.status = JobStatus.DONE
+            except asyncio.CancelledError:
+                job.status = JobStatus.FAILED
+                job.error = "Cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.name} {job.id} failed: {e}")
+                job.status = JobStatus.FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.now()
+                self._queue.task_done()
+            logger.info(f"Job {job.name} {job.id} {job.status}")
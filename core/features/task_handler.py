@@ -100,7 +100,7 @@ class AsyncPeriodicExecutor:
 
     async def schedule_task(
             self, func, interval_seconds=None, daily=None, hourly=None,
-            weekly_day=None, monthly_day=None, task_name=None,
+            weekly_day=None, monthly_day=None, adaptive=None, task_name=None,
     ):
         """
         Schedules a programmable task based on the provided scheduling parameters.
@@ -111,6 +111,7 @@ class AsyncPeriodicExecutor:
         :param hourly: If True, schedule task at the top of each hour.
         :param weekly_day: Schedule task weekly on a specific day (0=Monday to 6=Sunday).
         :param monthly_day: Schedule task monthly on a specific day (1-31).
+        :param adaptive: Callable returning the seconds to wait before each run (e.g. AdaptivePoller.next_interval).
         :param task_name: Optional name for the task; defaults to the function's name.
         """
         if not asyncio.iscoroutinefunction(func):
@@ -152,9 +153,16 @@ class AsyncPeriodicExecutor:
                 "day": monthly_day,
                 "name": task_name or func.__name__,
             }
+        elif adaptive is not None:
+            task_info = {
+                "type": "adaptive",
+                "func": func,
+                "next_interval": adaptive,
+                "name": task_name or func.__name__,
+            }
         else:
             raise ValueError(
-                "Specify one of interval_seconds, run_at, hourly, weekly_day, or monthly_day."
+                "Specify one of interval_seconds, run_at, hourly, weekly_day, monthly_day or adaptive."
             )
 
         # Add the task to the programmable tasks dictionary
@@ -250,6 +258,8 @@ class AsyncPeriodicExecutor:
                         schedule["day"] = task_info["day"]
                     elif task_type == "monthly":
                         schedule["day"] = task_info["day"]
+                    elif task_type == "adaptive":
+                        schedule["next_interval"] = task_info["next_interval"]
                     else:
                         logger.error(f"Unknown task type: {task_type}")
                         break
@@ -352,6 +362,12 @@ class AsyncPeriodicExecutor:
                 # If today is the day but the time has passed, schedule for next week
                 next_run += timedelta(weeks=1)
             return next_run
+        elif task_type == "adaptive":
+            # For adaptive tasks, the callable decides the wait before each run
+            next_interval = schedule.get("next_interval")
+            if next_interval is None:
+                return None
+            return now + timedelta(seconds=next_interval())
         elif task_type == "monthly":
             # For monthly tasks, schedule on the specified day
             day_of_month = schedule.get("day")
@@ -1,4 +1,5 @@
 import logging
+import os
 from logging.handlers import RotatingFileHandler
 
 class Logger:
@@ -34,7 +35,8 @@ class Logger:
                 console_handler = logging.StreamHandler()
                 console_handler.setLevel(console_level)
 
-                # Rotating file handler
+                # Rotating file handler (config/logs is not versioned)
+                os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
                 file_handler = RotatingFileHandler(log_file, maxBytes=max_file_size, backupCount=backup_count)
                 file_handler.setLevel(file_level)
 
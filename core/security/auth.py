@@ -8,12 +8,13 @@ from fastapi.security import OAuth2PasswordBearer, HTTPBasic, HTTPBasicCredentia
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from core.data.handlers.translator import translate_user_schema_to_model
 from core.data.models.user_model import UserModel
 from core.data.schemas.user_schema import UserSchema
-from core.db.database import get_db_session
+from core.db.database import DBConnection
 from core.data.models.token_model import TokenDataModel
 
 # Secret key to encode JWT tokens
@@ -29,6 +30,21 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 security = HTTPBasic()
 
+def get_auth_db_session():
+    """
+    Session on the auth database (users, roles, routes, permissions).
+    A separate file when `auth_database` is configured, so logins do not queue behind ingestion writes.
+    """
+    db = DBConnection().get_auth_session()
+    try:
+        yield db
+    except SQLAlchemyError as e:
+        db.rollback()  # Rollback transaction in case of an exception
+        raise e
+    finally:
+        db.close()
+
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -43,7 +59,7 @@ def get_user(db: Session, username: str) -> Optional[UserSchema]:
 
 def get_user_by_basic(
         credentials: HTTPBasicCredentials = Depends(security),
-        db: Session = Depends(get_db_session)
+        db: Session = Depends(get_auth_db_session)
 )-> UserModel:
     user = get_user(db, credentials.username)
     if user is None or not verify_password(credentials.password, user.hashed_password):
@@ -74,7 +90,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 # Dependency to get the current active user
 async def get_user_by_token(
         token: str = Depends(oauth2_scheme),
-        db: Session = Depends(get_db_session)
+        db: Session = Depends(get_auth_db_session)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
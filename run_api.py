@@ -1,7 +1,10 @@
 import configparser
 import argparse
+import os
+
 import uvicorn
 
+from core.db.profile import SERVER_ENV
 from core.logger.logger import Logger
 
 # Initialize the logger
@@ -60,6 +63,9 @@ def start_server():
 
 
 
+    # Workers (and reload subprocesses) read the SQLite profile db_<server> from this variable
+    os.environ[SERVER_ENV] = args.server
+
     try:
         app_logger.info(f"Starting server on {_host}:{_port}")
         uvicorn.run(
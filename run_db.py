@@ -1,8 +1,7 @@
 import argparse
+import os
 from sqlite3 import IntegrityError
 
-from requests import session
-
 from core.data.dao.employee_dao import LineDAO, SectionDAO, AssignmentDAO, EmployeeDAO, PositionDAO, DepartmentDAO
 from core.data.schemas.defaults_schema import sections_schemas, return_assignments, positions_schemas, \
     departments_schemas
@@ -11,14 +10,18 @@ from core.data.schemas.all_schemas import LineSchema, EmployeeSchema, SectionSch
 
 from core.data.schemas.user_schema import UserSchema, RoleSchema, RouteSchema, PermissionSchema
 
-from core.db.database import DBConnection
+from core.db.database import DBConnection, Base, is_auth_table
+from core.db.migrations import apply_migrations, explain_query_plans, print_query_plans, SCHEMA_VERSION, \
+    rekey_tables
 
 from core.db.util import safe_execute
+from core.features.hour_by_hour.hbh_archive import MES_ARCHIVE_ENV, replay_archive
 from core.features.hour_by_hour.hbh_handlers import platform_to_db_from_json, work_plan_to_db_from_json, \
     hour_by_hour_to_db_from_json
 from core.security.auth import get_password_hash
 
-from core.data.schemas.hour_by_hour_schema import HourByHourSchema, WorkPlanSchema, PlatformSchema
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema, WorkPlanSchema, PlatformSchema, HbhBackfillDaySchema, \
+    HbhSyncWatermarkSchema, HbhLineSourceSchema
 
 
 def create_tables():
@@ -29,6 +32,9 @@ def create_tables():
     DBConnection().create_table(AssignmentSchema)
     DBConnection().create_table(WorkRecordSchema)
     DBConnection().create_table(HourByHourSchema)
+    DBConnection().create_table(HbhBackfillDaySchema)
+    DBConnection().create_table(HbhSyncWatermarkSchema)
+    DBConnection().create_table(HbhLineSourceSchema)
     DBConnection().create_table(WorkPlanSchema)
     DBConnection().create_table(PlatformSchema)
     DBConnection().create_table(UserSchema)
@@ -38,9 +44,90 @@ def create_tables():
     DBConnection().create_table(ClusterSchema)
     DBConnection().create_table(CycleTimeSchema)
     DBConnection().create_table(CycleTimeRecordSchema)
+    # Indexes of new tables come from create_all; stamp the schema version
+    apply_migrations(DBConnection().engine)
     print('Database initialized')
 
 
+def migrate():
+    engine = DBConnection().engine
+
+    print_query_plans('Query plans before migration', explain_query_plans(engine))
+
+    applied = apply_migrations(engine)
+    if applied:
+        for migration in applied:
+            print(f"Applied {migration}")
+    else:
+        print(f"Database already at schema version {SCHEMA_VERSION}")
+
+    # Refresh the planner statistics so the new indexes are considered
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+
+    print_query_plans('Query plans after migration', explain_query_plans(engine))
+
+
+def rekey():
+    engine = DBConnection().engine
+    counts = rekey_tables(engine)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows re-keyed")
+
+    # Reclaim the pages of the old tables and refresh the planner statistics
+    with engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+        connection.exec_driver_sql("ANALYZE")
+        connection.commit()
+    print('Re-keyed to time-ordered ids')
+
+
+def replay(archive: str | None, start_date: str, end_date: str, factory: str = 'A6'):
+    """
+    Rebuild hour_by_hour for a date range from the raw MES archive (no network).
+    """
+    archive = archive or os.environ.get(MES_ARCHIVE_ENV)
+    if not archive or not start_date or not end_date:
+        print('replay_archive needs --archive (or $SKY_MES_ARCHIVE), --start_date and --end_date')
+        return
+
+    result = replay_archive(archive, start_date, end_date, factory)
+    print(f"{result['days']} days replayed in {result['elapsed']}s ({result['rows_per_sec']} rows/s): {result['rows']}")
+    if result['missing_days']:
+        print(f"Not archived: {', '.join(result['missing_days'])}")
+
+
+def split_auth():
+    """
+    Copy the auth tables of the main database into the configured `auth_database` file.
+    Rows already present are kept, so the command can be re-run.
+    """
+    db = DBConnection()
+    if not db.is_auth_split:
+        print(f"No auth_database configured for {db.profile.name}; auth tables stay in the main database")
+        return
+
+    db.create_all()
+    auth_tables = [table for table in Base.metadata.sorted_tables if is_auth_table(table)]
+    with db.auth_engine.connect() as connection:
+        connection.exec_driver_sql("ATTACH DATABASE ? AS main_db", (db.engine.url.database,))
+        try:
+            existing = {row[0] for row in connection.exec_driver_sql(
+                "SELECT name FROM main_db.sqlite_master WHERE type = 'table'")}
+            for table in auth_tables:
+                if table.name not in existing:
+                    continue
+                columns = ", ".join(column.name for column in table.columns)
+                copied = connection.exec_driver_sql(
+                    f"INSERT OR IGNORE INTO main.{table.name} ({columns}) SELECT {columns} FROM main_db.{table.name}"
+                ).rowcount
+                print(f"{table.name}: {copied} rows copied")
+            connection.commit()
+        finally:
+            connection.exec_driver_sql("DETACH DATABASE main_db")
+    print(f"Auth tables copied to {db.profile.auth_database}")
+
+
 def populate_user():
 
 
@@ -139,23 +226,36 @@ def populate_employee():
     )
 
 
-def populate_hour_by_hour():
-    #platform_to_db_from_json('config/data/platforms.json')
-    #work_plan_to_db_from_json('config/data/work_plans.json')
-    #hour_by_hour_to_db_from_json('config/data/hour_by_hour.json')
-    pass
+def populate_hour_by_hour(data_dir: str):
+    """
+    Load platforms, work plans and (when present) hour_by_hour.json of `data_dir`.
+    Upserts by key, so the command can be re-run after editing the files.
+    """
+    platform_to_db_from_json(os.path.join(data_dir, 'platforms.json'))
+    work_plan_to_db_from_json(os.path.join(data_dir, 'work_plans.json'))
+    hour_by_hour_file = os.path.join(data_dir, 'hour_by_hour.json')
+    if os.path.exists(hour_by_hour_file):
+        hour_by_hour_to_db_from_json(hour_by_hour_file)
+
 
-def populate_work_plan():
-    work_plan_to_db_from_json('config/data/work_plans.json')
+def populate_work_plan(data_dir: str):
+    work_plan_to_db_from_json(os.path.join(data_dir, 'work_plans.json'))
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Manage database')
     parser.add_argument(
         '--db',
         type=str,
-        choices=['pop_user', 'create_tables', 'pop_employee', 'pop_hour_by_hour', 'pop_work_plan'],
+        choices=['pop_user', 'create_tables', 'pop_employee', 'pop_hour_by_hour', 'pop_work_plan', 'migrate',
+                 'split_auth', 'rekey', 'replay_archive'],
         help='...'
     )
+    parser.add_argument('--data_dir', type=str, default='config/data',
+                        help='pop_hour_by_hour, pop_work_plan: directory of the seed JSON files')
+    parser.add_argument('--archive', type=str, help='replay_archive: MES archive directory')
+    parser.add_argument('--start_date', type=str, help='replay_archive: first day (YYYY-MM-DD)')
+    parser.add_argument('--end_date', type=str, help='replay_archive: last day (YYYY-MM-DD)')
+    parser.add_argument('--factory', type=str, default='A6', help='replay_archive: factory of the archive')
 
     arg = parser.parse_args()
 
@@ -166,9 +266,17 @@ if __name__ == '__main__':
     elif arg.db == 'create_tables':
         create_tables()
     elif arg.db == 'pop_hour_by_hour':
-        populate_hour_by_hour()
+        populate_hour_by_hour(arg.data_dir)
     elif arg.db == 'pop_work_plan':
-        populate_work_plan()
+        populate_work_plan(arg.data_dir)
+    elif arg.db == 'migrate':
+        migrate()
+    elif arg.db == 'split_auth':
+        split_auth()
+    elif arg.db == 'rekey':
+        rekey()
+    elif arg.db == 'replay_archive':
+        replay(arg.archive, arg.start_date, arg.end_date, arg.factory)
 
 # def add_route_to_user(db: Session, route_path: str, username: str, description: str = None):
 #     # Fetch or create the route
@@ -2,9 +2,11 @@ import argparse
 import asyncio
 from datetime import datetime
 
-from core.data.dao.hbh_dao import HbhDAO
+from core.data.dao.hbh_dao import HbhDAO, WorkPlanDAO
 from core.db.database import DBConnection
-from core.features.hour_by_hour.hbh_service import  HbhService
+from core.features.hour_by_hour.hbh_mackenzie_api import MackenzieClient, configured_factories
+from core.features.hour_by_hour.hbh_poller import AdaptivePoller
+from core.features.hour_by_hour.hbh_service import  HbhService, HEAL_INTERVAL, STATS_LOG_INTERVAL
 from core.features.task_handler import AsyncPeriodicExecutor, logger
 
 if __name__ == "__main__":
@@ -28,13 +30,29 @@ if __name__ == "__main__":
         async def ttes():
             print("Hello")
 
-        hbh_service = HbhService(dao=HbhDAO(connection=DBConnection().get_session()))
+        # One ingestion worker per factory with a MES ([mes_<factory>] in config/api_config.ini); their
+        # tasks run side by side on the executor, each against its own MES
+        factories = configured_factories()
+        logger.info(f"Ingesting factories: {', '.join(factories)}")
 
         async def schedule_tasks():
 
-            await executor.schedule_task(hbh_service.update_currently_hour, interval_seconds=30)
-            await executor.schedule_task(hbh_service.update_day_hours, hourly=True)
-            await executor.schedule_task(hbh_service.update_previews_day, daily= "01:00")
+            for factory in factories:
+                hbh_service = HbhService(dao=HbhDAO(connection=DBConnection().get_session()), factory=factory)
+                # Current-hour polls follow the work plans and the observed changes instead of a fixed 30 s;
+                # each one syncs from the factory's watermark, so closed hours need no hourly whole-day fetch
+                current_hour_poller = AdaptivePoller(hbh_service, WorkPlanDAO(DBConnection().get_session()), factory)
+
+                await executor.schedule_task(current_hour_poller.poll, adaptive=current_hour_poller.next_interval,
+                                             task_name=f"update_currently_hour_{factory}")
+                await executor.schedule_task(hbh_service.update_previews_day, daily= "01:00",
+                                             task_name=f"update_previews_day_{factory}")
+                # Re-fetch only the hours missing after a downtime of the scheduler or the MES
+                await executor.schedule_task(hbh_service.heal_gaps, interval_seconds=HEAL_INTERVAL,
+                                             task_name=f"heal_gaps_{factory}")
+                # Polls, rows written and rows skipped by the change-only writes
+                await executor.schedule_task(hbh_service.log_stats, interval_seconds=STATS_LOG_INTERVAL,
+                                             task_name=f"log_stats_{factory}")
 
 
         async def main():
@@ -47,6 +65,8 @@ if __name__ == "__main__":
                 executor.stop_event.set()
                 # Wait for the executor to finish cleaning up
                 await executor.loop_task
+            finally:
+                await MackenzieClient().close()
 
 
         asyncio.run(main())
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from core.data.dao import hbh_dao
+from core.data.repositories.hbhRepo import HourByHourRepository
+from core.data.schemas.hour_by_hour_schema import HourByHourSchema, HbhLineSourceSchema
+from core.features.hour_by_hour.hbh_scans import ScanAggregator
+
+
+class SessionWriter:
+    """DBWriter stand-in running each job on one in-memory SQLite session and committing it."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def execute_async(self, job):
+        result = job(self.session)
+        self.session.commit()
+        return result
+
+
+@pytest.fixture
+def session(monkeypatch):
+    engine = create_engine("sqlite://")
+    for schema in (HourByHourSchema, HbhLineSourceSchema):
+        schema.__table__.create(engine)
+    with Session(engine) as session:
+        monkeypatch.setattr(hbh_dao, "DBWriter", lambda: SessionWriter(session))
+        yield session
+
+
+def counters(session) -> dict:
+    return {
+        (row.line, row.hour): (row.smt_in, row.smt_out, row.packing)
+        for row in session.execute(select(HourByHourSchema)).scalars()
+    }
+
+
+def test_ingest_skips_scan_fed_lines(session):
+    ScanAggregator._write(session, [{"factory": "A6", "line": "J01", "date": "2024-12-16", "hour": 8,
+                                     "smt_in": 3, "smt_out": 2, "packing": 1}])
+    session.commit()
+
+    body = json.dumps([
+        {"line": "J01", "date": "2024-12-16", "hour": 8, "smt_in": 100, "smt_out": 100, "packing": 100},
+        {"line": "J01", "date": "2024-12-16", "hour": 9, "smt_in": 100, "smt_out": 100, "packing": 100},
+        {"line": "J02", "date": "2024-12-16", "hour": 8, "smt_in": 7, "smt_out": 6, "packing": 5},
+    ]).encode()
+    data = asyncio.run(HourByHourRepository(None).ingest_hours(body, "application/json"))
+
+    assert data["rows"] == 3
+    assert data["inserted"] == 1
+    assert data["skipped"] == [{"factory": "A6", "line": "J01", "rows": 2, "reason": "line counted by scans"}]
+    assert counters(session) == {("J01", 8): (3, 2, 1), ("J02", 8): (7, 6, 5)}
+
+
+def test_ingest_writes_lines_of_other_factories(session):
+    ScanAggregator._write(session, [{"factory": "B1", "line": "J01", "date": "2024-12-16", "hour": 8,
+                                     "smt_in": 1, "smt_out": 0, "packing": 0}])
+    session.commit()
+
+    body = b'{"line": "J01", "date": "2024-12-16", "hour": 9, "smt_in": 4, "smt_out": 4, "packing": 4}\n'
+    data = asyncio.run(HourByHourRepository(None).ingest_hours(body, "application/x-ndjson", "A6"))
+
+    assert data["inserted"] == 1
+    assert data["skipped"] == []
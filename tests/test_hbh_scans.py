@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from core.db.util import UpsertResult
+from core.features.hour_by_hour import hbh_scans
+from core.features.hour_by_hour.hbh_scans import ScanAggregator, scan_slot
+
+
+class FakeWriter:
+    """DBWriter stand-in: fails while `fail` is set, otherwise keeps the job and returns it unrun."""
+
+    def __init__(self):
+        self.fail = False
+        self.jobs = []
+
+    async def execute_async(self, job):
+        if self.fail:
+            raise RuntimeError("database is locked")
+        self.jobs.append(job)
+        return job
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = FakeWriter()
+    monkeypatch.setattr(hbh_scans, "DBWriter", lambda: writer)
+    monkeypatch.setattr(ScanAggregator, "_instance", None)
+    monkeypatch.setattr(ScanAggregator, "_ensure_started", lambda self: None)
+    return writer
+
+
+def test_scan_slot_defaults():
+    moment = datetime(2024, 12, 16, 8, 15, 3)
+    slot = scan_slot({"line": "J01", "type": "PACKING", "ts": moment.isoformat()})
+    assert slot == (("A6", "J01", "2024-12-16", 8), 2, 1)
+
+
+def test_scan_slot_epoch_and_factory():
+    moment = datetime(2024, 12, 16, 23, 59, 59)
+    event = {"line": "J02", "type": "INPUT", "ts": moment.timestamp(), "qty": 5, "factory": "B1"}
+    assert scan_slot(event) == (("B1", "J02", "2024-12-16", 23), 0, 5)
+
+
+@pytest.mark.parametrize("ts", [1e20, -1e20, float("inf"), float("-inf")])
+def test_scan_slot_ts_out_of_range(ts):
+    with pytest.raises(ValueError, match="ts out of range"):
+        scan_slot({"line": "J01", "type": "SMT_OUT", "ts": ts})
+
+
+@pytest.mark.parametrize("event", [
+    "J01",
+    {"type": "PACKING"},
+    {"line": "J0001", "type": "PACKING"},
+    {"line": "J01", "type": "REWORK"},
+    {"line": "J01", "type": "PACKING", "qty": 0},
+    {"line": "J01", "type": "PACKING", "qty": True},
+    {"line": "J01", "type": "PACKING", "ts": True},
+    {"line": "J01", "type": "PACKING", "ts": "yesterday"},
+    {"line": "J01", "type": "PACKING", "ts": float("nan")},
+])
+def test_scan_slot_rejects(event):
+    with pytest.raises(ValueError):
+        scan_slot(event)
+
+
+def test_flush_failure_merges_back(writer):
+    aggregator = ScanAggregator()
+    ts = datetime(2024, 12, 16, 8).isoformat()
+    aggregator.add([{"line": "J01", "type": "SMT_IN", "ts": ts, "qty": 2}])
+
+    writer.fail = True
+    assert asyncio.run(aggregator.flush()) is None
+    # Counted while the failed flush was in flight
+    aggregator.add([{"line": "J01", "type": "SMT_IN", "ts": ts}, {"line": "J01", "type": "PACKING", "ts": ts}])
+    assert aggregator._pending == {("A6", "J01", "2024-12-16", 8): [3, 0, 1]}
+    assert aggregator._failed_flushes == 1
+
+    writer.fail = False
+    assert asyncio.run(aggregator.flush()) is writer.jobs[0]
+    assert aggregator._pending == {}
+    assert aggregator._flushes == 1
+    assert asyncio.run(aggregator.flush()) is None
+
+
+def test_flush_writes_deltas_and_marks_lines(writer, monkeypatch):
+    written = {}
+
+    class FakeDAO:
+        def __init__(self, session):
+            pass
+
+        def query_mark_line_sources(self, lines, source):
+            written["lines"] = (lines, source)
+
+        def query_increment_hours(self, rows):
+            written["rows"] = rows
+            return UpsertResult(inserted=len(rows))
+
+    monkeypatch.setattr(hbh_scans, "HbhDAO", FakeDAO)
+    aggregator = ScanAggregator()
+    ts = datetime(2024, 12, 16, 8).isoformat()
+    aggregator.add([{"line": "J01", "type": "SMT_OUT", "ts": ts}, {"line": "J03", "type": "PACKING", "ts": ts}])
+    asyncio.run(aggregator.flush())
+
+    assert writer.jobs[0](None).inserted == 2
+    assert written["lines"] == ({("A6", "J01"), ("A6", "J03")}, hbh_scans.LINE_SOURCE_SCAN)
+    assert {row["line"]: (row["smt_in"], row["smt_out"], row["packing"]) for row in written["rows"]} == {
+        "J01": (0, 1, 0), "J03": (0, 0, 1)}
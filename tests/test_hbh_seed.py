@@ -0,0 +1,106 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from core.data.dao.hbh_dao import WorkPlanDAO
+from core.data.schemas.hour_by_hour_schema import PlatformSchema, WorkPlanSchema
+from core.db.database import Base
+from core.db.migrations import apply_migrations, SCHEMA_VERSION
+from core.features.hour_by_hour import hbh_handlers
+from core.features.hour_by_hour.hbh_handlers import platform_to_db_from_json, work_plan_to_db_from_json
+
+PLATFORMS = [{"platform": "Alpha", "sku": "A1", "uph": 100}, {"platform": "Beta", "sku": "B1", "uph": 80}]
+
+
+class SessionWriter:
+    """DBWriter stand-in running each job on one session and committing it."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def execute(self, job):
+        result = job(self.session)
+        self.session.commit()
+        return result
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def session(engine, monkeypatch):
+    with Session(engine) as session:
+        monkeypatch.setattr(hbh_handlers, "DBWriter", lambda: SessionWriter(session))
+        yield session
+
+
+def seed_file(tmp_path, name: str, records: list) -> str:
+    path = tmp_path / name
+    path.write_text(json.dumps(records))
+    return str(path)
+
+
+def plan(line: str, planned_hours: float, platform_id: str) -> dict:
+    return {"date": "2024-12-16", "factory": "A6", "line": line, "planned_hours": planned_hours,
+            "platform_id": platform_id, "state": "RUN", "target_oee": 0.75, "uph_i": 100, "week": 51}
+
+
+def test_seed_without_ids_is_idempotent(tmp_path, session):
+    platforms = seed_file(tmp_path, "platforms.json", PLATFORMS)
+    assert platform_to_db_from_json(platforms)["rows"]["inserted"] == 2
+    assert platform_to_db_from_json(platforms)["rows"] == {"inserted": 0, "updated": 0, "unchanged": 2}
+
+    platform_id = session.execute(select(PlatformSchema.id).where(PlatformSchema.name == "Alpha")).scalar_one()
+    plans = seed_file(tmp_path, "plans.json", [plan("J01", 10, platform_id), plan("J02", 12, platform_id)])
+    assert work_plan_to_db_from_json(plans)["rows"]["inserted"] == 2
+    assert work_plan_to_db_from_json(plans)["rows"] == {"inserted": 0, "updated": 0, "unchanged": 2}
+    assert len(session.execute(select(WorkPlanSchema)).scalars().all()) == 2
+
+
+def test_seed_updates_a_plan_created_by_the_api(tmp_path, session):
+    platform = PlatformSchema(id="P1", name="Alpha", sku="A1", uph=100)
+    session.add(platform)
+    created = WorkPlanSchema(id="API-PLAN", **plan("J01", 8, "P1"))
+    WorkPlanDAO(session).query_create_record(created)
+    session.commit()
+
+    result = work_plan_to_db_from_json(seed_file(tmp_path, "plans.json", [plan("J01", 11, "P1")]))
+
+    assert result["rows"] == {"inserted": 0, "updated": 1, "unchanged": 0}
+    plans = session.execute(select(WorkPlanSchema)).scalars().all()
+    assert [(row.id, row.planned_hours) for row in plans] == [("API-PLAN", 11)]
+
+
+def test_migration_merges_seed_duplicates(engine):
+    with engine.begin() as connection:
+        # Database of schema 5: natural keys not unique yet
+        connection.exec_driver_sql("DROP INDEX ix_platforms_name_sku")
+        connection.exec_driver_sql("DROP INDEX ix_work_plans_factory_date_line")
+        connection.exec_driver_sql("CREATE INDEX ix_work_plans_factory_date_line ON work_plans (factory, date, line)")
+        connection.exec_driver_sql("PRAGMA user_version = 5")
+        connection.execute(PlatformSchema.__table__.insert(), [
+            {"id": "P-OLD", "name": "Alpha", "sku": "A1", "uph": 100},
+            {"id": "P-NEW", "name": "Alpha", "sku": "A1", "uph": 100},
+        ])
+        connection.execute(WorkPlanSchema.__table__.insert(), [
+            {"id": "W-OLD", **plan("J01", 8, "P-OLD")},
+            {"id": "W-NEW", **plan("J01", 9, "P-NEW")},
+            {"id": "W-J02", **plan("J02", 9, "P-NEW")},
+        ])
+
+    apply_migrations(engine)
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION
+        assert connection.execute(select(PlatformSchema.id)).scalars().all() == ["P-OLD"]
+        assert connection.execute(
+            select(WorkPlanSchema.id, WorkPlanSchema.platform_id).order_by(WorkPlanSchema.line)
+        ).all() == [("W-OLD", "P-OLD"), ("W-J02", "P-OLD")]
+        unique = set(connection.execute(text("SELECT name FROM sqlite_master WHERE sql LIKE 'CREATE UNIQUE%'")).scalars())
+        assert {"ix_platforms_name_sku", "ix_work_plans_factory_date_line"} <= unique
@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.db.util import UpsertResult
+from core.features.hour_by_hour import hbh_service
+from core.features.hour_by_hour.hbh_service import HbhService, sync_ranges, SYNC_MAX_DAYS
+
+
+class FakeDAO:
+    """HbhDAO stand-in keeping the watermarks and the stored rows in memory."""
+
+    def __init__(self, watermarks: dict, scan_lines: set = frozenset()):
+        self.watermarks = dict(watermarks)
+        self.scan_lines = set(scan_lines)
+        self.rows = []
+
+    def query_get_watermarks(self, factory):
+        return dict(self.watermarks)
+
+    def query_get_scan_lines(self, factory):
+        return self.scan_lines
+
+    async def query_sync_async(self, rows, factory, lines, synced_until):
+        self.rows.extend(rows)
+        for line in lines:
+            self.watermarks[line] = max(self.watermarks.get(line) or synced_until, synced_until)
+        return UpsertResult(inserted=len(rows))
+
+
+class FakeMES:
+    """get_transactions stand-in: one SMT_IN item per requested hour and line; `broken` days miss packing."""
+
+    def __init__(self, lines=("J01",), broken=()):
+        self.lines = lines
+        self.broken = set(broken)
+        self.requests = []
+
+    async def __call__(self, day, start_hour, end_hour, timeout=None, factory="A6"):
+        self.requests.append((day, int(start_hour), int(end_hour)))
+        items = [{"LINE": f"L-{line}", "HOURS": f"{hour:02d}:00", "QTY": 1}
+                 for hour in range(int(start_hour), int(end_hour) + 1) for line in self.lines]
+        data = {"smt_in": items, "smt_out": [], "packing": []}
+        if day in self.broken:
+            del data["packing"]
+        return data
+
+
+@pytest.fixture
+def mes(monkeypatch):
+    mes = FakeMES()
+    monkeypatch.setattr(hbh_service, "get_transactions", mes)
+    return mes
+
+
+def sync(dao, now):
+    return asyncio.run(HbhService(dao).sync_hours(now))
+
+
+def test_sync_ranges_one_request_per_day():
+    assert sync_ranges(datetime(2024, 1, 1, 22), datetime(2024, 1, 3, 1)) == [
+        ("2024-01-01", 22, 23), ("2024-01-02", 0, 23), ("2024-01-03", 0, 0)]
+    assert sync_ranges(datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 10)) == [("2024-01-01", 9, 9)]
+    assert sync_ranges(datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 9)) == []
+
+
+def test_sync_fresh_line_starts_today(mes):
+    dao = FakeDAO({"J01": None})
+    report = sync(dao, datetime(2024, 3, 10, 9, 20))
+
+    assert mes.requests == [("20240310", 0, 9)]
+    assert report["synced_until"] == "2024-03-10T09:00:00"
+    assert dao.watermarks["J01"] == datetime(2024, 3, 10, 9)
+    assert len(dao.rows) == 10
+
+
+def test_sync_settle_boundary(mes):
+    dao = FakeDAO({"J01": datetime(2024, 3, 10, 9)})
+
+    # 10:05, inside the settle window: hour 09 is fetched again and the watermark stays
+    report = sync(dao, datetime(2024, 3, 10, 10, 5))
+    assert mes.requests == [("20240310", 9, 10)]
+    assert report["synced_until"] == "2024-03-10T09:00:00"
+    assert dao.watermarks["J01"] == datetime(2024, 3, 10, 9)
+
+    # 10:15, hour 09 settled: the watermark moves to 10
+    report = sync(dao, datetime(2024, 3, 10, 10, 15))
+    assert mes.requests[-1] == ("20240310", 9, 10)
+    assert report["synced_until"] == "2024-03-10T10:00:00"
+    assert dao.watermarks["J01"] == datetime(2024, 3, 10, 10)
+
+
+def test_sync_catch_up_is_bounded(mes):
+    dao = FakeDAO({"J01": datetime(2024, 3, 1, 6)})
+    now = datetime(2024, 3, 10, 9, 20)
+
+    report = sync(dao, now)
+    assert len(mes.requests) == SYNC_MAX_DAYS
+    assert mes.requests[0] == ("20240301", 6, 23)
+    assert report["synced_until"] == "2024-03-04T00:00:00"
+
+    while dao.watermarks["J01"] < datetime(2024, 3, 10, 9):
+        sync(dao, now)
+    assert dao.watermarks["J01"] == datetime(2024, 3, 10, 9)
+
+
+def test_sync_incomplete_day_stops_the_watermark(mes):
+    mes.broken = {"20240309"}
+    dao = FakeDAO({"J01": datetime(2024, 3, 8, 20)})
+
+    report = sync(dao, datetime(2024, 3, 10, 9, 20))
+    assert report["synced_until"] == "2024-03-09T00:00:00"
+    assert {row["date"] for row in dao.rows} == {"2024-03-08"}
+
+    # The incomplete day is the first range now: nothing stored, fetched again next run
+    assert sync(dao, datetime(2024, 3, 10, 9, 20)) is None
+    assert dao.watermarks["J01"] == datetime(2024, 3, 9)
+
+
+def test_sync_empty_complete_response_is_not_a_failure(mes):
+    mes.lines = ()
+    dao = FakeDAO({"J01": datetime(2024, 3, 10, 10)})
+
+    # Settle window of a quiet line: no rows, no progress, but the MES answered
+    report = sync(dao, datetime(2024, 3, 10, 10, 5))
+    assert report is not None
+    assert report["synced_until"] == "2024-03-10T10:00:00"
+
+    report = sync(dao, datetime(2024, 3, 10, 11, 20))
+    assert report["lines_advanced"] == 1
+    assert dao.watermarks["J01"] == datetime(2024, 3, 10, 11)
+
+
+def test_sync_skips_scan_lines(mes):
+    mes.lines = ("J01", "J02")
+    dao = FakeDAO({"J01": None, "J02": None}, scan_lines={"J02"})
+
+    sync(dao, datetime(2024, 3, 10, 9, 20))
+    assert {row["line"] for row in dao.rows} == {"J01"}